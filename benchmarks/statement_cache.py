@@ -0,0 +1,205 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Counts SQL statement compilations for a mix of read requests similar to the
+requests of gating services.
+
+Usage:
+
+    python benchmarks/statement_cache.py [DATABASE_URI]
+
+By default, an in-memory SQLite database is used. A PostgreSQL database URI
+can be given instead, in which case the tables are created in a separate
+schema (``waiverdb_benchmark``, dropped at the end).
+
+For each endpoint, the output shows how many executed statements were
+compiled (missing in the SQLAlchemy compiled statement cache) and how many
+distinct SQL strings were sent to the database (each of which needs a
+separate prepared statement with drivers which prepare statements).
+"""
+
+import argparse
+import collections
+import json
+import random
+import time
+
+from flask import request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.engine.default import CACHE_HIT
+
+from waiverdb.app import create_app
+from waiverdb.config import TestingConfig
+from waiverdb.models import CurrentWaiver, Waiver, db
+
+SCHEMA = 'waiverdb_benchmark'
+
+PACKAGES = 200
+TESTCASES = [f'dist.test{i}' for i in range(20)]
+SCENARIOS = ['x86_64', 'aarch64']
+
+
+def nvr(i):
+    return f'package{i}-1.0-1.fc{30 + i % 12}'
+
+
+def populate(count):
+    rnd = random.Random(0)
+    for i in range(count):
+        package = rnd.randrange(PACKAGES)
+        db.session.add(Waiver(
+            subject_type='koji_build',
+            subject_identifier=nvr(package),
+            testcase=rnd.choice(TESTCASES),
+            username=f'user{i % 10}',
+            product_version=f'fedora-{30 + package % 12}',
+            waived=i % 7 != 0,
+            comment=f'Waived flaky test {i}',
+            scenario=rnd.choice([None, *SCENARIOS]),
+        ))
+    db.session.commit()
+    with db.engine.begin() as connection:
+        CurrentWaiver.rebuild(connection)
+
+
+def result_key(rnd):
+    """
+    Returns the subject, test case and sometimes scenario of a random result.
+    """
+    package = rnd.randrange(PACKAGES)
+    key = {
+        'subject_type': 'koji_build',
+        'subject_identifier': nvr(package),
+        'testcase': rnd.choice(TESTCASES),
+    }
+    if rnd.random() < 0.3:
+        key['scenario'] = rnd.choice(SCENARIOS)
+    return key, package
+
+
+def requests(rnd, count):
+    """
+    Yields (method, URL, JSON body) of random requests.
+    """
+    for _ in range(count):
+        results = [result_key(rnd) for _ in range(rnd.randint(1, 40))]
+        kind = rnd.random()
+        if kind < 0.4:
+            filters = [key for key, _ in results]
+            if rnd.random() < 0.2:
+                filters.append({'username': f'user{rnd.randrange(10)}'})
+            yield 'POST', '/waivers/+filtered', {'filters': filters}
+        elif kind < 0.7:
+            keys = [
+                {'scenario': None, **key, 'product_version': f'fedora-{30 + package % 12}'}
+                for key, package in results
+            ]
+            yield 'POST', '/waivers/+waived', {'keys': keys}
+        elif kind < 0.8:
+            body = {'results': [
+                {'subject': {'type': key['subject_type'], 'item': key['subject_identifier']},
+                 'testcase': key['testcase']}
+                for key, _ in results
+            ]}
+            yield 'POST', '/waivers/+by-subjects-and-testcases', body
+        elif kind < 0.9:
+            ids = rnd.sample(range(1, 1000), rnd.randint(1, 50))
+            yield 'POST', '/waivers/+by-ids', {'ids': ids}
+        else:
+            params = [
+                f'testcase={rnd.choice(TESTCASES)}',
+                f'product_version=fedora-{rnd.randint(30, 41)}',
+                f'username=user{rnd.randrange(10)}',
+            ]
+            query = '&'.join(rnd.sample(params, rnd.randint(0, 2)))
+            yield 'GET', f'/waivers/?page={rnd.randint(1, 3)}&{query}', None
+
+
+def run(app, count, seed):
+    """
+    Sends the requests and returns statistics per endpoint.
+    """
+    stats = collections.defaultdict(lambda: {
+        'requests': 0, 'statements': 0, 'compiled': 0, 'sql': set()})
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context.compiled is None:
+            return
+        endpoint = stats[request.path.removeprefix('/api/v1.0')]
+        endpoint['statements'] += 1
+        endpoint['sql'].add(statement)
+        if context.cache_hit is not CACHE_HIT:
+            endpoint['compiled'] += 1
+
+    client = app.test_client()
+    event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+    start = time.perf_counter()
+    try:
+        for method, url, body in requests(random.Random(seed), count):
+            if method == 'GET':
+                response = client.get('/api/v1.0' + url)
+            else:
+                response = client.post('/api/v1.0' + url, data=json.dumps(body),
+                                       content_type='application/json')
+            assert response.status_code == 200, response.data
+            stats[url.split('?')[0]]['requests'] += 1
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', after_cursor_execute)
+    return stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('database_uri', nargs='?', default='sqlite://',
+                        help='database URI (default: in-memory SQLite database)')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='number of requests (default: %(default)s)')
+    parser.add_argument('--waivers', type=int, default=1000,
+                        help='number of generated waivers (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed for generating the requests (default: %(default)s)')
+    args = parser.parse_args()
+
+    url = make_url(args.database_uri)
+    postgresql = url.get_backend_name() == 'postgresql'
+    if postgresql:
+        with create_engine(url).begin() as connection:
+            connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            connection.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+        url = url.update_query_dict({'options': f'-csearch_path={SCHEMA}'})
+
+    class BenchmarkConfig(TestingConfig):
+        DATABASE_URI = url.render_as_string(hide_password=False)
+        MESSAGE_BUS_PUBLISH = False
+        TRAP_BAD_REQUEST_ERRORS = False
+
+    app = create_app(BenchmarkConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            populate(args.waivers)
+            db.session.remove()
+            stats, seconds = run(app, args.requests, args.seed)
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        if postgresql:
+            with create_engine(make_url(args.database_uri)).begin() as connection:
+                connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+
+    print(f'{"Endpoint":<40} {"requests":>9} {"statements":>11} {"compiled":>9} '
+          f'{"distinct SQL":>13}')
+    total = collections.Counter()
+    for endpoint, endpoint_stats in sorted(stats.items()):
+        print(f'{endpoint:<40} {endpoint_stats["requests"]:>9} '
+              f'{endpoint_stats["statements"]:>11} {endpoint_stats["compiled"]:>9} '
+              f'{len(endpoint_stats["sql"]):>13}')
+        total.update({key: len(value) if key == 'sql' else value
+                      for key, value in endpoint_stats.items()})
+    print(f'{"Total":<40} {total["requests"]:>9} {total["statements"]:>11} '
+          f'{total["compiled"]:>9} {total["sql"]:>13}')
+    print(f'\n{args.requests} requests in {seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
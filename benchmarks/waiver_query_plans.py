@@ -0,0 +1,221 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Shows PostgreSQL query plans of the waiver listing queries before and after
+the migration c5e7a3f19d62, which adds indexes for them.
+
+Usage:
+
+    python benchmarks/waiver_query_plans.py postgresql+psycopg2://postgres@localhost/waiverdb
+
+The waiver table is created from migrations in a separate schema
+(``waiverdb_benchmark``, dropped at the end), filled with generated waivers,
+and the SQL statements issued by the API for each request are run with
+EXPLAIN ANALYZE, first without and then with the indexes.
+"""
+
+import argparse
+import datetime
+import json
+import time
+from urllib.parse import urlsplit
+
+from flask_migrate import upgrade
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+from waiverdb.app import create_app
+from waiverdb.config import TestingConfig
+from waiverdb.models import CurrentWaiver, db
+
+BEFORE_REVISION = '9a6d2f4c1e83'
+SCHEMA = 'waiverdb_benchmark'
+
+POPULATE = """
+INSERT INTO waiver (subject_type, subject_identifier, testcase, scenario, username,
+                    proxied_by, product_version, waived, comment, timestamp)
+SELECT
+    CASE WHEN i % 5 = 0 THEN 'compose' ELSE 'koji_build' END,
+    'package' || (i % :subjects) || '-1.0-1.fc' || (30 + i % 12),
+    'test.case.' || (i % 500),
+    CASE WHEN i % 3 = 0 THEN 'x86_64' END,
+    'user' || (i % 200),
+    CASE WHEN i % 20 = 0 THEN 'bodhi' END,
+    'fedora-' || (30 + i % 12),
+    i % 7 != 0,
+    'Waived flaky test ' || i,
+    localtimestamp - (:count - i) * interval '1 minute'
+FROM generate_series(1, :count) AS i
+"""
+
+
+def requests(count):
+    """
+    Returns (description, method, URL, JSON body) of the benchmarked requests.
+    """
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    since = (now - datetime.timedelta(days=1)).isoformat()
+    subjects = count // 5
+    keys = [
+        {
+            'subject_type': 'koji_build',
+            'subject_identifier': f'package{i}-1.0-1.fc{30 + i % 12}',
+            'testcase': f'test.case.{i % 500}',
+            'scenario': 'x86_64' if i % 3 == 0 else None,
+            'product_version': f'fedora-{30 + i % 12}',
+        }
+        for i in range(1, subjects, subjects // 100)
+    ]
+    filters = [
+        {key: value for key, value in key.items() if key != 'product_version'}
+        for key in keys
+    ]
+    return [
+        ('Most recent waivers', 'GET', '/waivers/?limit=20', None),
+        ('Most recent waivers, with obsolete ones', 'GET',
+         '/waivers/?limit=20&include_obsolete=1', None),
+        ('Second page with a cursor', 'GET', '/waivers/?limit=20&cursor=', None),
+        ('Filtered by username', 'GET',
+         '/waivers/?limit=20&username=user7&include_obsolete=1', None),
+        ('Filtered by product version', 'GET',
+         '/waivers/?limit=20&product_version=fedora-33', None),
+        ('Filtered by time range', 'GET',
+         f'/waivers/?limit=20&include_obsolete=1&since={since}', None),
+        ('Filtered by proxied_by and time range', 'POST', '/waivers/+filtered',
+         {'filters': [{'proxied_by': 'bodhi', 'since': since}], 'include_obsolete': True}),
+        ('100 subjects and test cases', 'POST', '/waivers/+filtered',
+         {'filters': filters, 'fields': ['id', 'waived', 'subject', 'testcase']}),
+        ('Waived state of 100 results', 'POST', '/waivers/+waived', {'keys': keys}),
+    ]
+
+
+def capture_statements(client, method, url, body):
+    """
+    Sends the request and returns the SQL statements reading waivers, except
+    for the one computing the ETag.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statement = statement.strip()
+        if (statement.startswith(('SELECT', 'WITH'))
+                and ' waiver' in statement
+                and not statement.startswith('SELECT max(waiver.id)')):
+            statements.append((statement, parameters))
+
+    if url.endswith('cursor='):
+        # Follow the link to the next page
+        next_url = urlsplit(client.get('/api/v1.0' + url).json['next'])
+        url = next_url.path.removeprefix('/api/v1.0') + '?' + next_url.query
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        if method == 'GET':
+            response = client.get('/api/v1.0' + url)
+        else:
+            response = client.post('/api/v1.0' + url, data=json.dumps(body),
+                                   content_type='application/json')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, response.data
+    return statements
+
+
+def explain(connection, statement, parameters, repeat=5):
+    """
+    Returns the plan (text lines) and the best execution time in
+    milliseconds.
+    """
+    # Warm up caches
+    connection.exec_driver_sql(statement, parameters).all()
+    plans = []
+    for _ in range(repeat):
+        plan = connection.exec_driver_sql(
+            'EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters).scalars().all()
+        plans.append((float(plan[-1].split(':')[1].split()[0]), plan))
+    milliseconds, plan = min(plans)
+    return plan, milliseconds
+
+
+def run(client, count):
+    """
+    Returns plans and execution times for all requests.
+    """
+    results = []
+    for description, method, url, body in requests(count):
+        statements = capture_statements(client, method, url, body)
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                kind = 'count' if statement.startswith('SELECT count(') else 'rows'
+                plan, milliseconds = explain(connection, statement, parameters)
+                results.append((f'{description} ({kind})', plan, milliseconds))
+    return results
+
+
+def vacuum(engine):
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('VACUUM ANALYZE'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('database_uri', help='PostgreSQL database URI')
+    parser.add_argument('--waivers', type=int, default=1000000,
+                        help='number of generated waivers (default: %(default)s)')
+    args = parser.parse_args()
+
+    url = make_url(args.database_uri)
+    if url.get_backend_name() != 'postgresql':
+        parser.error('Only PostgreSQL databases are supported')
+
+    with create_engine(url).begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+
+    class BenchmarkConfig(TestingConfig):
+        DATABASE_URI = url.update_query_dict(
+            {'options': f'-csearch_path={SCHEMA}'}).render_as_string(hide_password=False)
+        TRAP_BAD_REQUEST_ERRORS = False
+
+    app = create_app(BenchmarkConfig)
+    client = app.test_client()
+    try:
+        with app.app_context():
+            upgrade(revision=BEFORE_REVISION)
+            start = time.perf_counter()
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text(POPULATE), {'count': args.waivers, 'subjects': args.waivers // 5})
+                CurrentWaiver.rebuild(connection)
+            vacuum(db.engine)
+            print(f'Generated {args.waivers} waivers in {time.perf_counter() - start:.1f} s')
+
+            before = run(client, args.waivers)
+            db.session.remove()
+            start = time.perf_counter()
+            upgrade()
+            vacuum(db.engine)
+            print(f'Migrated in {time.perf_counter() - start:.1f} s')
+            after = run(client, args.waivers)
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        with create_engine(url).begin() as connection:
+            connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+
+    for (description, plan_before, _), (_, plan_after, _) in zip(before, after):
+        print()
+        print('=' * 78)
+        print(description)
+        print('-' * 36, 'before', '-' * 34)
+        print('\n'.join(plan_before))
+        print('-' * 36, 'after', '-' * 35)
+        print('\n'.join(plan_after))
+
+    print()
+    print(f'{"Statement":<50} {"before (ms)":>12} {"after (ms)":>12}')
+    for (description, _, ms_before), (_, _, ms_after) in zip(before, after):
+        print(f'{description:<50} {ms_before:>12.2f} {ms_after:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,15 +6,21 @@ import json
 import pytest
 from flask import request
 from requests import ConnectionError, HTTPError
+from sqlalchemy.dialects import postgresql
 from mock import patch, ANY, Mock
 from stomp.exception import StompException
 from werkzeug.exceptions import Forbidden, Unauthorized
 
 from .utils import create_waiver
 from waiverdb import __version__
+from waiverdb.cache import Cache
+from waiverdb.fields import waiver_fields
 from waiverdb.models import Waiver
 from waiverdb.models.waivers import utcnow_naive
-from waiverdb.api_v1 import get_resultsdb_result, _authorization_warning
+from waiverdb.models.requests import WaiverFilter
+from waiverdb.api_v1 import (
+    get_resultsdb_result, _authorization_warning, _filter_out_obsolete_waivers, _select_fields
+)
 
 
 @pytest.fixture
@@ -370,6 +376,193 @@ def test_get_waiver(client, session):
     assert res_data['scenario'] is None
 
 
+def test_get_waiver_not_modified(client, session):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='testcase1', username='foo',
+                           product_version='foo-1', comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/%s' % waiver.id)
+    assert r.status_code == 200
+    assert r.headers['ETag']
+
+    r = client.get('/api/v1.0/waivers/%s' % waiver.id,
+                   headers={'If-None-Match': r.headers['ETag']})
+    assert r.status_code == 304
+    assert r.get_data() == b''
+
+
+def test_get_waivers_with_fields(client, session):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='testcase1', username='foo',
+                           product_version='foo-1', comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/?fields=waived,id,subject')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert res_data['data'] == [{
+        'id': waiver.id,
+        'subject': {'type': 'koji_build', 'item': 'glibc-2.26-27.fc27'},
+        'waived': True,
+    }]
+
+    r = client.get('/api/v1.0/waivers/?fields=id&cursor=&limit=1')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert res_data['data'] == [{'id': waiver.id}]
+
+
+def test_get_waivers_with_testcase_pattern(client, session):
+    waivers = {
+        testcase: create_waiver(session, subject_type='koji_build',
+                                subject_identifier='glibc-2.26-27.fc27',
+                                testcase=testcase, username='foo',
+                                product_version='foo-1', comment='bla bla bla')
+        for testcase in [
+            'kernel-qe.a', 'kernel-qe.b.c', 'Kernel-qe.d', 'kernel_qe.e', 'dist.rpmlint',
+        ]
+    }
+
+    def get_testcases(pattern):
+        r = client.get('/api/v1.0/waivers/', query_string={'testcase_pattern': pattern})
+        assert r.status_code == 200
+        return sorted(w['testcase'] for w in json.loads(r.get_data(as_text=True))['data'])
+
+    assert get_testcases('kernel-qe.*') == ['kernel-qe.a', 'kernel-qe.b.c']
+    assert get_testcases('kernel?qe.?') == ['kernel-qe.a', 'kernel_qe.e']
+    assert get_testcases('[!k]*') == ['Kernel-qe.d', 'dist.rpmlint']
+    assert get_testcases('*') == sorted(waivers)
+
+    r = client.get('/api/v1.0/waivers/?testcase_pattern=[z-a]')
+    assert r.status_code == 400
+    assert 'testcase_pattern' in json.loads(r.get_data(as_text=True))['message']
+
+
+def test_testcase_pattern_on_postgresql():
+    def compile(pattern):
+        clause = Waiver.match_testcase_pattern(pattern, 'postgresql')
+        compiled = clause.compile(dialect=postgresql.dialect())
+        return str(compiled), list(compiled.params.values())
+
+    sql, params = compile('kernel-qe_*.?')
+    assert ' LIKE ' in sql
+    assert params == ['kernel-qe\\_%._']
+
+    sql, params = compile('kernel-qe.[ab]*')
+    assert ' ~ ' in sql
+    assert params == ['(?s)^kernel\\-qe\\.[ab].*\\Z']
+
+
+def test_get_waivers_with_comment_search(client, session):
+    comments = ['Known issue, see RHBZ#1234567', 'flaky network', 'Network is FLAKY', None]
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='glibc-2.26-%d.fc27' % i,
+                      testcase='testcase1', username='foo',
+                      product_version='foo-1', comment=comment)
+        for i, comment in enumerate(comments)
+    ]
+
+    def search(q, **params):
+        r = client.get('/api/v1.0/waivers/', query_string={'q': q, **params})
+        assert r.status_code == 200
+        return [w['id'] for w in json.loads(r.get_data(as_text=True))['data']]
+
+    assert search('rhbz#1234567') == [waivers[0].id]
+    assert search('flaky network') == [waivers[2].id, waivers[1].id]
+    assert search('network', cursor='') == [waivers[2].id, waivers[1].id]
+    assert search('100%') == []
+
+
+def test_comment_search_on_postgresql():
+    dialect = postgresql.dialect()
+    clause = Waiver.match_comment('"kernel panic" -flaky', 'postgresql')
+    assert str(clause.compile(dialect=dialect)) == (
+        "waiver.comment_search @@ websearch_to_tsquery('english', %(websearch_to_tsquery_1)s)")
+    rank = Waiver.comment_rank('kernel', 'postgresql')
+    assert str(rank.compile(dialect=dialect)).startswith('ts_rank(waiver.comment_search, ')
+    assert Waiver.comment_rank('kernel', 'sqlite') is None
+
+
+def test_get_waivers_with_unknown_fields(client, session):
+    r = client.get('/api/v1.0/waivers/?fields=id,secret')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 400
+    assert res_data['message'] == {'fields': 'Unknown fields: secret'}
+
+
+def test_get_waivers_with_empty_fields(client, session):
+    create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo', product_version='foo-1')
+    r = client.get('/api/v1.0/waivers/?fields=')
+    assert r.status_code == 200
+    assert set(r.json['data'][0]) == set(waiver_fields)
+
+    r = client.get('/api/v1.0/waivers/?fields=id,')
+    assert r.status_code == 200
+    assert r.json['data'] == [{'id': r.json['data'][0]['id']}]
+
+
+def test_select_fields_loads_only_needed_columns(session):
+    query, fields = _select_fields(Waiver.query, ['subject', 'waived'])
+    assert list(fields) == ['subject', 'waived']
+    sql = str(query.statement)
+    assert 'waiver.subject_identifier' in sql
+    assert 'waiver.waived' in sql
+    assert 'waiver.comment' not in sql
+
+
+def test_get_waivers_not_modified(client, session):
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo',
+                  product_version='foo-1', comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1')
+    assert r.status_code == 200
+    tag = r.headers['ETag']
+
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1', headers={'If-None-Match': tag})
+    assert r.status_code == 304
+    assert r.headers['ETag'] == tag
+
+    # Different query
+    r = client.get('/api/v1.0/waivers/?testcase=testcase2', headers={'If-None-Match': tag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != tag
+
+    # New waiver
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo',
+                  product_version='foo-1', comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1', headers={'If-None-Match': tag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != tag
+
+
+def test_get_waivers_not_modified_with_waiver_committed_late(client, session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='glibc-2.26-27.fc27',
+                      testcase='testcase1', username='foo', product_version='foo-1')
+        for _ in range(2)
+    ]
+    session.commit()
+    # A waiver with a lower ID committed after the most recent one
+    late_id = waivers[0].id
+    session.delete(waivers[0])
+    session.commit()
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1')
+    tag = r.headers['ETag']
+
+    late = Waiver('koji_build', 'glibc-2.26-27.fc27', 'testcase1', 'bar', 'foo-1')
+    late.id = late_id
+    session.add(late)
+    session.commit()
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1', headers={'If-None-Match': tag})
+    assert r.status_code == 200
+    assert late_id in [w['id'] for w in r.json['data']]
+
+
 def test_get_waiver_by_scenario(client, session):
     scenario_name = 'scenario19'
     # create a new waiver
@@ -443,6 +636,161 @@ def test_pagination_waivers(client, session):
     assert '/waivers/?page=3' in res_data['last']
 
 
+def test_pagination_waivers_without_count(client, session):
+    for i in range(0, 30):
+        create_waiver(session, subject_type='koji_build', subject_identifier="%d" % i,
+                      testcase="case %d" % i, username='foo %d' % i,
+                      product_version='foo-%d' % i, comment='bla bla bla')
+    with patch('waiverdb.utils.count_query', return_value=None) as mocked_count:
+        r = client.get('/api/v1.0/waivers/?page=2&count=none')
+        res_data = json.loads(r.get_data(as_text=True))
+        assert r.status_code == 200
+        assert len(res_data['data']) == 10
+        assert '/waivers/?page=3&count=none' in res_data['next']
+        assert res_data['last'] is None
+        mocked_count.assert_called_once()
+
+        # The total is known on the last page without counting
+        r = client.get('/api/v1.0/waivers/?page=3&count=none')
+        res_data = json.loads(r.get_data(as_text=True))
+        assert r.status_code == 200
+        assert res_data['next'] is None
+        assert '/waivers/?page=3&count=none' in res_data['last']
+        mocked_count.assert_called_once()
+
+
+def test_pagination_waivers_with_estimated_count(app, client, session):
+    app.count_cache.clear()
+    for i in range(0, 30):
+        create_waiver(session, subject_type='koji_build', subject_identifier="%d" % i,
+                      testcase="case %d" % i, username='foo %d' % i,
+                      product_version='foo-%d' % i, comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/?count=estimate')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert '/waivers/?page=3&count=estimate' in res_data['last']
+
+    for i in range(30, 40):
+        create_waiver(session, subject_type='koji_build', subject_identifier="%d" % i,
+                      testcase="case %d" % i, username='foo %d' % i,
+                      product_version='foo-%d' % i, comment='bla bla bla')
+    # The cached count is reused
+    r = client.get('/api/v1.0/waivers/?count=estimate')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert '/waivers/?page=3&count=estimate' in res_data['last']
+
+    r = client.get('/api/v1.0/waivers/')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert '/waivers/?page=4' in res_data['last']
+    app.count_cache.clear()
+
+
+def test_pagination_waivers_with_large_limit(client, session):
+    for i in range(0, 160):
+        create_waiver(session, subject_type='koji_build', subject_identifier="%d" % i,
+                      testcase="case %d" % i, username='foo %d' % i,
+                      product_version='foo-%d' % i, comment='bla bla bla')
+    r = client.get('/api/v1.0/waivers/?limit=150')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert len(res_data['data']) == 150
+    assert '/waivers/?page=2&limit=150' in res_data['next']
+    assert '/waivers/?page=2&limit=150' in res_data['last']
+
+
+def test_cursor_pagination_waivers(client, session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build', subject_identifier="%d" % i,
+                      testcase="case %d" % i, username='foo %d' % i,
+                      product_version='foo-%d' % i, comment='bla bla bla')
+        for i in range(0, 25)
+    ]
+    seen = []
+    url = '/api/v1.0/waivers/?cursor=&limit=10'
+    while url:
+        r = client.get(url)
+        res_data = json.loads(r.get_data(as_text=True))
+        assert r.status_code == 200
+        assert 'last' not in res_data
+        assert '/waivers/?cursor=&' in res_data['first']
+        seen.extend(w['id'] for w in res_data['data'])
+        url = res_data['next']
+        if url:
+            assert 'limit=10' in url
+            assert 'page=' not in url
+    assert len(seen) == 25
+    assert sorted(seen) == sorted(w.id for w in waivers)
+
+
+def test_cursor_pagination_with_invalid_cursor(client, session):
+    r = client.get('/api/v1.0/waivers/?cursor=bad')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 400
+    assert res_data['message']['cursor'] == 'Invalid pagination cursor'
+
+
+@pytest.mark.parametrize('obsolete_waivers_filter', ['subquery', 'projection'])
+def test_obsolete_waivers_are_excluded(app, monkeypatch, client, session,
+                                       obsolete_waivers_filter):
+    monkeypatch.setitem(app.config, 'OBSOLETE_WAIVERS_FILTER', obsolete_waivers_filter)
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo',
+                  product_version='foo-1')
+    new_waiver = create_waiver(session, subject_type='koji_build',
+                               subject_identifier='glibc-2.26-27.fc27',
+                               testcase='testcase1', username='foo',
+                               product_version='foo-1', waived=False)
+    r = client.get('/api/v1.0/waivers/')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert [w['id'] for w in res_data['data']] == [new_waiver.id]
+
+    filters = [{'subject_type': 'koji_build', 'subject_identifier': 'glibc-2.26-27.fc27'}]
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': filters}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert [w['id'] for w in res_data['data']] == [new_waiver.id]
+
+
+def test_obsolete_waivers_are_excluded_with_subquery_and_filters(
+        app, monkeypatch, client, session):
+    monkeypatch.setitem(app.config, 'OBSOLETE_WAIVERS_FILTER', 'subquery')
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo',
+                  product_version='foo-1')
+    new_waiver = create_waiver(session, subject_type='koji_build',
+                               subject_identifier='glibc-2.26-27.fc27',
+                               testcase='testcase1', username='foo',
+                               product_version='foo-1', waived=False)
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase2', username='foo',
+                  product_version='foo-1')
+    r = client.get('/api/v1.0/waivers/?testcase=testcase1&username=foo')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert [w['id'] for w in res_data['data']] == [new_waiver.id]
+
+
+def test_obsolete_waivers_subquery_on_postgresql(app, monkeypatch, session):
+    monkeypatch.setitem(app.config, 'OBSOLETE_WAIVERS_FILTER', 'subquery')
+    dialect = postgresql.dialect()
+    with patch.object(session, 'get_bind', return_value=Mock(dialect=dialect)):
+        query = _filter_out_obsolete_waivers(
+            Waiver.query, 'result', key_clauses=[Waiver.testcase == 'testcase1'])
+    sql = str(query.statement.compile(dialect=dialect))
+    assert (
+        'SELECT DISTINCT ON (waiver.subject_type, waiver.subject_identifier, '
+        'waiver.testcase, waiver.scenario) waiver.id'
+    ) in sql
+    assert 'WHERE waiver.testcase = %(testcase_1)s ORDER BY' in sql
+    assert 'waiver.scenario, waiver.id DESC' in sql
+
+
 def test_obsolete_waivers_are_excluded_by_default(client, session):
     create_waiver(session, subject_type='koji_build',
                   subject_identifier='glibc-2.26-27.fc27',
@@ -640,6 +988,22 @@ def test_filtering_waivers_by_since(client, session):
     assert len(res_data['data']) == 0
 
 
+def test_filtering_waivers_by_since_with_time_zone(client, session):
+    create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-27.fc27',
+                  testcase='testcase1', username='foo', product_version='foo-1')
+    now = utcnow_naive()
+    # One hour after now, but in a time zone two hours behind UTC
+    since = (now - timedelta(hours=1)).isoformat() + '-02:00'
+    r = client.get('/api/v1.0/waivers/', query_string={'since': since})
+    assert r.status_code == 200
+    assert json.loads(r.get_data(as_text=True))['data'] == []
+
+    since = (now - timedelta(hours=3)).isoformat() + '-02:00'
+    r = client.get('/api/v1.0/waivers/', query_string={'since': since})
+    assert r.status_code == 200
+    assert len(json.loads(r.get_data(as_text=True))['data']) == 1
+
+
 def test_filtering_waivers_by_malformed_since(client, session):
     now = utcnow_naive()
     r = client.get('/api/v1.0/waivers/?since=123')
@@ -747,6 +1111,357 @@ def test_filtering_scenario_waivers_with_post(client, session):
     assert all(w['subject_identifier'].startswith('python2-2.7.14-1') for w in res_data['data'])
 
 
+def test_filtering_waivers_with_post_mixed_and_duplicate_filters(client, session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python2-2.7.14-%d.fc27' % i,
+                      testcase='case %d' % i, username='person',
+                      product_version='fedora-27', comment='bla bla bla')
+        for i in range(4)
+    ]
+    filters = [
+        {'subject_type': 'koji_build', 'subject_identifier': 'python2-2.7.14-0.fc27',
+         'testcase': 'case 0'},
+        {'subject_type': 'koji_build', 'subject_identifier': 'python2-2.7.14-0.fc27',
+         'testcase': 'case 0'},
+        {'subject_type': 'koji_build', 'subject_identifier': 'python2-2.7.14-1.fc27',
+         'testcase': 'case 1'},
+        {'subject_type': 'koji_build', 'subject_identifier': 'python2-2.7.14-2.fc27'},
+        {'testcase': 'case 3', 'since': '2000-01-01T00:00:00'},
+        {'testcase': 'case 3', 'since': '2100-01-01T00:00:00'},
+    ]
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': filters}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert sorted(w['id'] for w in res_data['data']) == [w.id for w in waivers]
+
+
+def test_filtering_waivers_with_post_and_fields(client, session):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='python2-2.7.14-1.fc27',
+                           testcase='case', username='person',
+                           product_version='fedora-27', comment='bla bla bla')
+    data = {'filters': [{'testcase': 'case'}], 'fields': ['testcase', 'id']}
+    r = client.post('/api/v1.0/waivers/+filtered', data=json.dumps(data),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert res_data['data'] == [{'id': waiver.id, 'testcase': 'case'}]
+
+    data = {
+        'results': [{
+            'subject': {'type': 'koji_build', 'item': 'python2-2.7.14-1.fc27'},
+            'testcase': 'case',
+        }],
+        'fields': ['id'],
+    }
+    r = client.post('/api/v1.0/waivers/+by-subjects-and-testcases', data=json.dumps(data),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert res_data['data'] == [{'id': waiver.id}]
+
+
+def test_filtering_waivers_with_post_as_ndjson(client, session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python2-2.7.14-%d.fc27' % i,
+                      testcase='case', username='person',
+                      product_version='fedora-27', comment='bla bla bla')
+        for i in range(3)
+    ]
+    filters = [{'subject_type': 'koji_build', 'testcase': 'case'}]
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': filters}),
+                    content_type='application/json',
+                    headers={'Accept': 'application/x-ndjson'})
+    assert r.status_code == 200
+    assert r.mimetype == 'application/x-ndjson'
+    lines = r.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [w.id for w in reversed(waivers)]
+
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': filters}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert [json.loads(line) for line in lines] == res_data['data']
+
+
+@patch('waiverdb.api_v1.filtered_waivers_cache_miss_counter')
+@patch('waiverdb.api_v1.filtered_waivers_cache_hit_counter')
+def test_filtering_waivers_with_post_cached(hit_counter, miss_counter, app, client, session,
+                                            monkeypatch):
+    monkeypatch.setattr(app, 'filtered_waivers_cache', Cache(maxsize=8))
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='python2-2.7.14-1.fc27',
+                  testcase='case 1', username='person',
+                  product_version='fedora-27', comment='bla bla bla')
+    filters = [
+        {'subject_type': 'koji_build', 'testcase': 'case 1'},
+        {'subject_type': 'koji_build', 'testcase': 'case 2'},
+    ]
+
+    def post(filters):
+        r = client.post('/api/v1.0/waivers/+filtered',
+                        data=json.dumps({'filters': filters}),
+                        content_type='application/json')
+        assert r.status_code == 200
+        return [w['testcase'] for w in json.loads(r.get_data(as_text=True))['data']]
+
+    assert post(filters) == ['case 1']
+    assert miss_counter.inc.call_count == 1
+    # Same filters in different order are served from the cache
+    assert post(filters[::-1] + filters) == ['case 1']
+    assert hit_counter.inc.call_count == 1
+    # New waivers invalidate cached responses
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='python2-2.7.14-1.fc27',
+                  testcase='case 2', username='person',
+                  product_version='fedora-27', comment='bla bla bla')
+    assert post(filters) == ['case 2', 'case 1']
+    assert miss_counter.inc.call_count == 2
+
+
+def test_filtering_waivers_with_post_not_modified(client, session):
+    create_waiver(session, subject_type='koji_build',
+                  subject_identifier='python2-2.7.14-1.fc27',
+                  testcase='case', username='person',
+                  product_version='fedora-27', comment='bla bla bla')
+    data = json.dumps({'filters': [{'testcase': 'case'}]})
+    r = client.post('/api/v1.0/waivers/+filtered', data=data, content_type='application/json')
+    assert r.status_code == 200
+    tag = r.headers['ETag']
+
+    r = client.post('/api/v1.0/waivers/+filtered', data=data, content_type='application/json',
+                    headers={'If-None-Match': tag})
+    assert r.status_code == 304
+
+    r = client.post('/api/v1.0/waivers/+filtered', data=data, content_type='application/json',
+                    headers={'If-None-Match': tag, 'Accept': 'application/x-ndjson'})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != tag
+
+
+def test_get_waived(client, session):
+    def waiver(testcase, scenario=None, product_version='fedora-27', waived=True):
+        return create_waiver(session, subject_type='koji_build',
+                             subject_identifier='python2-2.7.14-1.fc27',
+                             testcase=testcase, username='person', scenario=scenario,
+                             product_version=product_version, waived=waived)
+
+    def key(testcase, scenario=None, product_version='fedora-27'):
+        return {'subject_type': 'koji_build',
+                'subject_identifier': 'python2-2.7.14-1.fc27',
+                'testcase': testcase, 'scenario': scenario,
+                'product_version': product_version}
+
+    waived = waiver('case1')
+    waiver('case2')
+    unwaived = waiver('case2', waived=False)
+    with_scenario = waiver('case3', scenario='x86_64')
+    waiver('case4', product_version='fedora-26')
+    waiver('case4', product_version='fedora-28')
+
+    keys = [
+        key('case2'),
+        key('case1'),
+        key('case3'),
+        key('case3', scenario='x86_64'),
+        key('case4', product_version='fedora-26'),
+        key('case1'),
+    ]
+    r = client.post('/api/v1.0/waivers/+waived',
+                    data=json.dumps({'keys': keys}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert res_data['data'] == [
+        {'id': unwaived.id, 'waived': False},
+        {'id': waived.id, 'waived': True},
+        {'id': None, 'waived': None},
+        {'id': with_scenario.id, 'waived': True},
+        # Obsoleted by waiver for a different product version
+        {'id': None, 'waived': None},
+        {'id': waived.id, 'waived': True},
+    ]
+
+
+def test_get_waived_with_missing_keys(client, session):
+    r = client.post('/api/v1.0/waivers/+waived',
+                    data=json.dumps({'keys': [{'testcase': 'case1'}]}),
+                    content_type='application/json')
+    assert r.status_code == 400
+
+
+def test_get_waivers_by_ids(client, session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python2-2.7.14-%d.fc27' % i,
+                      testcase='case', username='person', product_version='fedora-27')
+        for i in range(3)
+    ]
+    ids = [waivers[2].id, 9000, waivers[0].id, waivers[2].id]
+    r = client.post('/api/v1.0/waivers/+by-ids',
+                    data=json.dumps({'ids': ids}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert [w['id'] for w in res_data['data']] == [waivers[2].id, waivers[0].id]
+    assert res_data['data'][0]['subject_identifier'] == 'python2-2.7.14-2.fc27'
+    assert res_data['missing'] == [9000]
+
+    r = client.post('/api/v1.0/waivers/+by-ids',
+                    data=json.dumps({'ids': [waivers[1].id], 'fields': ['waived']}),
+                    content_type='application/json')
+    assert r.status_code == 200
+    assert r.json == {'data': [{'waived': True}], 'missing': []}
+
+
+def test_get_waivers_by_too_many_ids(app, client, session, monkeypatch):
+    monkeypatch.setitem(app.config, 'WAIVERS_BY_IDS_LIMIT', 2)
+    r = client.post('/api/v1.0/waivers/+by-ids',
+                    data=json.dumps({'ids': [1, 2, 3]}),
+                    content_type='application/json')
+    assert r.status_code == 400
+    assert r.json['message'] == {'ids': 'At most 2 IDs can be requested at once'}
+
+    r = client.post('/api/v1.0/waivers/+by-ids',
+                    data=json.dumps({'ids': []}),
+                    content_type='application/json')
+    assert r.status_code == 400
+
+
+def test_get_subject_waivers(client, session):
+    def waiver(testcase, subject_identifier='gzip-1.9-1.fc28', scenario=None,
+               product_version='fedora-28', waived=True):
+        return create_waiver(session, subject_type='koji_build',
+                             subject_identifier=subject_identifier, testcase=testcase,
+                             username='person', scenario=scenario,
+                             product_version=product_version, waived=waived)
+
+    waiver('dist.rpmlint')
+    waiver('dist.rpmlint', waived=False)
+    rpmlint_f27 = waiver('dist.rpmlint', product_version='fedora-27')
+    abicheck_x86_64 = waiver('dist.abicheck', scenario='x86_64')
+    abicheck = waiver('dist.abicheck')
+    waiver('dist.rpmlint', subject_identifier='gzip-1.9-2.fc28')
+
+    r = client.get('/api/v1.0/waivers/+subject/koji_build/gzip-1.9-1.fc28')
+    assert r.status_code == 200
+    assert r.json['subject_type'] == 'koji_build'
+    assert r.json['subject_identifier'] == 'gzip-1.9-1.fc28'
+    # The same waivers are current as for waivers/+waived
+    assert [w['id'] for w in r.json['data']] == [
+        abicheck.id, abicheck_x86_64.id, rpmlint_f27.id]
+    keys = [
+        {'subject_type': 'koji_build', 'subject_identifier': 'gzip-1.9-1.fc28',
+         'testcase': 'dist.rpmlint', 'scenario': None, 'product_version': product_version}
+        for product_version in ('fedora-27', 'fedora-28')
+    ]
+    r = client.post('/api/v1.0/waivers/+waived',
+                    data=json.dumps({'keys': keys}),
+                    content_type='application/json')
+    assert r.json['data'] == [{'id': rpmlint_f27.id, 'waived': True}, {'id': None, 'waived': None}]
+
+    r = client.get('/api/v1.0/waivers/+subject/koji_build/gzip-1.9-3.fc28')
+    assert r.status_code == 200
+    assert r.json['data'] == []
+
+
+def test_get_subject_waivers_cached(app, client, session, monkeypatch):
+    monkeypatch.setattr(app.subject_waivers_cache, 'maxsize', 10)
+
+    def waiver(subject_identifier):
+        waiver = create_waiver(session, subject_type='koji_build',
+                               subject_identifier=subject_identifier, testcase='dist.rpmlint',
+                               username='person', product_version='fedora-28')
+        session.commit()
+        return waiver
+
+    def get_waiver_ids():
+        r = client.get('/api/v1.0/waivers/+subject/koji_build/gzip-1.9-1.fc28')
+        assert r.status_code == 200
+        return [w['id'] for w in r.json['data']]
+
+    try:
+        first = waiver('gzip-1.9-1.fc28')
+        with patch('waiverdb.api_v1.subject_waivers_cache_hit_counter') as hit_counter:
+            assert get_waiver_ids() == [first.id]
+            assert get_waiver_ids() == [first.id]
+            # A waiver for a different subject keeps the cached response
+            waiver('gzip-1.9-2.fc28')
+            assert get_waiver_ids() == [first.id]
+            assert hit_counter.inc.call_count == 2
+
+        second = waiver('gzip-1.9-1.fc28')
+        assert get_waiver_ids() == [second.id]
+    finally:
+        app.subject_waivers_cache.invalidate()
+
+
+def test_filtering_waivers_with_post_with_testcase_pattern(client, session):
+    for subject_identifier, testcase in [
+        ('glibc-1', 'kernel-qe.a'),
+        ('glibc-1', 'dist.rpmlint'),
+        ('glibc-2', 'kernel-qe.b'),
+        ('glibc-2', 'dist.abicheck'),
+    ]:
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier=subject_identifier,
+                      testcase=testcase, username='person',
+                      product_version='fedora-27')
+    filters = [
+        {'subject_identifier': 'glibc-1', 'testcase_pattern': 'kernel-qe.*'},
+        {'testcase_pattern': 'dist.a*'},
+    ]
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': filters}),
+                    content_type='application/json')
+    res_data = json.loads(r.get_data(as_text=True))
+    assert r.status_code == 200
+    assert sorted(w['testcase'] for w in res_data['data']) == ['dist.abicheck', 'kernel-qe.a']
+
+
+def test_filtering_waivers_with_post_on_postgresql():
+    def sql(count):
+        filters = [
+            WaiverFilter(subject_type='koji_build', subject_identifier='glibc-%d' % i,
+                         testcase='case %d' % i)
+            for i in range(count)
+        ]
+        clause = Waiver.match_filters(filters, 'postgresql')
+        return str(clause.compile(dialect=postgresql.dialect()))
+
+    assert sql(1) == sql(100)
+    assert 'FROM unnest(' in sql(100)
+
+
+def test_filtering_waivers_sql_does_not_depend_on_filter_order():
+    filters = [
+        WaiverFilter(subject_type='koji_build', subject_identifier='glibc-1', testcase='case'),
+        WaiverFilter(testcase_pattern='dist.*'),
+        WaiverFilter(username='person', since='2017-03-16T13:40:05'),
+        WaiverFilter(subject_type='koji_build', subject_identifier='glibc-2', testcase='case',
+                     scenario='x86_64'),
+    ]
+
+    def sql(filters):
+        clause = Waiver.match_filters(filters, 'postgresql')
+        return str(clause.compile(dialect=postgresql.dialect()))
+
+    assert sql(filters) == sql(filters[::-1])
+
+
+def test_waivers_by_ids_sql_on_postgresql():
+    def sql(ids):
+        return str(Waiver.match_ids(ids, 'postgresql').compile(dialect=postgresql.dialect()))
+
+    assert sql([1]) == sql(range(100))
+
+
 def test_filtering_with_missing_filter(client, session):
     r = client.post('/api/v1.0/waivers/+filtered',
                     data=json.dumps({'somethingelse': 'what'}),
@@ -844,6 +1559,22 @@ def test_waivers_by_subjects_and_testcases_with_unrecognized_subject_type(client
     assert res_data['data'] == []
 
 
+def test_waivers_by_subjects_and_testcases_with_some_unrecognized_subjects(client, session):
+    for testcase in ('dist.rpmdeplint', 'dist.rpmlint'):
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python3-flask-0.12.2-1.fc29',
+                      testcase=testcase, username='person', product_version='fedora-29')
+    data = {'results': [
+        {'subject': {'item': 'python3-flask-0.12.2-1.fc29'}, 'testcase': 'dist.rpmdeplint'},
+        {'subject': {'type': 'koji_build', 'item': 'python3-flask-0.12.2-1.fc29'},
+         'testcase': 'dist.rpmlint'},
+    ]}
+    r = client.post('/api/v1.0/waivers/+by-subjects-and-testcases', data=json.dumps(data),
+                    content_type='application/json')
+    assert r.status_code == 200
+    assert [w['testcase'] for w in r.json['data']] == ['dist.rpmlint']
+
+
 def test_waivers_by_subjects_and_testcases_with_empty_results_parameter(client, session):
     create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-27.fc27',
                   testcase='testcase1', username='foo-1', product_version='foo-1')
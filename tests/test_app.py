@@ -33,6 +33,8 @@ def test_disabled_messaging_should_not_register_events(mock_listen):
         c for c in mock_listen.mock_calls if c == call(ANY, ANY, app.publish_new_waiver)
     ]
     assert calls == []
+    # Waiver inserts are not serialized by default
+    assert call(ANY, ANY, app.lock_new_waiver_ids) not in mock_listen.mock_calls
 
 
 @patch("waiverdb.app.sqlalchemy.event.listen")
@@ -50,3 +52,27 @@ def test_sqlalchemy_version():
     :return:
     """
     assert sqlalchemy.__version__.startswith('2')
+
+
+class SubjectWaiversCacheConfig(DisabledMessagingConfig):
+    SESSION_SQLALCHEMY_TABLE = "sessions-subject-waivers-cache"
+    SUBJECT_WAIVERS_CACHE_SIZE = 10
+
+
+@patch("waiverdb.app.sqlalchemy.event.listen")
+@patch("waiverdb.app.ChangeNotifier.listen")
+def test_subject_waivers_cache_listens_for_changes(mock_changes_listen, mock_listen):
+    flask_app = app.create_app(SubjectWaiversCacheConfig)
+    with flask_app.app_context():
+        mock_changes_listen.assert_called_once_with(db.engine)
+
+
+class SerializedInsertsConfig(DisabledMessagingConfig):
+    SESSION_SQLALCHEMY_TABLE = "sessions-serialized-inserts"
+    CHANGES_SERIALIZE_INSERTS = True
+
+
+@patch("waiverdb.app.sqlalchemy.event.listen")
+def test_serialized_waiver_inserts(mock_listen):
+    app.create_app(SerializedInsertsConfig)
+    assert call(db.session, "before_flush", app.lock_new_waiver_ids) in mock_listen.mock_calls
@@ -0,0 +1,166 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import asyncio
+import json
+
+import pytest
+from mock import patch
+
+from waiverdb.app import create_app
+from waiverdb.asgi_app import async_database_url, create_asgi_app
+from waiverdb.config import TestingConfig
+from waiverdb.models import Waiver, db
+
+
+@pytest.fixture(scope='module')
+def apps(app, tmp_path_factory):
+    """
+    The Flask and the ASGI application with a database file containing a few
+    waivers.
+    """
+    class Config(TestingConfig):
+        DATABASE_URI = f'sqlite:///{tmp_path_factory.mktemp("asgi")}/waiverdb.db'
+        SESSION_SQLALCHEMY_TABLE = 'sessions-asgi'
+        MESSAGE_BUS_PUBLISH = False
+
+    # The session event handlers were registered with the app fixture
+    with patch('waiverdb.app.register_event_handlers'):
+        flask_app = create_app(Config)
+    with flask_app.app_context():
+        db.create_all()
+        for i in range(5):
+            db.session.add(Waiver(
+                subject_type='koji_build',
+                subject_identifier=f'glibc-2.26-{i % 2}.fc27',
+                testcase=f'case{i % 3}',
+                username='alice',
+                product_version='fedora-27',
+                waived=i != 3,
+                comment=f'Waiver {i}',
+            ))
+        db.session.commit()
+        db.session.remove()
+
+    asgi_app = create_asgi_app(Config)
+    yield flask_app, asgi_app
+    asyncio.run(asgi_app.engine.dispose())
+    with flask_app.app_context():
+        db.engine.dispose()
+
+
+def asgi_request(app, method, url, body=None, headers=None):
+    """
+    Sends a request to the ASGI application and returns the status, headers
+    and body of the response.
+    """
+    path, _, query_string = url.partition('?')
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    headers = {**({'Content-Type': 'application/json'} if body is not None else {}),
+               **(headers or {})}
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'query_string': query_string.encode('latin-1'),
+        'root_path': '',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': data, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]['type'] == 'http.response.start'
+    response_headers = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+    return sent[0]['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def assert_same_response(apps, method, url, body=None, headers=None):
+    flask_app, asgi_app = apps
+    with flask_app.test_client() as client:
+        expected = client.open(
+            url, method=method, headers=headers,
+            data=None if body is None else json.dumps(body),
+            content_type=None if body is None else 'application/json')
+    status, response_headers, data = asgi_request(asgi_app, method, url, body, headers)
+    assert status == expected.status_code, data
+    assert data == expected.data
+    assert response_headers.get('etag') == expected.headers.get('ETag')
+    assert response_headers.get('content-type') == expected.headers.get('Content-Type')
+    return status, response_headers, data
+
+
+def test_async_database_url():
+    url = async_database_url('postgresql+psycopg2://waiverdb@db/waiverdb')
+    assert url.render_as_string() == 'postgresql+asyncpg://waiverdb@db/waiverdb'
+    assert async_database_url('sqlite:///waiverdb.db').drivername == 'sqlite+aiosqlite'
+    with pytest.raises(RuntimeError):
+        async_database_url('mysql://waiverdb@db/waiverdb')
+
+
+@pytest.mark.parametrize('method,url,body', [
+    ('POST', '/api/v1.0/waivers/+filtered', {'filters': [{'testcase': 'case1'}]}),
+    ('POST', '/api/v1.0/waivers/+filtered',
+     {'filters': [{'username': 'alice'}], 'include_obsolete': True}),
+    ('POST', '/api/v1.0/waivers/+filtered',
+     {'filters': [{'subject_identifier': 'glibc-2.26-0.fc27'}], 'fields': ['id', 'subject']}),
+    ('POST', '/api/v1.0/waivers/+waived', {'keys': [
+        {'subject_type': 'koji_build', 'subject_identifier': 'glibc-2.26-1.fc27',
+         'testcase': 'case0', 'scenario': None, 'product_version': 'fedora-27'},
+        {'subject_type': 'koji_build', 'subject_identifier': 'glibc-2.26-1.fc27',
+         'testcase': 'case9', 'scenario': None, 'product_version': 'fedora-27'},
+    ]}),
+    ('POST', '/api/v1.0/waivers/+by-ids', {'ids': [3, 1, 100, 3]}),
+    ('GET', '/api/v1.0/waivers/2', None),
+    ('GET', '/api/v1.0/waivers/2?callback=jsonpcallback', None),
+    ('GET', '/healthcheck', None),
+])
+def test_same_response(apps, method, url, body):
+    status, _, data = assert_same_response(apps, method, url, body)
+    assert status == 200
+    assert data
+
+
+@pytest.mark.parametrize('method,url,body', [
+    ('GET', '/api/v1.0/waivers/100', None),
+    ('POST', '/api/v1.0/waivers/+filtered', {'filters': [{'since': 'yesterday'}]}),
+    ('POST', '/api/v1.0/waivers/+filtered', {}),
+    ('POST', '/api/v1.0/waivers/+by-ids', {'ids': 'all'}),
+    ('GET', '/api/v1.0/waivers/+by-ids', None),
+    ('GET', '/api/v1.0/nothing', None),
+])
+def test_same_error(apps, method, url, body):
+    status, _, _ = assert_same_response(apps, method, url, body)
+    assert status >= 400
+
+
+def test_same_ndjson_response(apps):
+    headers = {'Accept': 'application/x-ndjson'}
+    body = {'filters': [{'username': 'alice'}]}
+    _, _, data = assert_same_response(apps, 'POST', '/api/v1.0/waivers/+filtered', body, headers)
+    assert len(data.splitlines()) == 5
+
+
+def test_not_modified(apps):
+    _, asgi_app = apps
+    url = '/api/v1.0/waivers/+by-ids'
+    _, headers, _ = asgi_request(asgi_app, 'POST', url, {'ids': [1]})
+    status, _, data = assert_same_response(
+        apps, 'POST', url, {'ids': [1]}, {'If-None-Match': headers['etag']})
+    assert status == 304
+    assert data == b''
+
+
+def test_write_endpoints_not_served(apps):
+    _, asgi_app = apps
+    status, _, data = asgi_request(asgi_app, 'GET', '/api/v1.0/waivers/')
+    assert status == 404
+    assert 'not served' in json.loads(data)['message']
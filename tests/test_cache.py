@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+from mock import patch
+
+from waiverdb.cache import Cache
+
+
+def test_cache_evicts_least_recently_used():
+    cache = Cache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_cache_expires_entries():
+    cache = Cache(maxsize=2, ttl=10)
+    with patch('waiverdb.cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+    with patch('waiverdb.cache.time.monotonic', return_value=109):
+        assert cache.get('a') == 1
+    with patch('waiverdb.cache.time.monotonic', return_value=110):
+        assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_disabled():
+    cache = Cache(maxsize=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert not cache.enabled
+
+
+def test_cache_invalidate():
+    cache = Cache(maxsize=3)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    generation = cache.generation
+    cache.invalidate(['a', 'c'])
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+    # Computed before the invalidation
+    cache.set('c', 3, generation=generation)
+    assert cache.get('c') is None
+    cache.set('c', 3, generation=cache.generation)
+    assert cache.get('c') == 3
+
+    cache.invalidate()
+    assert len(cache) == 0
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import datetime
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from waiverdb.changes import ChangeNotifier, settled_waivers
+from waiverdb.messaging.publishers import NullPublisher
+from .utils import create_waiver
+
+
+@pytest.fixture
+def waivers(session):
+    waivers = [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python2-2.7.14-%d.fc27' % i,
+                      testcase='case', username='person', product_version='fedora-27')
+        for i in range(3)
+    ]
+    session.commit()
+    return waivers
+
+
+@pytest.fixture
+def short_waits(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHANGES_POLL_INTERVAL', 0.05)
+    monkeypatch.setitem(app.config, 'CHANGES_STREAM_SECONDS', 0.2)
+
+
+def test_get_changes(client, waivers):
+    r = client.get('/api/v1.0/waivers/+changes?limit=2')
+    assert r.status_code == 200
+    assert [w['id'] for w in r.json['data']] == [waivers[0].id, waivers[1].id]
+    assert r.json['last_id'] == waivers[1].id
+
+    r = client.get(f'/api/v1.0/waivers/+changes?after_id={r.json["last_id"]}&fields=id,waived')
+    assert r.json == {'data': [{'id': waivers[2].id, 'waived': True}], 'last_id': waivers[2].id}
+
+    r = client.get(f'/api/v1.0/waivers/+changes?after_id={waivers[2].id}&wait=0.1')
+    assert r.json == {'data': [], 'last_id': waivers[2].id}
+
+
+def test_get_changes_waits_for_gaps_to_fill(app, client, waivers, session, monkeypatch):
+    session.delete(waivers[1])
+    session.commit()
+    r = client.get('/api/v1.0/waivers/+changes?fields=id')
+    assert r.json == {'data': [{'id': waivers[0].id}], 'last_id': waivers[0].id}
+
+    monkeypatch.setitem(app.config, 'CHANGES_SERIALIZE_INSERTS', True)
+    r = client.get('/api/v1.0/waivers/+changes?fields=id')
+    assert r.json['last_id'] == waivers[2].id
+
+
+def test_settled_waivers():
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    old = now - datetime.timedelta(seconds=60)
+    rows = [SimpleNamespace(id=id_, timestamp=timestamp)
+            for id_, timestamp in [(3, now), (5, old), (6, now), (8, now)]]
+    assert settled_waivers(rows, 2, 5) == rows[:3]
+    assert settled_waivers(rows, 1, 5) == []
+    assert settled_waivers(rows, 1, 0) == rows
+
+
+def test_get_changes_invalid(client, session):
+    r = client.get('/api/v1.0/waivers/+changes?limit=0')
+    assert r.status_code == 400
+    assert r.json['message'] == {'limit': 'Must be between 1 and 1000'}
+
+    r = client.get('/api/v1.0/waivers/+changes?wait=1000')
+    assert r.status_code == 400
+    assert r.json['message'] == {'wait': 'Must be between 0 and 25'}
+
+
+def test_commit_notifies_waiting_requests(app, session, monkeypatch):
+    monkeypatch.setattr(app, 'publisher', NullPublisher())
+    monkeypatch.setattr(app, 'waiver_changes', ChangeNotifier())
+    create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-27.fc27',
+                  testcase='case', username='person', product_version='fedora-27')
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-28.fc27', testcase='case',
+                           username='person', product_version='fedora-27')
+    session.commit()
+    assert app.waiver_changes.last_id == waiver.id
+
+    create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-29.fc27',
+                  testcase='case', username='person', product_version='fedora-27')
+    session.rollback()
+    session.commit()
+    assert app.waiver_changes.last_id == waiver.id
+
+
+def test_change_notifier():
+    notifier = ChangeNotifier()
+    assert not notifier.wait(0, 0.01)
+
+    thread = threading.Timer(0.05, notifier.notify, args=(5,))
+    thread.start()
+    assert notifier.wait(4, 5)
+    thread.join()
+    assert notifier.last_id == 5
+    assert not notifier.wait(5, 0.01)
+
+    notifier.notify(3)
+    assert notifier.last_id == 5
+
+
+def test_stream_changes(client, waivers, short_waits):
+    r = client.get(f'/api/v1.0/waivers/+changes?fields=id&after_id={waivers[2].id}',
+                   headers={'Accept': 'text/event-stream', 'Last-Event-ID': str(waivers[0].id)})
+    assert r.status_code == 200
+    assert r.mimetype == 'text/event-stream'
+    assert 'Content-Encoding' not in r.headers
+    events = r.get_data(as_text=True).split('\n\n')
+    assert events[:2] == [
+        f'id: {waiver.id}\nevent: waiver\ndata: {{"id": {waiver.id}}}'
+        for waiver in waivers[1:]
+    ]
+    assert set(events[2:]) == {': keepalive', ''}
+
+
+def test_stream_changes_invalid_last_event_id(client, session):
+    r = client.get('/api/v1.0/waivers/+changes',
+                   headers={'Accept': 'text/event-stream', 'Last-Event-ID': 'x'})
+    assert r.status_code == 400
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import gzip
+import json
+
+import pytest
+import zstandard
+from mock import patch
+
+from .utils import create_waiver
+
+
+@pytest.fixture
+def waivers(session):
+    return [
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier='python2-2.7.14-%d.fc27' % i,
+                      testcase='case', username='person',
+                      product_version='fedora-27', comment='bla bla bla')
+        for i in range(50)
+    ]
+
+
+def get_waivers(client, accept_encoding, limit=50):
+    return client.get(f'/api/v1.0/waivers/?limit={limit}',
+                      headers={'Accept-Encoding': accept_encoding})
+
+
+@patch('waiverdb.compression.response_compression_ratio_histogram')
+def test_gzip(ratio_histogram, client, waivers):
+    r = get_waivers(client, 'br, gzip')
+    assert r.status_code == 200
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.headers['Vary'] == 'Accept-Encoding'
+    assert int(r.headers['Content-Length']) == len(r.data)
+
+    data = json.loads(gzip.decompress(r.data))
+    assert len(data['data']) == len(waivers)
+    assert data == get_waivers(client, 'identity').json
+    ratio_histogram.labels.assert_called_with('gzip')
+    assert ratio_histogram.labels().observe.call_args[0][0] > 4
+
+
+def test_zstd(client, waivers):
+    r = get_waivers(client, 'gzip;q=0.5, zstd')
+    assert r.status_code == 200
+    assert r.headers['Content-Encoding'] == 'zstd'
+    data = json.loads(zstandard.ZstdDecompressor().decompressobj().decompress(r.data))
+    assert data == get_waivers(client, 'identity').json
+
+
+def test_no_compression(app, client, waivers, monkeypatch):
+    r = client.get('/api/v1.0/waivers/?limit=50')
+    assert 'Content-Encoding' not in r.headers
+    assert r.headers['Vary'] == 'Accept-Encoding'
+
+    r = get_waivers(client, 'gzip', limit=1)
+    assert 'Content-Encoding' not in r.headers
+
+    r = get_waivers(client, 'gzip;q=0, br')
+    assert 'Content-Encoding' not in r.headers
+
+    monkeypatch.setitem(app.config, 'COMPRESSION_ENCODINGS', [])
+    r = get_waivers(client, 'gzip')
+    assert 'Content-Encoding' not in r.headers
+    assert 'Vary' not in r.headers
+
+
+def test_gzip_ndjson_stream(client, waivers):
+    r = client.post('/api/v1.0/waivers/+filtered',
+                    data=json.dumps({'filters': [{'testcase': 'case'}]}),
+                    content_type='application/json',
+                    headers={'Accept': 'application/x-ndjson', 'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.is_streamed
+    assert r.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(r.data).decode('utf-8').splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [w.id for w in reversed(waivers)]
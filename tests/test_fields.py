@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import json
+from datetime import datetime
+
+import pytest
+from flask_restx import marshal
+from sqlalchemy import select
+
+from waiverdb.fields import (
+    select_waiver_fields, serialize_waiver, serialize_waivers, waiver_fields
+)
+from waiverdb.models import Waiver
+
+
+@pytest.fixture
+def waivers(make_waiver):
+    waivers = [
+        make_waiver(),
+        make_waiver(subject_type='compose', subject_identifier='Fedora-9000-19700101.n.18',
+                    scenario='x86_64', proxied_by='bodhi', comment=None),
+        make_waiver(waived=False, comment='ünïcödé'),
+    ]
+    timestamps = [
+        datetime(2017, 3, 16, 17, 42, 4, 209638),
+        datetime(2017, 3, 16, 17, 42, 4),
+        None,
+    ]
+    for i, (waiver, timestamp) in enumerate(zip(waivers, timestamps), 1):
+        waiver.id = i
+        waiver.timestamp = timestamp
+    return waivers
+
+
+def test_serialize_waiver_same_as_marshal(waivers):
+    for waiver in waivers:
+        expected = json.dumps(marshal(waiver, waiver_fields))
+        assert json.dumps(serialize_waiver(waiver)) == expected
+
+
+def test_serialize_waivers_with_fields_same_as_marshal(waivers):
+    fields = select_waiver_fields(['waived', 'subject', 'timestamp', 'id'])
+    expected = json.dumps(marshal(waivers, fields))
+    assert json.dumps(serialize_waivers(waivers, fields)) == expected
+
+
+def test_serialize_rows_same_as_marshal(session, waivers):
+    for waiver in waivers:
+        waiver.id = None
+    session.add_all(waivers)
+    session.flush()
+    expected = json.dumps(marshal(waivers, waiver_fields))
+
+    columns = list(Waiver.__mapper__.columns)
+    rows = session.execute(select(*columns).order_by(Waiver.id)).all()
+    assert json.dumps(serialize_waivers(rows)) == expected
+
+    fields = select_waiver_fields(['subject', 'id'])
+    rows = session.execute(
+        select(Waiver.id, Waiver.subject_type, Waiver.subject_identifier).order_by(Waiver.id)
+    ).all()
+    assert serialize_waivers(rows, fields) == marshal(waivers, fields)
@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import json
+
+import pytest
+from mock import Mock, patch
+from werkzeug.exceptions import ServiceUnavailable
+
+from waiverdb.limits import cancel_request, set_statement_timeout, statement_timeout
+from .utils import create_waiver
+
+
+@pytest.fixture
+def estimated_rows():
+    with patch('waiverdb.limits.estimated_rows', return_value=5000) as mocked:
+        yield mocked
+
+
+def test_statement_timeout_per_endpoint(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'STATEMENT_TIMEOUT', 30)
+    monkeypatch.setitem(app.config, 'STATEMENT_TIMEOUTS', {
+        'api_v1.filtered_waivers_resource': 2.5,
+        'api_v1.waived_resource': 0,
+    })
+    assert statement_timeout() is None
+    with app.test_request_context('/api/v1.0/waivers/+filtered', method='POST'):
+        assert statement_timeout() == 2.5
+    with app.test_request_context('/api/v1.0/waivers/+waived', method='POST'):
+        assert statement_timeout() is None
+    with app.test_request_context('/api/v1.0/waivers/'):
+        assert statement_timeout() == 30
+
+
+def test_set_statement_timeout(app):
+    connection = Mock()
+    connection.dialect.name = 'postgresql'
+    with app.test_request_context('/api/v1.0/waivers/+filtered', method='POST'):
+        set_statement_timeout(connection)
+    connection.exec_driver_sql.assert_called_once_with('SET LOCAL statement_timeout = 10000')
+
+    connection = Mock()
+    connection.dialect.name = 'sqlite'
+    with app.test_request_context('/api/v1.0/waivers/'):
+        set_statement_timeout(connection)
+    connection.exec_driver_sql.assert_not_called()
+
+
+def test_cancel_request(app):
+    canceled = Mock(original_exception=Mock(pgcode='57014'))
+    failed = Mock(original_exception=Mock(pgcode='08006'))
+    assert cancel_request(canceled) is None
+    with app.test_request_context('/api/v1.0/waivers/'):
+        assert isinstance(cancel_request(canceled), ServiceUnavailable)
+        assert cancel_request(failed) is None
+
+
+def test_too_many_filters(app, client, session, monkeypatch):
+    monkeypatch.setitem(app.config, 'QUERY_MAX_FILTERS', 1)
+    filters = [{'testcase': 'case1'}, {'testcase': 'case2'}]
+    r = client.post('/api/v1.0/waivers/+filtered', data=json.dumps({'filters': filters}),
+                    content_type='application/json')
+    assert r.status_code == 413
+    assert r.json['message'] == {'filters': 'At most 1 items can be requested at once'}
+
+    keys = [
+        {'subject_type': 'koji_build', 'subject_identifier': 'glibc-2.26-27.fc27',
+         'testcase': testcase, 'product_version': 'fedora-27'}
+        for testcase in ('case1', 'case2')
+    ]
+    r = client.post('/api/v1.0/waivers/+waived', data=json.dumps({'keys': keys}),
+                    content_type='application/json')
+    assert r.status_code == 413
+    assert r.json['message'] == {'keys': 'At most 1 items can be requested at once'}
+
+    r = client.post('/api/v1.0/waivers/+filtered', data=json.dumps({'filters': filters[:1]}),
+                    content_type='application/json')
+    assert r.status_code == 200
+
+
+def test_too_many_estimated_rows_filtered(app, client, session, monkeypatch, estimated_rows):
+    create_waiver(session, subject_type='koji_build', subject_identifier='glibc-2.26-27.fc27',
+                  testcase='case', username='person', product_version='fedora-27')
+    body = json.dumps({'filters': [{'testcase': 'case'}]})
+    r = client.post('/api/v1.0/waivers/+filtered', data=body, content_type='application/json')
+    assert r.status_code == 200
+
+    monkeypatch.setitem(app.config, 'QUERY_MAX_ESTIMATED_ROWS', 1000)
+    r = client.post('/api/v1.0/waivers/+filtered', data=body, content_type='application/json')
+    assert r.status_code == 413
+    assert r.json['message'].startswith(
+        'The query would read about 5000 waivers, more than the limit of 1000.')
+
+    # Streaming is not limited
+    r = client.post('/api/v1.0/waivers/+filtered', data=body, content_type='application/json',
+                    headers={'Accept': 'application/x-ndjson'})
+    assert r.status_code == 200
+    assert len(r.get_data(as_text=True).splitlines()) == 1
+
+
+def test_too_many_estimated_rows_count(app, client, session, monkeypatch, estimated_rows):
+    for i in range(2):
+        create_waiver(session, subject_type='koji_build',
+                      subject_identifier=f'glibc-2.26-{i}.fc27', testcase='case',
+                      username='person', product_version='fedora-27')
+    monkeypatch.setitem(app.config, 'QUERY_MAX_ESTIMATED_ROWS', 1000)
+    r = client.get('/api/v1.0/waivers/?limit=1')
+    assert r.status_code == 413
+    assert 'count=none' in r.json['message']
+
+    r = client.get('/api/v1.0/waivers/?limit=1&count=none')
+    assert r.status_code == 200
+    assert len(r.json['data']) == 1
@@ -2,6 +2,8 @@
 
 import pytest
 
+from .utils import create_waiver
+from waiverdb.models import CurrentWaiver
 from waiverdb.models.waivers import subject_dict_to_type_identifier
 from waiverdb.models.requests import TestSubject
 
@@ -25,3 +27,30 @@ def test_subject_dict_to_type_identifier(subject, expected_type, expected_identi
     subject_type, subject_identifier = subject_dict_to_type_identifier(ts)
     assert subject_type == expected_type
     assert subject_identifier == expected_identifier
+
+
+def test_current_waivers_are_updated_on_insert(session):
+    old = create_waiver(session, 'koji_build', 'glibc-2.26-27.fc27', 'testcase1', 'foo', 'foo-1')
+    new = create_waiver(session, 'koji_build', 'glibc-2.26-27.fc27', 'testcase1', 'foo', 'foo-1')
+    other_user = create_waiver(
+        session, 'koji_build', 'glibc-2.26-27.fc27', 'testcase1', 'bar', 'foo-1')
+
+    current = session.query(CurrentWaiver.key_type, CurrentWaiver.waiver_id).all()
+    assert sorted(current) == [
+        ('full', new.id), ('full', other_user.id), ('result', other_user.id)
+    ]
+    assert old.id not in {waiver_id for _, waiver_id in current}
+
+
+def test_current_waivers_rebuild(session):
+    for username in ('foo', 'bar', 'foo'):
+        for testcase in ('testcase1', 'testcase2'):
+            create_waiver(session, 'koji_build', 'glibc-2.26-27.fc27', testcase, username, 'foo-1')
+
+    query = session.query(CurrentWaiver.key_type, CurrentWaiver.key_hash, CurrentWaiver.waiver_id)
+    expected = sorted(query.all())
+    session.query(CurrentWaiver).delete()
+    assert query.all() == []
+
+    CurrentWaiver.rebuild(session.connection())
+    assert sorted(query.all()) == expected
@@ -20,6 +20,17 @@ def test_metrics(client):
                 and line.endswith(' counter')]) == 4
 
 
+def test_compiled_cache_metrics(client, session):
+    for _ in range(2):
+        client.get('/api/v1.0/waivers/')
+    r = client.get('/api/v1.0/metrics')
+
+    samples = [line for line in r.get_data(as_text=True).splitlines()
+               if line.startswith('sql_compiled_cache_total{')]
+    assert any(line.startswith('sql_compiled_cache_total{result="cache_hit"}')
+               for line in samples)
+
+
 def test_standalone_metrics_server_disabled_by_default():
     with pytest.raises(requests.exceptions.ConnectionError):
         requests.get('http://127.0.0.1:10040/metrics')
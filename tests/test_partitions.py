@@ -0,0 +1,25 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import datetime
+
+import pytest
+
+from waiverdb.partitions import create_partitions, next_month, partition_name
+
+
+@pytest.mark.parametrize('day, expected', [
+    (datetime.date(2026, 1, 31), datetime.date(2026, 2, 1)),
+    (datetime.date(2026, 2, 1), datetime.date(2026, 3, 1)),
+    (datetime.date(2026, 12, 15), datetime.date(2027, 1, 1)),
+])
+def test_next_month(day, expected):
+    assert next_month(day) == expected
+
+
+def test_partition_name():
+    assert partition_name(datetime.date(2026, 3, 1)) == 'waiver_p202603'
+
+
+def test_create_partitions_requires_partitioned_table(session):
+    with pytest.raises(RuntimeError, match='not partitioned'):
+        create_partitions(session.connection())
@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import json
+
+import pytest
+import sqlalchemy
+from mock import patch
+
+import waiverdb.replicas
+from waiverdb.models import db
+from waiverdb.replicas import PRIMARY_COOKIE_NAME, replica_binds
+from .utils import create_waiver
+
+
+def use_replica(app, monkeypatch, engine):
+    monkeypatch.setitem(app.config, 'REPLICA_DATABASE_URIS', [str(engine.url)])
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', replica_binds([str(engine.url)]))
+    monkeypatch.setitem(db.engines, 'replica_0', engine)
+    monkeypatch.setattr(waiverdb.replicas, '_unhealthy_replicas', {})
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    engine = sqlalchemy.create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    use_replica(app, monkeypatch, engine)
+    return engine
+
+
+@pytest.fixture
+def broken_replica(app, monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path}/missing/replica.db')
+    use_replica(app, monkeypatch, engine)
+    return engine
+
+
+def get_waiver_ids(client):
+    r = client.get('/api/v1.0/waivers/')
+    assert r.status_code == 200
+    return [w['id'] for w in json.loads(r.get_data(as_text=True))['data']]
+
+
+def test_read_from_replica(client, session, replica):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='testcase1', username='foo',
+                           product_version='foo-1', comment='bla bla bla')
+    # The waiver was not replicated yet
+    assert get_waiver_ids(client) == []
+
+    client.set_cookie(PRIMARY_COOKIE_NAME, '1')
+    assert get_waiver_ids(client) == [waiver.id]
+
+
+@patch('waiverdb.auth.get_user', return_value=('foo', {}))
+def test_read_from_primary_after_write(mock_get_user, client, session, replica):
+    data = {
+        'subject_type': 'koji_build',
+        'subject_identifier': 'glibc-2.26-27.fc27',
+        'testcase': 'testcase1',
+        'product_version': 'fool-1',
+        'waived': True,
+        'comment': 'it broke',
+    }
+    r = client.post('/api/v1.0/waivers/', data=json.dumps(data),
+                    content_type='application/json')
+    assert r.status_code == 201
+    assert client.get_cookie(PRIMARY_COOKIE_NAME) is not None
+    assert get_waiver_ids(client) == [json.loads(r.get_data(as_text=True))['id']]
+
+
+def test_read_from_primary_if_replica_fails(client, session, broken_replica):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='testcase1', username='foo',
+                           product_version='foo-1', comment='bla bla bla')
+    session.commit()
+    assert get_waiver_ids(client) == [waiver.id]
+    assert 'replica_0' in waiverdb.replicas._unhealthy_replicas
+
+
+def test_get_waivers_by_ids_missing_on_replica(client, session, replica):
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='testcase1', username='foo',
+                           product_version='foo-1', comment='bla bla bla')
+    r = client.post('/api/v1.0/waivers/+by-ids',
+                    data=json.dumps({'ids': [waiver.id, 9000]}),
+                    content_type='application/json')
+    assert r.status_code == 200
+    assert [w['id'] for w in r.json['data']] == [waiver.id]
+    assert r.json['missing'] == [9000]
@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+import datetime
+import json
+
+import pytest
+from sqlalchemy import select
+
+from waiverdb.models import WaiverDailyStats
+from .utils import create_waiver
+
+
+@pytest.fixture
+def waivers(session):
+    waivers = []
+    for day, testcase, username in [
+        (datetime.date(2026, 9, 30), 'dist.rpmlint', 'foo'),
+        (datetime.date(2026, 10, 4), 'dist.rpmlint', 'foo'),
+        (datetime.date(2026, 10, 4), 'dist.rpmlint', 'bar'),
+        (datetime.date(2026, 10, 5), 'dist.abicheck', 'foo'),
+        (datetime.date(2026, 10, 5), 'dist.rpmlint', 'foo'),
+    ]:
+        waiver = create_waiver(session, subject_type='koji_build',
+                               subject_identifier='glibc-2.26-27.fc27',
+                               testcase=testcase, username=username,
+                               product_version='fedora-27')
+        waiver.timestamp = datetime.datetime.combine(day, datetime.time(12))
+        waivers.append(waiver)
+    session.flush()
+    # Count the waivers on the days set above
+    WaiverDailyStats.rebuild(session.connection())
+    return waivers
+
+
+def get_stats(client, **params):
+    r = client.get('/api/v1.0/waivers/+stats', query_string=params)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return json.loads(r.get_data(as_text=True))['data']
+
+
+def stats_rows(session):
+    return session.execute(
+        select(WaiverDailyStats.__table__).order_by(*WaiverDailyStats.__table__.primary_key)
+    ).all()
+
+
+def test_stats_updated_on_insert(session, waivers):
+    expected = stats_rows(session)
+    session.execute(WaiverDailyStats.__table__.delete())
+    WaiverDailyStats.update(session.connection(), waivers[:2])
+    WaiverDailyStats.update(session.connection(), waivers[2:])
+    assert stats_rows(session) == expected
+    assert sum(row.count for row in expected) == len(waivers)
+
+    waiver = create_waiver(session, subject_type='koji_build',
+                           subject_identifier='glibc-2.26-27.fc27',
+                           testcase='dist.rpmlint', username='foo',
+                           product_version='fedora-27')
+    row = session.get(WaiverDailyStats, (waiver.timestamp.date(), 'koji_build', 'dist.rpmlint',
+                                         'fedora-27', 'foo'))
+    assert row.count == 1
+
+
+def test_stats(client, waivers):
+    assert get_stats(client) == [{'count': 5}]
+    assert get_stats(client, group_by='testcase') == [
+        {'testcase': 'dist.abicheck', 'count': 1},
+        {'testcase': 'dist.rpmlint', 'count': 4},
+    ]
+    assert get_stats(client, group_by='username,day', testcase='dist.rpmlint') == [
+        {'day': '2026-09-30', 'username': 'foo', 'count': 1},
+        {'day': '2026-10-04', 'username': 'bar', 'count': 1},
+        {'day': '2026-10-04', 'username': 'foo', 'count': 1},
+        {'day': '2026-10-05', 'username': 'foo', 'count': 1},
+    ]
+    assert get_stats(client, group_by='week') == [
+        {'week': '2026-09-28', 'count': 3},
+        {'week': '2026-10-05', 'count': 2},
+    ]
+    assert get_stats(client, group_by='month', since='2026-09-30T23:00:00') == [
+        {'month': '2026-09-01', 'count': 1},
+        {'month': '2026-10-01', 'count': 4},
+    ]
+    assert get_stats(client, since='2026-10-01,2026-10-04T08:00:00') == [{'count': 2}]
+
+
+def test_stats_without_waivers(client, session):
+    assert get_stats(client) == []
+    assert get_stats(client, group_by='testcase') == []
+
+
+@pytest.mark.parametrize('group_by, error', [
+    ('testcase,comment', 'Unknown properties: comment'),
+    ('day,month', 'At most one time bucket can be used'),
+])
+def test_stats_bad_group_by(client, session, group_by, error):
+    r = client.get('/api/v1.0/waivers/+stats', query_string={'group_by': group_by})
+    assert r.status_code == 400
+    assert json.loads(r.get_data(as_text=True))['message'] == {'group_by': error}
@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+import json
 import logging
+import time
 
 import requests
 from flask import (
@@ -10,11 +12,12 @@ from flask import (
     redirect,
     render_template,
     request,
+    stream_with_context,
     url_for,
 )
 from flask_oidc import OpenIDConnect
 from flask_pydantic import validate
-from flask_restx import Resource, Api, marshal_with, marshal
+from flask_restx import Resource, Api
 from markupsafe import escape
 from werkzeug.exceptions import (
     BadRequest,
@@ -22,19 +25,32 @@ from werkzeug.exceptions import (
     ServiceUnavailable,
     Unauthorized,
 )
-from sqlalchemy.sql.expression import func, and_, or_
+from sqlalchemy.sql.expression import func, and_, select
 from typing import Dict, Any
 
 from waiverdb import __version__
 from waiverdb.authorization import match_testcase_permissions, verify_authorization
+from waiverdb.changes import settled_waivers
+from waiverdb.limits import check_estimated_rows, check_filter_count
 from waiverdb.models import db
-from waiverdb.models.waivers import Waiver, subject_dict_to_type_identifier
+from waiverdb.models.waivers import (
+    OBSOLETE_WAIVER_KEYS, CurrentWaiver, Waiver, WaiverDailyStats, subject_dict_to_type_identifier
+)
 from waiverdb.models.requests import (
     GetWaivers, CreateWaiver, FilterWaivers, GetWaiversBySubjectAndTestcase, GetPermissions,
-    parse_since, WaiverFilter, CreateWaiverList
+    GetWaived, GetWaiverChanges, GetWaiverStats, GetWaiversByIds, parse_since, CreateWaiverList
+)
+from waiverdb.utils import (
+    auth_methods, etag, json_collection, json_cursor_collection, jsonp, waivers_version
+)
+from waiverdb.fields import (
+    select_waiver_fields, serialize_waiver, serialize_waivers, waiver_field_columns
+)
+from waiverdb.monitor import (
+    filtered_waivers_cache_hit_counter, filtered_waivers_cache_miss_counter,
+    subject_waivers_cache_hit_counter, subject_waivers_cache_miss_counter
 )
-from waiverdb.utils import json_collection, jsonp, auth_methods
-from waiverdb.fields import waiver_fields
+from waiverdb.replicas import on_replica, pin_to_primary, primary_database, read_replica
 import waiverdb.auth
 
 api_v1 = (Blueprint('api_v1', __name__))
@@ -78,24 +94,70 @@ def permissions() -> list[dict[str, Any]]:
     return []
 
 
-def _filter_out_obsolete_waivers(query):
+def _filter_out_obsolete_waivers(query, key_type='full', key_clauses=None):
     """
     Filters out obsolete waivers.
 
     A waiver is obsolete if there exist another one that is more recent with
-    same subject, test case name, username and product_version.
+    same values in the columns of the key (see ``OBSOLETE_WAIVER_KEYS``). By
+    default, this is the same subject, test case name, scenario, username
+    and product_version.
+
+    Optional ``key_clauses`` must only refer to the key columns. These are
+    used to limit the search for the most recent waivers to matching keys.
     """
-    subquery = db.session.query(func.max(Waiver.id)).group_by(
-        Waiver.subject_type,
-        Waiver.subject_identifier,
-        Waiver.testcase,
-        Waiver.scenario,
-        Waiver.username,
-        Waiver.product_version,
-    )
+    if current_app.config['OBSOLETE_WAIVERS_FILTER'] == 'projection':
+        return query.join(CurrentWaiver, and_(
+            CurrentWaiver.waiver_id == Waiver.id,
+            CurrentWaiver.key_type == key_type,
+        ))
+
+    key_columns = [getattr(Waiver, column) for column in OBSOLETE_WAIVER_KEYS[key_type]]
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Allows walking the ix_waiver_latest_* indexes instead of
+        # aggregating all matching rows
+        subquery = (
+            select(Waiver.id)
+            .distinct(*key_columns)
+            .order_by(*key_columns, Waiver.id.desc())
+        )
+    else:
+        subquery = select(func.max(Waiver.id)).group_by(*key_columns)
+    if key_clauses:
+        subquery = subquery.where(*key_clauses)
     return query.filter(Waiver.id.in_(subquery))
 
 
+def _select_fields(query, names, extra_columns=()):
+    """
+    Selects only the waiver columns needed to output fields with given names
+    (all if ``names`` is None).
+
+    The modified query returns plain rows instead of :class:`Waiver`
+    instances, which are much cheaper to load and serialize.
+
+    Returns the modified query and the fields to serialize the rows with.
+    """
+    fields = select_waiver_fields(names)
+    columns = {column for name in fields for column in waiver_field_columns[name]}
+    columns.update(extra_columns)
+    query = query.with_entities(*[c for c in Waiver.__table__.columns if c.name in columns])
+    return query, fields
+
+
+def _field_names(value):
+    """
+    Returns the names in the comma-separated ``fields`` query parameter, or
+    None (all fields) if there are none.
+    """
+    names = [name.strip() for name in (value or '').split(',')]
+    return [name for name in names if name] or None
+
+
+# Added to errors about too many waivers matching waivers/+filtered requests
+FILTERED_WAIVERS_HINT = 'Use more specific filters or request the application/x-ndjson format.'
+
+
 def _verify_authorization(user, testcase):
     if not permissions():
         return
@@ -138,6 +200,8 @@ def _authorization_warning(request):
 
 
 class WaiversResource(Resource):
+    @read_replica
+    @etag(waivers_version)
     @jsonp
     @validate()
     def get(self, query: GetWaivers):
@@ -174,9 +238,22 @@ class WaiversResource(Resource):
 
         :query int page: The page to get.
         :query int limit: Limit the number of items returned.
+        :query string cursor: Use keyset pagination instead of page numbers.
+            Pass an empty value to get the first page and then follow the
+            ``next`` link, which contains an opaque cursor, until it is null.
+            This mode is much faster for deep pages but the response does not
+            contain ``prev`` and ``last`` links, and pages contain at most 100
+            waivers.
+        :query string count: How to compute the ``last`` page link. ``exact``
+            (the default) counts all matching waivers, ``estimate`` may reuse
+            a count cached for a short time and ``none`` skips counting and
+            sets ``last`` to null unless the requested page is the last one.
         :query string subject_type: Only include waivers for the given subject type.
         :query string subject_identifier: Only include waivers for the given subject identifier.
         :query string testcase: Only include waivers for the given test case name.
+        :query string testcase_pattern: Only include waivers for test case
+            names matching the given glob pattern (e.g. ``kernel-qe.*``), with
+            the same syntax as test case patterns in permissions.
         :query string scenario: Only include waivers for the given scenario name.
         :query string product_version: Only include waivers for the given
             product version.
@@ -188,28 +265,51 @@ class WaiversResource(Resource):
             to filter results by. Optionally provide a second ISO 8601 datetime separated
             by a comma to retrieve a range (e.g. 2017-03-16T13:40:05+00:00,
             2017-03-16T13:40:15+00:00)
+        :query string q: Only include waivers with comments matching the
+            given search query. On PostgreSQL, this is a full-text search
+            (with ``websearch_to_tsquery()`` syntax, e.g. ``"rhbz 1234"
+            -flaky``) and the most relevant waivers are returned first, unless
+            ``cursor`` is used. Otherwise, comments must contain all the
+            words.
         :query boolean include_obsolete: If true, obsolete waivers will be included.
+        :query string fields: Comma-separated names of waiver fields to return
+            (e.g. ``id,testcase,waived``). Only these are read from the
+            database. By default or if the value is empty, all fields are
+            returned.
         :statuscode 200: If the query was valid and no problems were encountered.
             Note that the response may still contain 0 waivers.
+        :statuscode 304: No waiver was created since the response with the
+            ETag given in If-None-Match.
         :statuscode 400: The request was malformed and could not be processed.
+        :statuscode 413: Counting the waivers for the ``last`` link is expected
+            to read more rows than ``QUERY_MAX_ESTIMATED_ROWS``.
+        :statuscode 503: The database query took longer than the statement
+            timeout.
         """
 
         q = Waiver.query.order_by(Waiver.timestamp.desc())
+        dialect_name = db.session.get_bind().dialect.name
 
+        key_clauses = []
         if query.subject_type:
-            q = q.filter(Waiver.subject_type == query.subject_type)
+            key_clauses.append(Waiver.subject_type == query.subject_type)
         if query.subject_identifier:
-            q = q.filter(Waiver.subject_identifier == query.subject_identifier)
+            key_clauses.append(Waiver.subject_identifier == query.subject_identifier)
         if query.testcase:
-            q = q.filter(Waiver.testcase == query.testcase)
+            key_clauses.append(Waiver.testcase == query.testcase)
+        if query.testcase_pattern:
+            key_clauses.append(Waiver.match_testcase_pattern(query.testcase_pattern, dialect_name))
         if query.scenario:
-            q = q.filter(Waiver.scenario == query.scenario)
+            key_clauses.append(Waiver.scenario == query.scenario)
         if query.product_version:
-            q = q.filter(Waiver.product_version == query.product_version)
+            key_clauses.append(Waiver.product_version == query.product_version)
         if query.username:
-            q = q.filter(Waiver.username == query.username)
+            key_clauses.append(Waiver.username == query.username)
+        q = q.filter(*key_clauses)
         if query.proxied_by:
             q = q.filter(Waiver.proxied_by == query.proxied_by)
+        if query.q:
+            q = q.filter(Waiver.match_comment(query.q, dialect_name))
         if query.since:
             since_start, since_end = parse_since(query.since)
             if since_start:
@@ -217,14 +317,22 @@ class WaiversResource(Resource):
             if since_end:
                 q = q.filter(Waiver.timestamp <= since_end)
         if not query.include_obsolete:
-            q = _filter_out_obsolete_waivers(q)
-
-        q = q.order_by(Waiver.timestamp.desc())
-        return json_collection(q, query.page, query.limit)
+            q = _filter_out_obsolete_waivers(q, key_clauses=key_clauses)
+
+        rank = Waiver.comment_rank(query.q, dialect_name) if query.q else None
+        if rank is not None and query.cursor is None:
+            # Most relevant first
+            q = q.order_by(None).order_by(rank.desc(), Waiver.timestamp.desc())
+        field_names = _field_names(query.fields)
+        if query.cursor is not None:
+            # The next page cursor is built from these
+            q, fields = _select_fields(q, field_names, extra_columns=['timestamp', 'id'])
+            return json_cursor_collection(q, query.cursor, query.limit, fields)
+        q, fields = _select_fields(q, field_names)
+        return json_collection(q, query.page, query.limit, query.count, fields)
 
     @jsonp
     @validate()
-    @marshal_with(waiver_fields)
     def post(self, body: CreateWaiverList):
         """
         Create a new waiver or multiple waivers.
@@ -302,8 +410,11 @@ class WaiversResource(Resource):
             db.session.add(result)
 
         db.session.commit()
+        pin_to_primary()
 
-        return result, 201, headers
+        if isinstance(result, list):
+            return serialize_waivers(result), 201, headers
+        return serialize_waiver(result), 201, headers
 
     @staticmethod
     def _create_waiver(args: CreateWaiver, user):
@@ -393,13 +504,13 @@ class WaiversNewResource(WaiversResource):
         ), mimetype='text/html')
 
     @validate()
-    @marshal_with(waiver_fields)
     def post(self, body: CreateWaiver):
         user, headers = waiverdb.auth.get_user(request)
         result = self._create_waiver(body, user)
         db.session.add(result)
         db.session.commit()
-        return result, 201, headers
+        pin_to_primary()
+        return serialize_waiver(result), 201, headers
 
 
 class WaiversJSResource(Resource):
@@ -420,26 +531,81 @@ class WaiversCreateResource(WaiversResource):
 
 
 class WaiverResource(Resource):
+    @read_replica
+    @etag()
     @jsonp
-    @marshal_with(waiver_fields)
-    def get(self, waiver_id: int) -> Waiver:
+    def get(self, waiver_id: int):
         """
         Get a single waiver by waiver ID.
 
         :param int waiver_id: The waiver's database ID.
 
         :statuscode 200: The waiver was found and returned.
+        :statuscode 304: The waiver has the ETag given in If-None-Match.
         :statuscode 404: No waiver exists with that ID.
         """
         try:
-            return db.get_or_404(Waiver, waiver_id)
+            waiver = db.get_or_404(Waiver, waiver_id)
         except Exception as NotFound:
             raise type(NotFound)('Waiver not found')
+        return serialize_waiver(waiver)
+
+
+def _stream_ndjson(query, fields, batch_size=1000):
+    """
+    Returns a streamed response with one JSON-encoded waiver per line.
+
+    Rows are fetched in batches using a server-side cursor, so the memory
+    usage does not depend on the number of matching waivers.
+    """
+    # Execute the query before the response starts, so errors are reported
+    # with a proper status code
+    waivers = iter(query.yield_per(batch_size))
+
+    def generate():
+        for waiver in waivers:
+            yield json.dumps(serialize_waiver(waiver, fields)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _filtered_waivers_cache_key(body: FilterWaivers):
+    """
+    Returns a key identifying equivalent waivers/+filtered requests, ignoring
+    the order and duplicates of the filters.
+    """
+    filters = {
+        json.dumps({k: v for k, v in filter_.model_dump().items() if v}, sort_keys=True)
+        for filter_ in body.filters
+    }
+    fields = None if body.fields is None else sorted(set(body.fields))
+    return json.dumps([body.include_obsolete, fields, sorted(filters)])
+
+
+def _filtered_waivers_query(body: FilterWaivers, dialect_name):
+    """
+    Returns the query and the fields to serialize the rows with for a
+    waivers/+filtered request.
+    """
+    check_filter_count('filters', len(body.filters))
+    query = Waiver.query.order_by(Waiver.timestamp.desc())
+    clause = Waiver.match_filters(body.filters, dialect_name)
+    if clause is not None:
+        query = query.filter(clause)
+    if not body.include_obsolete:
+        # Limit the search for the most recent waivers to the keys
+        # matching the filters
+        key_clause = Waiver.match_filters(
+            body.filters, dialect_name, columns=OBSOLETE_WAIVER_KEYS['result'], since=False)
+        key_clauses = None if key_clause is None else [key_clause]
+        query = _filter_out_obsolete_waivers(query, 'result', key_clauses=key_clauses)
+    return _select_fields(query, body.fields)
 
 
 class FilteredWaiversResource(Resource):
+    @read_replica
+    @etag(waivers_version)
     @validate()
-    @marshal_with(waiver_fields, envelope='data')
     def post(self, body: FilterWaivers):
         """
         Get waiver records, filtered by some criteria.
@@ -450,6 +616,9 @@ class FilteredWaiversResource(Resource):
 
         Note that the response is not paginated (that is, *all* waivers are
         returned in the 'data' key, even if there is a large number of them).
+        Clients expecting many waivers should request the
+        ``application/x-ndjson`` format instead, in which case the waivers are
+        streamed as one JSON object per line.
 
         **Sample request**:
 
@@ -505,48 +674,587 @@ class FilteredWaiversResource(Resource):
             within the filter dict are the same as the filtering
             parameters accepted by :http:get:`/api/v1.0/waivers/`.
         :json boolean include_obsolete: If true, obsolete waivers will be included.
+        :json list fields: Names of waiver fields to return. By default, all
+            fields are returned.
+        :reqheader Accept: ``application/x-ndjson`` to stream the waivers one
+            per line, otherwise ``application/json``.
         :statuscode 200: Returns matching waivers, if any.
+        :statuscode 304: No waiver was created since the response with the
+            ETag given in If-None-Match.
         :statuscode 400: The request was malformed (invalid filter critera).
+        :statuscode 413: There are more filters than ``QUERY_MAX_FILTERS`` or
+            more matching waivers are expected than
+            ``QUERY_MAX_ESTIMATED_ROWS`` (only checked for JSON responses).
+        :statuscode 503: The database query took longer than the statement
+            timeout.
         """
-        query = Waiver.query.order_by(Waiver.timestamp.desc())
-        clauses = []
-        filter_: WaiverFilter
-        for filter_ in body.filters:
-            inner_clauses = []
-            if filter_.subject_type:
-                inner_clauses.append(Waiver.subject_type == filter_.subject_type)
-            if filter_.subject_identifier:
-                inner_clauses.append(Waiver.subject_identifier == filter_.subject_identifier)
-            if filter_.testcase:
-                inner_clauses.append(Waiver.testcase == filter_.testcase)
-            if filter_.scenario:
-                inner_clauses.append(Waiver.scenario == filter_.scenario)
-            if filter_.product_version:
-                inner_clauses.append(Waiver.product_version == filter_.product_version)
-            if filter_.username:
-                inner_clauses.append(Waiver.username == filter_.username)
-            if filter_.proxied_by:
-                inner_clauses.append(Waiver.proxied_by == filter_.proxied_by)
-            if filter_.since:
-                since_start, since_end = parse_since(filter_.since)
-                if since_start:
-                    inner_clauses.append(Waiver.timestamp >= since_start)
-                if since_end:
-                    inner_clauses.append(Waiver.timestamp <= since_end)
-            clauses.append(and_(*inner_clauses))
-        query = query.filter(or_(*clauses))
-        if not body.include_obsolete:
-            subquery = db.session.query(func.max(Waiver.id)).group_by(
-                Waiver.subject_type,
-                Waiver.subject_identifier,
-                Waiver.testcase,
-                Waiver.scenario
-            )
-            query = query.filter(Waiver.id.in_(subquery))
-        return query.all()
+        query, fields = _filtered_waivers_query(body, db.session.get_bind().dialect.name)
+        mimetype = request.accept_mimetypes.best_match(
+            ['application/json', 'application/x-ndjson'])
+        if mimetype == 'application/x-ndjson':
+            return _stream_ndjson(query, fields)
+
+        cache = current_app.filtered_waivers_cache
+        if not cache.enabled:
+            check_estimated_rows(query, FILTERED_WAIVERS_HINT)
+            return {'data': serialize_waivers(query.all(), fields)}
+
+        key = _filtered_waivers_cache_key(body)
+        version = waivers_version()
+        cached = cache.get(key)
+        if cached is not None and cached[0] == version:
+            filtered_waivers_cache_hit_counter.inc()
+            return cached[1]
+
+        filtered_waivers_cache_miss_counter.inc()
+        check_estimated_rows(query, FILTERED_WAIVERS_HINT)
+        result = {'data': serialize_waivers(query.all(), fields)}
+        cache.set(key, (version, result))
+        return result
+
+
+# Columns identifying the waivers in waivers/+waived requests
+WAIVED_KEY_COLUMNS = (
+    'subject_type',
+    'subject_identifier',
+    'testcase',
+    'scenario',
+    'product_version',
+)
+
+
+def _waived_query(body: GetWaived, dialect_name):
+    """
+    Returns the keys of a waivers/+waived request (as tuples of
+    ``WAIVED_KEY_COLUMNS`` values) and the query for their waivers.
+    """
+    check_filter_count('keys', len(body.keys))
+    keys = [
+        tuple(getattr(key, column) for column in WAIVED_KEY_COLUMNS)
+        for key in body.keys
+    ]
+    query = db.session.query(
+        Waiver.id,
+        Waiver.waived,
+        *[getattr(Waiver, column) for column in WAIVED_KEY_COLUMNS],
+    ).filter(Waiver.match_keys(WAIVED_KEY_COLUMNS, set(keys), dialect_name))
+
+    # Limit the search for the most recent waivers to requested subjects
+    # and test cases
+    subject_columns = ('subject_type', 'subject_identifier', 'testcase')
+    subjects = sorted({key[:len(subject_columns)] for key in keys})
+    key_clause = Waiver.match_values(subject_columns, subjects, dialect_name)
+    query = _filter_out_obsolete_waivers(query, 'result', key_clauses=[key_clause])
+    return keys, query
+
+
+def _waived_response(keys, rows):
+    """
+    Returns the waivers/+waived response for given keys and the rows returned
+    by the query from :func:`_waived_query`.
+    """
+    latest = {}
+    for row in rows:
+        key = tuple(row[2:])
+        if key not in latest or latest[key]['id'] < row.id:
+            latest[key] = {'id': row.id, 'waived': row.waived}
+    return {'data': [latest.get(key, {'id': None, 'waived': None}) for key in keys]}
+
+
+class WaivedResource(Resource):
+    @read_replica
+    @etag(waivers_version)
+    @validate()
+    def post(self, body: GetWaived):
+        """
+        Get the state of the most recent waiver for each of given keys.
+
+        This is a lightweight alternative to
+        :http:post:`/api/v1.0/waivers/+filtered` for clients which only need
+        to know whether test results are waived. Only the waiver ID and the
+        ``waived`` flag are returned for each key, in the same order as the
+        keys in the request (``null`` values mean there is no waiver).
+
+        As with :http:post:`/api/v1.0/waivers/+filtered`, obsolete waivers
+        are left out, so a more recent waiver for the same subject, test case
+        and scenario but a different product version makes an older waiver
+        obsolete.
+
+        **Sample request**:
+
+        .. sourcecode:: http
+
+           POST /api/v1.0/waivers/+waived HTTP/1.1
+           Accept: application/json
+           Content-Type: application/json
+
+           {
+                "keys": [
+                    {
+                        "subject_type": "compose",
+                        "subject_identifier": "Fedora-9000-19700101.n.18",
+                        "testcase": "compose.install_no_user",
+                        "product_version": "fedora-27"
+                    },
+                    {
+                        "subject_type": "koji_build",
+                        "subject_identifier": "gzip-1.9-1.fc28",
+                        "testcase": "dist.rpmlint",
+                        "scenario": "x86_64",
+                        "product_version": "fedora-28"
+                    }
+                ]
+           }
+
+        **Sample response**:
+
+        .. sourcecode:: none
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+                "data": [
+                    {"id": 15, "waived": true},
+                    {"id": null, "waived": null}
+                ]
+           }
+
+        :json list keys: List of dicts with ``subject_type``,
+            ``subject_identifier``, ``testcase``, ``product_version`` and
+            optional ``scenario`` (if missing, only waivers without a
+            scenario match).
+        :statuscode 200: Returns the waiver state for each key.
+        :statuscode 304: No waiver was created since the response with the
+            ETag given in If-None-Match.
+        :statuscode 400: The request was malformed.
+        :statuscode 413: There are more keys than ``QUERY_MAX_FILTERS``.
+        """
+        keys, query = _waived_query(body, db.session.get_bind().dialect.name)
+        return _waived_response(keys, query.all())
+
+
+def _waivers_by_ids_query(body: GetWaiversByIds):
+    """
+    Returns the distinct IDs of a waivers/+by-ids request, the query for the
+    waivers (without the ID filter) and the fields to serialize them with.
+    """
+    limit = current_app.config['WAIVERS_BY_IDS_LIMIT']
+    if len(body.ids) > limit:
+        raise BadRequest({'ids': f'At most {limit} IDs can be requested at once'})
+    ids = list(dict.fromkeys(body.ids))
+    query, fields = _select_fields(Waiver.query, body.fields, extra_columns=['id'])
+    return ids, query, fields
+
+
+def _waivers_by_ids_response(ids, rows, fields):
+    """
+    Returns the waivers/+by-ids response for given IDs and rows by ID.
+    """
+    return {
+        'data': serialize_waivers([rows[id_] for id_ in ids if id_ in rows], fields),
+        'missing': [id_ for id_ in ids if id_ not in rows],
+    }
+
+
+class WaiversByIdsResource(Resource):
+    @read_replica
+    @etag(waivers_version)
+    @validate()
+    def post(self, body: GetWaiversByIds):
+        """
+        Get waivers with given IDs.
+
+        The waivers are returned in the same order as the IDs in the request
+        (duplicate IDs are returned once). IDs of waivers which do not exist
+        are listed in ``missing``.
+
+        **Sample request**:
+
+        .. sourcecode:: http
+
+           POST /api/v1.0/waivers/+by-ids HTTP/1.1
+           Accept: application/json
+           Content-Type: application/json
+
+           {
+                "ids": [15, 9000, 14],
+                "fields": ["id", "waived", "testcase"]
+           }
+
+        **Sample response**:
+
+        .. sourcecode:: none
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+                "data": [
+                    {"id": 15, "waived": true, "testcase": "compose.install_no_user"},
+                    {"id": 14, "waived": false, "testcase": "dist.rpmlint"}
+                ],
+                "missing": [9000]
+           }
+
+        :json list ids: Waiver IDs, at most ``WAIVERS_BY_IDS_LIMIT`` (1000 by
+            default).
+        :json list fields: Names of waiver fields to return. By default, all
+            fields are returned.
+        :statuscode 200: Returns the waivers and the missing IDs.
+        :statuscode 304: No waiver was created since the response with the
+            ETag given in If-None-Match.
+        :statuscode 400: The request was malformed or contains too many IDs.
+        """
+        ids, query, fields = _waivers_by_ids_query(body)
+        dialect_name = db.session.get_bind().dialect.name
+        rows = {row.id: row for row in query.filter(Waiver.match_ids(ids, dialect_name))}
+        if len(rows) < len(ids) and on_replica():
+            # IDs often come from messages about new waivers, which may not
+            # be on the replica yet
+            with primary_database():
+                missing = [id_ for id_ in ids if id_ not in rows]
+                rows.update((row.id, row)
+                            for row in query.filter(Waiver.match_ids(missing, dialect_name)))
+        return _waivers_by_ids_response(ids, rows, fields)
+
+
+def _wait_for_waivers(fetch, after_id, seconds):
+    """
+    Returns rows from ``fetch(after_id)``, waiting at most ``seconds`` for
+    new waivers if there are none yet.
+    """
+    notifier = current_app.waiver_changes
+    deadline = time.monotonic() + seconds
+    notified_id = after_id
+    while True:
+        rows = fetch(after_id)
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            return rows
+        # If a notified waiver is not visible yet (on a lagging replica),
+        # wait for the next one or for the poll interval
+        timeout = min(remaining, current_app.config['CHANGES_POLL_INTERVAL'])
+        if notifier.wait(notified_id, timeout):
+            notified_id = notifier.last_id
+
+
+def _stream_changes(fetch, after_id, fields):
+    """
+    Returns a stream of Server-Sent Events, one for each new waiver.
+    """
+    config = current_app.config
+    deadline = time.monotonic() + config['CHANGES_STREAM_SECONDS']
+
+    def generate():
+        last_id = after_id
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            rows = _wait_for_waivers(
+                fetch, last_id, min(remaining, config['CHANGES_POLL_INTERVAL']))
+            if not rows:
+                yield ': keepalive\n\n'
+                continue
+            for row in rows:
+                data = json.dumps(serialize_waiver(row, fields))
+                yield f'id: {row.id}\nevent: waiver\ndata: {data}\n\n'
+            last_id = rows[-1].id
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+class WaiverChangesResource(Resource):
+    @read_replica
+    @validate()
+    def get(self, query: GetWaiverChanges):
+        """
+        Get waivers created after the waiver with given ID, in the order of
+        their IDs.
+
+        Clients can follow new waivers by passing ``last_id`` from the
+        previous response as ``after_id``. With ``wait``, the request
+        waits for new waivers if there are none yet (long-polling).
+
+        Clients accepting ``text/event-stream`` receive a stream of
+        Server-Sent Events instead, one ``waiver`` event per waiver with the
+        waiver ID as the event ID. The stream is closed after some time (25
+        seconds by default) and clients reconnect with the ``Last-Event-ID``
+        header, which takes precedence over ``after_id``.
+
+        **Sample request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1.0/waivers/+changes?after_id=14&wait=30 HTTP/1.1
+           Accept: application/json
+
+        **Sample response**:
+
+        .. sourcecode:: none
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+                "data": [
+                    {
+                        "id": 15,
+                        "comment": "The tests broke",
+                        "product_version": "fedora-27",
+                        "subject_type": "compose",
+                        "subject_identifier": "Fedora-9000-19700101.n.18",
+                        "testcase": "compose.install_no_user",
+                        "scenario": null,
+                        "timestamp": "2017-03-16T17:42:04.209638",
+                        "username": "jcline",
+                        "waived": true,
+                        "proxied_by": null
+                    }
+                ],
+                "last_id": 15
+           }
+
+        :query int after_id: Only return waivers with a greater ID.
+        :query int limit: Maximum number of waivers in the response
+            (default 100, at most ``CHANGES_MAX_LIMIT``).
+        :query float wait: Number of seconds to wait for new waivers if there
+            are none yet (default 0, at most ``CHANGES_MAX_WAIT``).
+        :query string fields: Comma-separated names of waiver fields to
+            return. By default or if the value is empty, all fields are
+            returned.
+        :reqheader Accept: ``text/event-stream`` for a stream of events,
+            otherwise ``application/json``.
+        :reqheader Last-Event-ID: ID of the last received waiver, when
+            reconnecting to an event stream.
+        :statuscode 200: Returns new waivers, if any.
+        :statuscode 400: The request was malformed.
+        """
+        config = current_app.config
+        if not 1 <= query.limit <= config['CHANGES_MAX_LIMIT']:
+            raise BadRequest(
+                {'limit': f'Must be between 1 and {config["CHANGES_MAX_LIMIT"]}'})
+        if not 0 <= query.wait <= config['CHANGES_MAX_WAIT']:
+            raise BadRequest(
+                {'wait': f'Must be between 0 and {config["CHANGES_MAX_WAIT"]}'})
+
+        q, fields = _select_fields(
+            Waiver.query, _field_names(query.fields), extra_columns=['id', 'timestamp'])
+        settle_seconds = 0 if config['CHANGES_SERIALIZE_INSERTS'] \
+            else config['CHANGES_SETTLE_SECONDS']
+
+        def fetch(after_id):
+            # The session can be different in a streamed response
+            session = db.session()
+            rows = (q.with_session(session).filter(Waiver.id > after_id)
+                    .order_by(Waiver.id).limit(query.limit).all())
+            # Do not keep the transaction open while waiting
+            session.rollback()
+            return settled_waivers(rows, after_id, settle_seconds)
+
+        mimetype = request.accept_mimetypes.best_match(['application/json', 'text/event-stream'])
+        if mimetype == 'text/event-stream':
+            after_id = query.after_id
+            if 'Last-Event-ID' in request.headers:
+                try:
+                    after_id = int(request.headers['Last-Event-ID'])
+                except ValueError:
+                    raise BadRequest({'Last-Event-ID': 'Must be a waiver ID'})
+            current_app.waiver_changes.listen(db.engine)
+            # The stream is read after read_replica() returns, so it reads
+            # from the primary database
+            return _stream_changes(fetch, after_id, fields)
+
+        if query.wait:
+            current_app.waiver_changes.listen(db.engine)
+        rows = _wait_for_waivers(fetch, query.after_id, query.wait)
+        return {
+            'data': serialize_waivers(rows, fields),
+            'last_id': rows[-1].id if rows else query.after_id,
+        }
+
+
+class SubjectWaiversResource(Resource):
+    def get(self, subject_type, subject_identifier):
+        """
+        Get the most recent waiver for each test case and scenario of a
+        subject, the same waivers as used by :http:post:`/api/v1.0/waivers/+waived`.
+
+        This is meant for gating, which evaluates one subject at a time. The
+        responses are cached for a short time and the cache is invalidated
+        when a waiver is created for the subject. The waivers are always read
+        from the primary database.
+
+        **Sample request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1.0/waivers/+subject/koji_build/gzip-1.9-1.fc28 HTTP/1.1
+
+        **Sample response**:
+
+        .. sourcecode:: none
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+                "subject_type": "koji_build",
+                "subject_identifier": "gzip-1.9-1.fc28",
+                "data": [
+                    {
+                        "id": 15,
+                        "comment": "The tests broke",
+                        "product_version": "fedora-28",
+                        "subject_type": "koji_build",
+                        "subject_identifier": "gzip-1.9-1.fc28",
+                        "testcase": "dist.rpmlint",
+                        "scenario": null,
+                        "timestamp": "2017-03-16T17:42:04.209638",
+                        "username": "jcline",
+                        "waived": true,
+                        "proxied_by": null
+                    }
+                ]
+           }
+
+        :param string subject_type: Subject type, for example ``koji_build``.
+        :param string subject_identifier: Subject identifier, for example an
+            NVR.
+        :statuscode 200: Returns the waivers, sorted by test case and
+            scenario.
+        """
+        cache = current_app.subject_waivers_cache
+        key = (subject_type, subject_identifier)
+        if cache.enabled:
+            cached = cache.get(key)
+            if cached is not None:
+                subject_waivers_cache_hit_counter.inc()
+                return cached
+            subject_waivers_cache_miss_counter.inc()
+        generation = cache.generation
+
+        subject_clauses = [
+            Waiver.subject_type == subject_type,
+            Waiver.subject_identifier == subject_identifier,
+        ]
+        query = Waiver.query.filter(*subject_clauses)
+        query = _filter_out_obsolete_waivers(query, 'result', key_clauses=subject_clauses)
+        query = query.order_by(
+            Waiver.testcase, Waiver.scenario.nulls_first(), Waiver.product_version)
+        query, fields = _select_fields(query, None)
+        result = {
+            'subject_type': subject_type,
+            'subject_identifier': subject_identifier,
+            'data': serialize_waivers(query.all(), fields),
+        }
+        cache.set(key, result, generation=generation)
+        return result
+
+
+class WaiverStatsResource(Resource):
+    @read_replica
+    @etag(waivers_version)
+    @jsonp
+    @validate()
+    def get(self, query: GetWaiverStats):
+        """
+        Get the number of created waivers, grouped by some of their
+        properties and by time.
+
+        The numbers are read from daily statistics updated when waivers are
+        created. They include obsolete waivers.
+
+        **Sample request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1.0/waivers/+stats?group_by=testcase,week&since=2026-10-01 HTTP/1.1
+           Accept: application/json
+
+        **Sample response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+               "data": [
+                   {"week": "2026-09-28", "testcase": "dist.rpmlint", "count": 12},
+                   {"week": "2026-10-05", "testcase": "dist.abicheck", "count": 1},
+                   {"week": "2026-10-05", "testcase": "dist.rpmlint", "count": 7}
+               ]
+           }
+
+        :query string group_by: Comma-separated names of properties to group
+            waivers by: ``subject_type``, ``testcase``, ``product_version``,
+            ``username`` and at most one of the time buckets ``day``, ``week``
+            (starting on Monday) and ``month``. Time buckets are identified by
+            their first day. By default, all waivers are counted together.
+        :query string subject_type: Only count waivers for the given subject type.
+        :query string testcase: Only count waivers for the given test case name.
+        :query string product_version: Only count waivers for the given product version.
+        :query string username: Only count waivers submitted by the given user.
+        :query string since: An ISO 8601 formatted datetime, optionally
+            followed by a comma and the end of the range, as in
+            :http:get:`/api/v1.0/waivers/`. Only the dates are used, so whole
+            days are counted.
+        :statuscode 200: If the query was valid and no problems were encountered.
+        :statuscode 304: No waiver was created since the response with the
+            ETag given in If-None-Match.
+        :statuscode 400: The request was malformed and could not be processed.
+        """
+        names = []
+        if query.group_by:
+            names = [name.strip() for name in query.group_by.split(',')]
+        valid_names = (*WaiverDailyStats.group_columns, *WaiverDailyStats.time_buckets)
+        unknown = [name for name in names if name not in valid_names]
+        if unknown:
+            raise BadRequest({'group_by': f'Unknown properties: {", ".join(unknown)}'})
+        time_buckets = [name for name in names if name in WaiverDailyStats.time_buckets]
+        if len(time_buckets) > 1:
+            raise BadRequest({'group_by': 'At most one time bucket can be used'})
+
+        dialect_name = db.session.get_bind().dialect.name
+        group_by = [
+            WaiverDailyStats.time_bucket(name, dialect_name).label(name)
+            for name in time_buckets
+        ]
+        group_by.extend(
+            getattr(WaiverDailyStats, name)
+            for name in WaiverDailyStats.group_columns if name in names
+        )
+        q = db.session.query(*group_by, func.sum(WaiverDailyStats.count).label('count'))
+        for name in WaiverDailyStats.group_columns:
+            value = getattr(query, name)
+            if value:
+                q = q.filter(getattr(WaiverDailyStats, name) == value)
+        if query.since:
+            since_start, since_end = parse_since(query.since)
+            if since_start:
+                q = q.filter(WaiverDailyStats.day >= since_start.date())
+            if since_end:
+                q = q.filter(WaiverDailyStats.day <= since_end.date())
+        if group_by:
+            q = q.group_by(*group_by).order_by(*group_by)
+
+        data = []
+        for row in q:
+            item = row._asdict()
+            if item['count'] is None:
+                # No waivers at all
+                continue
+            for name in time_buckets:
+                item[name] = item[name].isoformat()
+            data.append(item)
+        return {'data': data}
 
 
 class GetWaiversBySubjectsAndTestcases(Resource):
+    @read_replica
     @jsonp
     @validate()
     def post(self, body: GetWaiversBySubjectAndTestcase):
@@ -595,9 +1303,11 @@ class GetWaiversBySubjectsAndTestcases(Resource):
                 ]
            }
         """
+        check_filter_count('results', len(body.results or []))
         query = Waiver.query.order_by(Waiver.timestamp.desc())
         if body.results:
-            query = Waiver.by_results(query, body.results)
+            query = Waiver.by_results(
+                query, body.results, db.session.get_bind().dialect.name)
         if body.product_version:
             query = query.filter(Waiver.product_version == body.product_version)
         if body.username:
@@ -614,7 +1324,8 @@ class GetWaiversBySubjectsAndTestcases(Resource):
             query = _filter_out_obsolete_waivers(query)
 
         query = query.order_by(Waiver.timestamp.desc())
-        return {'data': marshal(query.all(), waiver_fields)}
+        query, fields = _select_fields(query, body.fields)
+        return {'data': serialize_waivers(query.all(), fields)}
 
 
 class AboutResource(Resource):
@@ -756,6 +1467,12 @@ api.add_resource(WaiversJSResource, '/waivers/new/new_waiver.js')
 api.add_resource(WaiversCreateResource, '/waivers/create')
 api.add_resource(WaiverResource, '/waivers/<int:waiver_id>')
 api.add_resource(FilteredWaiversResource, '/waivers/+filtered')
+api.add_resource(WaivedResource, '/waivers/+waived')
+api.add_resource(WaiversByIdsResource, '/waivers/+by-ids')
+api.add_resource(WaiverChangesResource, '/waivers/+changes')
+api.add_resource(SubjectWaiversResource,
+                 '/waivers/+subject/<subject_type>/<path:subject_identifier>')
+api.add_resource(WaiverStatsResource, '/waivers/+stats')
 api.add_resource(GetWaiversBySubjectsAndTestcases, '/waivers/+by-subjects-and-testcases')
 api.add_resource(AboutResource, '/about', strict_slashes=False)
 api.add_resource(ConfigResource, '/config', strict_slashes=False)
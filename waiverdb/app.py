@@ -18,11 +18,20 @@ from flask_wtf.csrf import CSRFProtect
 from sqlalchemy.exc import ProgrammingError
 import requests
 
-from waiverdb.events import publish_new_waiver
+from waiverdb.cache import Cache
+from waiverdb.changes import ChangeNotifier
+from waiverdb.compression import compress_response
+from waiverdb.events import (
+    forget_new_waivers, limit_statement_duration, lock_new_waiver_ids, notify_new_waivers,
+    publish_new_waiver, record_new_waivers, update_current_waivers, update_waiver_stats,
+    update_waivers_version,
+)
+from waiverdb.limits import cancel_request
 from waiverdb.messaging.publishers import create_publisher
 from waiverdb.tracing import init_tracing
 from waiverdb.api_v1 import api_v1, oidc
 from waiverdb.models import db
+from waiverdb.replicas import replica_binds
 from waiverdb.utils import auth_methods, handle_validation_error, json_error
 from werkzeug.exceptions import default_exceptions
 from waiverdb.monitor import db_hook_event_listeners
@@ -71,24 +80,37 @@ def load_config(app):
         app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
 
 
+def _with_database_password(dburi):
+    # Munge the (optional) DATABASE_PASSWORD from the environment into the URI
+    if not os.environ.get('DATABASE_PASSWORD'):
+        return dburi
+    parsed = urlparse(dburi)
+    netloc = '{}:{}@{}'.format(parsed.username,
+                               os.environ['DATABASE_PASSWORD'],
+                               parsed.hostname)
+    if parsed.port:
+        netloc += ':{}'.format(parsed.port)
+    return urlunsplit(
+        (parsed.scheme, netloc, parsed.path, parsed.query, parsed.fragment))
+
+
 def populate_db_config(app):
     # Take the application-level DATABASE_URI setting, plus (optionally)
     # a DATABASE_PASSWORD from the environment, and munge them together into
     # the SQLALCHEMY_DATABASE_URI setting which is obeyed by Flask-SQLAlchemy.
-    dburi = app.config['DATABASE_URI']
-    if os.environ.get('DATABASE_PASSWORD'):
-        parsed = urlparse(dburi)
-        netloc = '{}:{}@{}'.format(parsed.username,
-                                   os.environ['DATABASE_PASSWORD'],
-                                   parsed.hostname)
-        if parsed.port:
-            netloc += ':{}'.format(parsed.port)
-        dburi = urlunsplit(
-            (parsed.scheme, netloc, parsed.path, parsed.query, parsed.fragment))
+    dburi = _with_database_password(app.config['DATABASE_URI'])
     if app.config['SHOW_DB_URI']:
         app.logger.debug('using DBURI: %s', dburi)
     app.config['SQLALCHEMY_DATABASE_URI'] = dburi
 
+    # Replicas are additional binds, see waiverdb.replicas
+    replica_uris = [_with_database_password(uri) for uri in app.config['REPLICA_DATABASE_URIS']]
+    if replica_uris:
+        app.config['SQLALCHEMY_BINDS'] = {
+            **(app.config.get('SQLALCHEMY_BINDS') or {}),
+            **replica_binds(replica_uris),
+        }
+
 
 # applicaiton factory http://flask.pocoo.org/docs/0.12/patterns/appfactories/
 def create_app(config_obj=None):
@@ -136,7 +158,26 @@ def create_app(config_obj=None):
     app.add_url_rule('/favicon.png', view_func=favicon)
 
     app.publisher = create_publisher(app.config)
+    app.count_cache = Cache(
+        maxsize=app.config['WAIVERS_COUNT_CACHE_SIZE'],
+        ttl=app.config['WAIVERS_COUNT_CACHE_TTL'],
+    )
+    app.filtered_waivers_cache = Cache(
+        maxsize=app.config['FILTERED_WAIVERS_CACHE_SIZE'],
+        ttl=app.config['FILTERED_WAIVERS_CACHE_TTL'],
+    )
+    app.subject_waivers_cache = Cache(
+        maxsize=app.config['SUBJECT_WAIVERS_CACHE_SIZE'],
+        ttl=app.config['SUBJECT_WAIVERS_CACHE_TTL'],
+    )
+    app.waiver_changes = ChangeNotifier()
+    app.waiver_changes.subscribe(app.subject_waivers_cache.invalidate)
+    if app.subject_waivers_cache.enabled:
+        # Receive invalidations of cached responses from other processes
+        with app.app_context():
+            app.waiver_changes.listen(db.engine)
     register_event_handlers(app)
+    app.after_request(compress_response)
 
     # initialize DB event listeners from the monitor module
     with app.app_context():
@@ -191,6 +232,18 @@ def register_event_handlers(app):
         app (flask.Flask): The Flask object with the configured scoped session
             attached as the ``session`` attribute.
     """
+    sqlalchemy.event.listen(db.session, 'after_flush', update_current_waivers)
+    sqlalchemy.event.listen(db.session, 'after_flush', update_waiver_stats)
+    sqlalchemy.event.listen(db.session, 'after_flush', update_waivers_version)
+    sqlalchemy.event.listen(db.session, 'after_flush', record_new_waivers)
+    sqlalchemy.event.listen(db.session, 'after_commit', notify_new_waivers)
+    sqlalchemy.event.listen(db.session, 'after_rollback', forget_new_waivers)
+    sqlalchemy.event.listen(db.session, 'after_begin', limit_statement_duration)
+    with app.app_context():
+        for engine in db.engines.values():
+            sqlalchemy.event.listen(engine, 'handle_error', cancel_request)
+    if app.config['CHANGES_SERIALIZE_INSERTS']:
+        sqlalchemy.event.listen(db.session, 'before_flush', lock_new_waiver_ids)
     if app.config['MESSAGE_BUS_PUBLISH']:
         sqlalchemy.event.listen(db.session, 'after_commit', publish_new_waiver)
 
@@ -0,0 +1,4 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+from waiverdb.asgi_app import create_asgi_app
+app = create_asgi_app()
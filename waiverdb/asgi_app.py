@@ -0,0 +1,374 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+An ASGI application serving the read-only endpoints used by gating services
+with asyncio and async SQLAlchemy, see :func:`create_asgi_app`.
+
+A process waiting for the database does not occupy a worker thread per
+request, so a single process can serve hundreds of concurrent requests (the
+number of concurrently running queries is still limited by the connection
+pool, ``ASGI_DATABASE_POOL_SIZE`` and ``ASGI_DATABASE_MAX_OVERFLOW``).
+
+Requests are parsed, validated and answered by the same code as in the
+Flask application (a Flask request context is pushed for every request), so
+the responses have the same JSON, ETags and errors. Only the database
+statements are executed differently.
+"""
+
+import contextlib
+import io
+import json
+import logging.config as logging_config
+import sys
+
+import sqlalchemy
+from flask import Flask, Response, request
+from flask_pydantic import validate
+from flask_pydantic.exceptions import ValidationError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException, InternalServerError, NotFound, default_exceptions
+from werkzeug.http import quote_etag
+
+from waiverdb.api_v1 import (
+    FILTERED_WAIVERS_HINT, _filtered_waivers_query, _select_fields, _waived_query,
+    _waived_response, _waivers_by_ids_query, _waivers_by_ids_response, api, api_v1)
+from waiverdb.app import load_config, populate_db_config
+from waiverdb.fields import serialize_waiver, serialize_waivers
+from waiverdb.limits import cancel_request, check_row_estimate, explain_rows, set_statement_timeout
+from waiverdb.models import Waiver, db
+from waiverdb.models.requests import FilterWaivers, GetWaived, GetWaiversByIds
+from waiverdb.monitor import db_hook_event_listeners
+from waiverdb.utils import (
+    WAIVERS_VERSION, compute_etag, handle_validation_error, json_error, jsonp
+)
+
+# Database backend -> asyncio driver
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite',
+}
+
+# Number of rows fetched at once for streamed responses
+STREAM_BATCH_SIZE = 1000
+
+
+def async_database_url(uri):
+    """
+    Returns the URL of the database ``uri`` with the driver replaced by the
+    asyncio driver for the database.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'The ASGI application does not support {backend} databases')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def _wsgi_environ(scope, body):
+    """
+    Returns the WSGI environment for the HTTP request given by the ASGI
+    ``scope`` and the request ``body``.
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+def _response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers.items()
+        ],
+    }
+
+
+class _StreamedResponse:
+    """
+    A response with the status and headers of ``response`` and a body
+    produced by the ``chunks`` async iterator.
+    """
+    def __init__(self, response, chunks):
+        self.response = response
+        self.chunks = chunks
+
+    async def send(self, send):
+        await send(_response_start(self.response.status_code, self.response.headers))
+        async for chunk in self.chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _send_response(send, response):
+    if isinstance(response, _StreamedResponse):
+        await response.send(send)
+        return
+    # Headers are fixed as by WSGI servers, for example there is no
+    # Content-Type in 304 responses
+    headers = response.get_wsgi_headers(request.environ)
+    await send(_response_start(response.status_code, headers))
+    body = b''.join(response.get_app_iter(request.environ))
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _request_body(model):
+    """
+    Returns the request body parsed and validated as in the Flask
+    application (by ``flask_pydantic.validate``).
+    """
+    def parse(body):
+        # Wrapped, so the model is not turned into a response
+        return [body]
+    parse.__annotations__ = {'body': model}
+
+    rv = validate()(parse)()
+    if isinstance(rv, Response):
+        # Unsupported media type
+        raise HTTPException(response=rv)
+    return rv[0]
+
+
+async def _check_etag(connection, versioned=True):
+    """
+    Returns the ETag of the response to the current request (see
+    :func:`waiverdb.utils.etag`) and a 304 response if it matches the
+    If-None-Match header, otherwise None.
+    """
+    version = await connection.scalar(WAIVERS_VERSION) if versioned else None
+    tag = compute_etag(
+        version,
+        request.method,
+        request.full_path,
+        request.get_data(as_text=True),
+        request.headers.get('Accept'),
+        request.headers.get('Accept-Encoding'),
+    )
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+        response.set_etag(tag)
+        return tag, response
+    return tag, None
+
+
+def _json_response(data, tag):
+    if isinstance(data, Response):
+        data.set_etag(tag)
+        return data
+    return api.make_response(data, 200, {'ETag': quote_etag(tag)})
+
+
+class AsgiApp:
+    """
+    The ASGI application. ``flask_app`` is the Flask application providing
+    the configuration and request contexts.
+    """
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        url = async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+        options = {}
+        if url.get_backend_name() == 'postgresql':
+            options = {
+                'pool_size': config['ASGI_DATABASE_POOL_SIZE'],
+                'max_overflow': config['ASGI_DATABASE_MAX_OVERFLOW'],
+                'pool_pre_ping': True,
+            }
+        self.engine = create_async_engine(url, **options)
+        sqlalchemy.event.listen(self.engine.sync_engine, 'handle_error', cancel_request)
+        db_hook_event_listeners(self.engine.sync_engine)
+
+        self.handlers = {
+            'healthcheck': self.healthcheck,
+            'api_v1.waiver_resource': self.get_waiver,
+            'api_v1.filtered_waivers_resource': self.filtered_waivers,
+            'api_v1.waived_resource': self.waived,
+            'api_v1.waivers_by_ids_resource': self.waivers_by_ids,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = await _read_body(receive)
+        with self.flask_app.request_context(_wsgi_environ(scope, body)):
+            async with contextlib.AsyncExitStack() as stack:
+                try:
+                    response = await self._dispatch(stack)
+                except Exception as e:
+                    response = self._error_response(e)
+                # Streamed responses read from the connection while sending
+                await _send_response(send, response)
+
+    async def _dispatch(self, stack):
+        if request.routing_exception is not None:
+            self.flask_app.raise_routing_exception(request)
+        rule = request.url_rule
+        if request.method == 'OPTIONS' and getattr(rule, 'provide_automatic_options', False):
+            return self.flask_app.make_default_options_response()
+        handler = self.handlers.get(request.endpoint)
+        if handler is None:
+            raise NotFound('This endpoint is not served by the read-only ASGI application.')
+
+        connection = await stack.enter_async_context(self.engine.connect())
+        await connection.run_sync(set_statement_timeout)
+        return await handler(connection)
+
+    def _error_response(self, error):
+        """
+        Returns the error response as the Flask application would.
+        """
+        if not isinstance(error, (HTTPException, ValidationError)):
+            self.flask_app.log_exception(sys.exc_info())
+            return api.make_response({'message': InternalServerError.description}, 500)
+        # Runs the error handlers of flask_restx and the Flask application
+        return self.flask_app.make_response(self.flask_app.handle_user_exception(error))
+
+    async def healthcheck(self, connection):
+        await connection.execute(sqlalchemy.text('SELECT 1 FROM waiver LIMIT 0'))
+        return Response('Health check OK', 200, [('Content-Type', 'text/plain')])
+
+    async def get_waiver(self, connection):
+        tag, not_modified = await _check_etag(connection, versioned=False)
+        if not_modified:
+            return not_modified
+
+        waiver_id = request.view_args['waiver_id']
+        query, fields = _select_fields(Waiver.query.filter(Waiver.id == waiver_id), None)
+        row = (await connection.execute(query.statement)).first()
+        if row is None:
+            raise NotFound('Waiver not found')
+        return _json_response(jsonp(lambda: serialize_waiver(row, fields))(), tag)
+
+    async def filtered_waivers(self, connection):
+        tag, not_modified = await _check_etag(connection)
+        if not_modified:
+            return not_modified
+
+        body = _request_body(FilterWaivers)
+        query, fields = _filtered_waivers_query(body, self.engine.dialect.name)
+        mimetype = request.accept_mimetypes.best_match(
+            ['application/json', 'application/x-ndjson'])
+        if mimetype == 'application/x-ndjson':
+            return await self._stream_ndjson(connection, query.statement, fields, tag)
+
+        if self.flask_app.config['QUERY_MAX_ESTIMATED_ROWS'] is not None:
+            rows = await connection.run_sync(explain_rows, query.statement)
+            check_row_estimate(rows, FILTERED_WAIVERS_HINT)
+        rows = (await connection.execute(query.statement)).all()
+        return _json_response({'data': serialize_waivers(rows, fields)}, tag)
+
+    async def _stream_ndjson(self, connection, statement, fields, tag):
+        # Execute the query before the response starts, so errors are
+        # reported with a proper status code
+        result = await connection.stream(statement)
+
+        async def generate():
+            async for rows in result.partitions(STREAM_BATCH_SIZE):
+                yield ''.join(
+                    json.dumps(serialize_waiver(row, fields)) + '\n' for row in rows
+                ).encode('utf-8')
+
+        response = Response(mimetype='application/x-ndjson')
+        response.set_etag(tag)
+        return _StreamedResponse(response, generate())
+
+    async def waived(self, connection):
+        tag, not_modified = await _check_etag(connection)
+        if not_modified:
+            return not_modified
+
+        body = _request_body(GetWaived)
+        keys, query = _waived_query(body, self.engine.dialect.name)
+        rows = (await connection.execute(query.statement)).all()
+        return _json_response(_waived_response(keys, rows), tag)
+
+    async def waivers_by_ids(self, connection):
+        tag, not_modified = await _check_etag(connection)
+        if not_modified:
+            return not_modified
+
+        body = _request_body(GetWaiversByIds)
+        ids, query, fields = _waivers_by_ids_query(body)
+        query = query.filter(Waiver.match_ids(ids, self.engine.dialect.name))
+        rows = {row.id: row for row in await connection.execute(query.statement)}
+        return _json_response(_waivers_by_ids_response(ids, rows, fields), tag)
+
+
+def create_asgi_app(config_obj=None):
+    """
+    Creates the ASGI application, configured like the Flask application
+    created by :func:`waiverdb.app.create_app`.
+    """
+    flask_app = Flask(__name__)
+    if config_obj:
+        flask_app.config.from_object(config_obj)
+    else:
+        load_config(flask_app)
+    logging_config.dictConfig(flask_app.config['LOGGING'])
+
+    for code in default_exceptions.keys():
+        flask_app.register_error_handler(code, json_error)
+    flask_app.register_error_handler(ValidationError, handle_validation_error)
+
+    populate_db_config(flask_app)
+    db.init_app(flask_app)
+    # Routes requests to the same endpoints as the Flask application
+    flask_app.register_blueprint(api_v1, url_prefix='/api/v1.0')
+    flask_app.add_url_rule('/healthcheck', endpoint='healthcheck')
+    return AsgiApp(flask_app)
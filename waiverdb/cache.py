@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+In-process caches for expensive, frequently repeated read queries.
+
+Every worker process has its own caches, so anything stored here must either
+expire quickly or be validated against the database before it is used.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class Cache:
+    """
+    A small thread-safe LRU cache with optional expiration.
+
+    Args:
+        maxsize (int): Maximum number of entries. The least recently used
+            entry is evicted when the cache is full. Zero disables the cache.
+        ttl (float): Number of seconds after which an entry expires, or
+            ``None`` if entries never expire.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented by invalidate(), see set()
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation=None):
+        """
+        Stores the value, unless ``generation`` is given and some entries were
+        invalidated since it was read from :attr:`generation` (so the value
+        could be computed from data older than the invalidation).
+        """
+        if not self.enabled:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def invalidate(self, keys=None):
+        """
+        Removes entries with given keys, or all entries if ``keys`` is None.
+        """
+        with self._lock:
+            self.generation += 1
+            if keys is None:
+                self._data.clear()
+            else:
+                for key in keys:
+                    self._data.pop(key, None)
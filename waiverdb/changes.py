@@ -0,0 +1,183 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Notifications about new waivers for the waivers/+changes feed and for
+invalidating cached waivers.
+
+Every worker process has a :class:`ChangeNotifier` which knows the ID of the
+most recent committed waiver, wakes up requests waiting for newer ones and
+tells subscribers (caches) the subjects of new waivers.
+Commits in the same process notify it directly (see
+:func:`waiverdb.events.notify_new_waivers`). Commits in other processes are
+received with PostgreSQL LISTEN/NOTIFY by a background thread, which is
+started by the first waiting request.
+
+Clients read the feed by waiver ID, so a waiver committed after a waiver
+with a greater ID could be skipped. The feed does not move past a gap in
+waiver IDs until the waiver after the gap is a few seconds old (see
+:func:`settled_waivers`). Alternatively, with ``CHANGES_SERIALIZE_INSERTS``,
+transactions creating waivers on PostgreSQL take an advisory lock before the
+IDs are allocated and hold it until they commit, so waivers become visible in
+the order of their IDs.
+"""
+
+import datetime
+import json
+import logging
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from waiverdb.models.waivers import utcnow_naive
+
+log = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'waiverdb_new_waiver'
+# Key of the advisory lock serializing transactions which create waivers
+INSERT_LOCK_KEY = 0x77616976  # "waiv"
+
+# Maximum size of notification payloads (PostgreSQL allows less than 8000
+# bytes); with more new subjects, subscribers are told that any subject
+# could have changed
+MAX_PAYLOAD_SIZE = 7000
+
+# Number of seconds before reconnecting after the listener fails
+LISTENER_RETRY_DELAY = 5
+
+
+def lock_waiver_ids(connection):
+    """
+    Waits until other transactions creating waivers finish, so waivers are
+    committed in the order of their IDs (PostgreSQL only).
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': INSERT_LOCK_KEY})
+
+
+def settled_waivers(rows, after_id, settle_seconds):
+    """
+    Returns ``rows`` (ordered by ID) up to the first gap in waiver IDs after
+    ``after_id`` which is followed by a waiver created less than
+    ``settle_seconds`` ago.
+
+    The missing waivers could still be committed by transactions in
+    progress. Gaps which never fill (for example, after rolled back
+    transactions) delay the feed only until the waiver after them is old
+    enough.
+    """
+    settled = utcnow_naive() - datetime.timedelta(seconds=settle_seconds)
+    previous_id = after_id
+    for i, row in enumerate(rows):
+        if row.id != previous_id + 1 and row.timestamp > settled:
+            return rows[:i]
+        previous_id = row.id
+    return rows
+
+
+def notify_other_processes(connection, waiver_id, subjects):
+    """
+    Sends the ID of the most recent new waiver and the subjects of new
+    waivers to the listeners in other processes when the current transaction
+    is committed (PostgreSQL only).
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    payload = json.dumps({'id': waiver_id, 'subjects': sorted(subjects)})
+    if len(payload.encode('utf-8')) > MAX_PAYLOAD_SIZE:
+        payload = json.dumps({'id': waiver_id, 'subjects': None})
+    connection.execute(
+        text('SELECT pg_notify(:channel, :payload)'),
+        {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+
+class ChangeNotifier:
+    """
+    Lets threads wait for waivers newer than a given ID.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self._condition = threading.Condition()
+        self._listener = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """
+        Calls ``callback(subjects)`` after waivers are created, with a set of
+        (subject type, subject identifier) tuples of the new waivers, or
+        ``None`` if the subjects are not known.
+        """
+        self._subscribers.append(callback)
+
+    def notify(self, waiver_id, subjects=None):
+        """
+        Wakes up threads waiting for waivers older than ``waiver_id`` and
+        tells subscribers about new waivers for ``subjects``.
+        """
+        with self._condition:
+            if waiver_id > self.last_id:
+                self.last_id = waiver_id
+                self._condition.notify_all()
+        for callback in self._subscribers:
+            callback(subjects)
+
+    def wait(self, after_id, timeout):
+        """
+        Waits for at most ``timeout`` seconds until a waiver newer than
+        ``after_id`` is committed.
+
+        Returns True if there is such a waiver.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.last_id > after_id, timeout)
+
+    def listen(self, engine):
+        """
+        Starts receiving notifications from other processes, unless already
+        started or the database is not PostgreSQL.
+        """
+        if engine.dialect.name != 'postgresql':
+            return
+        with self._condition:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, args=(engine,), name='waiverdb-changes', daemon=True)
+            self._listener.start()
+
+    def _listen(self, engine):
+        # Use a separate connection, so the listener does not take one from
+        # the connection pool
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        while True:
+            try:
+                connection = engine.dialect.connect(*cargs, **cparams)
+            except Exception:
+                log.exception('Failed to connect for %s notifications', NOTIFY_CHANNEL)
+                time.sleep(LISTENER_RETRY_DELAY)
+                continue
+
+            try:
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                    # Catch up with waivers committed while not listening
+                    # (of unknown subjects)
+                    cursor.execute('SELECT max(id) FROM waiver')
+                    self.notify(cursor.fetchone()[0] or 0)
+                while True:
+                    select.select([connection], [], [])
+                    connection.poll()
+                    for notification in connection.notifies:
+                        payload = json.loads(notification.payload)
+                        subjects = payload['subjects']
+                        if subjects is not None:
+                            subjects = {tuple(subject) for subject in subjects}
+                        self.notify(payload['id'], subjects)
+                    connection.notifies.clear()
+            except Exception:
+                log.exception('Lost connection for %s notifications', NOTIFY_CHANNEL)
+                time.sleep(LISTENER_RETRY_DELAY)
+            finally:
+                connection.close()
@@ -0,0 +1,135 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Compression of responses negotiated with the ``Accept-Encoding`` header.
+
+Supports gzip and, if the zstandard package is installed, zstd. Streamed
+responses are compressed on the fly, see :func:`compress_response`.
+"""
+
+import time
+import zlib
+
+from flask import current_app, request
+
+from waiverdb.monitor import (
+    response_compression_ratio_histogram, response_compression_seconds_histogram)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/html',
+    'text/plain',
+])
+
+# Number of uncompressed bytes of a streamed response after which the
+# compressed data are flushed to the client
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+class _Gzip:
+    sync_flush = zlib.Z_SYNC_FLUSH
+
+    @staticmethod
+    def compressor(level):
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class _Zstd:
+    sync_flush = getattr(zstandard, 'COMPRESSOBJ_FLUSH_BLOCK', None)
+
+    @staticmethod
+    def compressor(level):
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+# Encoding -> (codec, config option with the compression level)
+ENCODINGS = {
+    'gzip': (_Gzip, 'COMPRESSION_GZIP_LEVEL'),
+}
+if zstandard is not None:
+    ENCODINGS['zstd'] = (_Zstd, 'COMPRESSION_ZSTD_LEVEL')
+
+
+def _observe(encoding, size, compressed_size, seconds):
+    if compressed_size:
+        response_compression_ratio_histogram.labels(encoding).observe(size / compressed_size)
+    response_compression_seconds_histogram.labels(encoding).observe(seconds)
+
+
+def _compress_stream(chunks, encoding, compressor, sync_flush):
+    size = compressed_size = pending = 0
+    seconds = 0.0
+    for chunk in chunks:
+        start = time.perf_counter()
+        data = compressor.compress(chunk)
+        size += len(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            data += compressor.flush(sync_flush)
+            pending = 0
+        seconds += time.perf_counter() - start
+        if data:
+            compressed_size += len(data)
+            yield data
+
+    start = time.perf_counter()
+    data = compressor.flush()
+    seconds += time.perf_counter() - start
+    compressed_size += len(data)
+    _observe(encoding, size, compressed_size, seconds)
+    yield data
+
+
+def compress_response(response):
+    """
+    Compresses the response body with the best encoding accepted by the
+    client, if the body is larger than ``COMPRESSION_MIN_SIZE``.
+
+    Streamed responses are always compressed; the compressed data are flushed
+    after every ``STREAM_FLUSH_SIZE`` bytes of input.
+    """
+    encodings = [
+        encoding for encoding in current_app.config['COMPRESSION_ENCODINGS']
+        if encoding in ENCODINGS
+    ]
+    if (not encodings
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding is None or request.method == 'HEAD':
+        return response
+
+    codec, level_option = ENCODINGS[encoding]
+    compressor = codec.compressor(current_app.config[level_option])
+
+    if response.is_streamed:
+        chunks = response.response
+        response.response = _compress_stream(
+            response.iter_encoded(), encoding, compressor, codec.sync_flush)
+        if hasattr(chunks, 'close'):
+            response.call_on_close(chunks.close)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESSION_MIN_SIZE']:
+            return response
+
+        start = time.perf_counter()
+        compressed = compressor.compress(data) + compressor.flush()
+        _observe(encoding, len(data), len(compressed), time.perf_counter() - start)
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -50,6 +50,83 @@ class Config(object):
     PERMISSIONS = []
     # Deprecated permission mapping
     PERMISSION_MAPPING = {}
+    # How obsolete waivers are filtered out: "subquery" finds the most recent
+    # waivers on every query, "projection" joins the table of current waivers
+    # maintained on insert (run "waiverdb rebuild-current-waivers" before
+    # switching to it, see the admin guide)
+    OBSOLETE_WAIVERS_FILTER = 'subquery'
+    # Number of seconds a waiver count is reused by requests with count=estimate
+    WAIVERS_COUNT_CACHE_TTL = 60
+    WAIVERS_COUNT_CACHE_SIZE = 1024
+    # Responses of waivers/+filtered are reused until a new waiver is created
+    # or for at most the given number of seconds
+    FILTERED_WAIVERS_CACHE_SIZE = 1024
+    FILTERED_WAIVERS_CACHE_TTL = 300
+    # Responses of waivers/+subject are reused until a waiver is created for
+    # the subject or for at most the given number of seconds (other processes
+    # are notified about new waivers only on PostgreSQL)
+    SUBJECT_WAIVERS_CACHE_SIZE = 4096
+    SUBJECT_WAIVERS_CACHE_TTL = 30
+    # Maximum number of waiver IDs in a waivers/+by-ids request
+    WAIVERS_BY_IDS_LIMIT = 1000
+    # Maximum number of waivers in a waivers/+changes response
+    CHANGES_MAX_LIMIT = 1000
+    # Maximum number of seconds a waivers/+changes request waits for new
+    # waivers (each waiting request occupies a worker thread; keep this below
+    # the worker timeout)
+    CHANGES_MAX_WAIT = 25
+    # Number of seconds after which waiting requests check the database even
+    # if they were not notified about new waivers; also the interval of
+    # keepalive comments in event streams
+    CHANGES_POLL_INTERVAL = 5
+    # Number of seconds after which an event stream is closed (clients
+    # reconnect with the Last-Event-ID header); streams longer than the worker
+    # timeout need a threaded or asynchronous worker class
+    CHANGES_STREAM_SECONDS = 25
+    # Set to True to make transactions creating waivers wait for each other
+    # (PostgreSQL only), so the feed never has to wait for gaps in waiver IDs
+    # to fill; this serializes all inserts
+    CHANGES_SERIALIZE_INSERTS = False
+    # Number of seconds the feed waits for a gap in waiver IDs to fill before
+    # returning the waivers after it
+    CHANGES_SETTLE_SECONDS = 5
+    # Number of seconds after which database statements run by a request are
+    # canceled and the request fails with 503 (PostgreSQL only); 0 disables
+    # the timeout
+    STATEMENT_TIMEOUT = 30
+    # Endpoint name -> statement timeout overriding STATEMENT_TIMEOUT
+    STATEMENT_TIMEOUTS = {
+        'api_v1.waivers_resource': 10,
+        'api_v1.filtered_waivers_resource': 10,
+        'api_v1.waived_resource': 5,
+        'api_v1.get_waivers_by_subjects_and_testcases': 10,
+    }
+    # If set, requests with more filters (waivers/+filtered) or keys
+    # (waivers/+waived) are rejected with 413
+    QUERY_MAX_FILTERS = None
+    # If set, waivers/+filtered requests and exact waiver counts for which
+    # PostgreSQL estimates more matching rows are rejected with 413
+    QUERY_MAX_ESTIMATED_ROWS = None
+    # Connection pool of the read-only ASGI application (waiverdb.asgi:app);
+    # requests over the pool size wait for a free connection
+    ASGI_DATABASE_POOL_SIZE = 20
+    ASGI_DATABASE_MAX_OVERFLOW = 10
+    # Read-only requests are sent to one of these database replicas, if any
+    REPLICA_DATABASE_URIS = []
+    # Number of seconds a client reads from the primary database after it
+    # creates a waiver, so it does not miss it on a lagging replica
+    READ_YOUR_WRITES_SECONDS = 10
+    # Number of seconds a replica is not used after a connection error
+    REPLICA_RETRY_INTERVAL = 30
+    # Responses are compressed with the first of these encodings accepted by
+    # the client ("zstd" needs the zstandard package); set to an empty list to
+    # leave compression to a proxy
+    COMPRESSION_ENCODINGS = ['zstd', 'gzip']
+    # Responses smaller than this number of bytes are not compressed (streamed
+    # responses are always compressed)
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_ZSTD_LEVEL = 3
     OTEL_EXPORTER_OTLP_METRICS_ENDPOINT = None
     OTEL_EXPORTER_SERVICE_NAME = "waiverdb"
 
@@ -131,5 +208,8 @@ class TestingConfig(Config):
     )
     OIDC_RESOURCE_SERVER_ONLY = True
     SUPERUSERS = ['bodhi']
+    # Tests reuse waiver IDs after wiping the database
+    FILTERED_WAIVERS_CACHE_SIZE = 0
+    SUBJECT_WAIVERS_CACHE_SIZE = 0
 
     CORS_ORIGINS = 'https://bodhi.fedoraproject.org'
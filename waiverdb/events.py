@@ -10,9 +10,14 @@ using the :func:`sqlalchemy.event.listen` function.
 """
 
 import logging
+import random
 
 from flask import current_app
 
+from waiverdb.changes import lock_waiver_ids, notify_other_processes
+from waiverdb.limits import set_statement_timeout
+from waiverdb.models import CurrentWaiver, Waiver, WaiverDailyStats, WaiversVersion
+
 _log = logging.getLogger(__name__)
 
 
@@ -35,3 +40,174 @@ def publish_new_waiver(session):
         current_app.config["MESSAGE_PUBLISHER"],
     )
     current_app.publisher.publish_new_waiver(session)
+
+
+def update_current_waivers(session, flush_context):
+    """
+    A post-flush event hook that keeps the current waivers projection up to
+    date.
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_flush', update_current_waivers)
+
+    The projection is updated on the same connection, so it is committed or
+    rolled back together with the new waivers. It is updated even if queries
+    do not use it (see ``OBSOLETE_WAIVERS_FILTER``), so it stays complete
+    after it is rebuilt once.
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was flushed.
+        flush_context (sqlalchemy.orm.UOWTransaction): Internal state of the
+            flush.
+    """
+    waivers = [obj for obj in session.new if isinstance(obj, Waiver)]
+    if waivers:
+        CurrentWaiver.update(session.connection(), waivers)
+
+
+def update_waiver_stats(session, flush_context):
+    """
+    A post-flush event hook that counts new waivers in the daily statistics.
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_flush', update_waiver_stats)
+
+    The statistics are updated on the same connection, so they are committed
+    or rolled back together with the new waivers.
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was flushed.
+        flush_context (sqlalchemy.orm.UOWTransaction): Internal state of the
+            flush.
+    """
+    waivers = [obj for obj in session.new if isinstance(obj, Waiver)]
+    if waivers:
+        WaiverDailyStats.update(session.connection(), waivers)
+
+
+def update_waivers_version(session, flush_context):
+    """
+    A post-flush event hook that changes the version of the waivers used for
+    ETags and cached responses (see :func:`waiverdb.utils.waivers_version`).
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_flush', update_waivers_version)
+
+    Each session always increments the same shard of the counters, so a
+    transaction locks at most one of them.
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was flushed.
+        flush_context (sqlalchemy.orm.UOWTransaction): Internal state of the
+            flush.
+    """
+    if any(isinstance(obj, Waiver) for obj in session.new):
+        shard = session.info.setdefault(
+            'waivers_version_shard', random.randrange(WaiversVersion.shards))  # nosec
+        WaiversVersion.increment(session.connection(), shard)
+
+
+def lock_new_waiver_ids(session, flush_context, instances):
+    """
+    A pre-flush event hook that makes transactions creating waivers wait for
+    each other, so waivers are committed in the order of their IDs (see
+    :mod:`waiverdb.changes`).
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'before_flush', lock_new_waiver_ids)
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that is being flushed.
+        flush_context (sqlalchemy.orm.UOWTransaction): Internal state of the
+            flush.
+        instances: Deprecated, always None.
+    """
+    if any(isinstance(obj, Waiver) for obj in session.new):
+        lock_waiver_ids(session.connection())
+
+
+def record_new_waivers(session, flush_context):
+    """
+    A post-flush event hook that remembers the most recent new waiver for
+    :func:`notify_new_waivers` and notifies other processes about it once the
+    transaction is committed.
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_flush', record_new_waivers)
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was flushed.
+        flush_context (sqlalchemy.orm.UOWTransaction): Internal state of the
+            flush.
+    """
+    waivers = [obj for obj in session.new if isinstance(obj, Waiver)]
+    if waivers:
+        waiver_id = max([waiver.id for waiver in waivers]
+                        + [session.info.get('new_waiver_id', 0)])
+        subjects = {(waiver.subject_type, waiver.subject_identifier) for waiver in waivers}
+        session.info['new_waiver_id'] = waiver_id
+        session.info.setdefault('new_waiver_subjects', set()).update(subjects)
+        notify_other_processes(session.connection(), waiver_id, subjects)
+
+
+def notify_new_waivers(session):
+    """
+    A post-commit event hook that wakes up requests in this process waiting
+    for new waivers and invalidates cached waivers of their subjects.
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_commit', notify_new_waivers)
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was committed to the
+            database. This session is not active and cannot emit SQL.
+    """
+    waiver_id = session.info.pop('new_waiver_id', None)
+    subjects = session.info.pop('new_waiver_subjects', None)
+    if waiver_id is not None:
+        current_app.waiver_changes.notify(waiver_id, subjects)
+
+
+def limit_statement_duration(session, transaction, connection):
+    """
+    A post-begin event hook that sets the statement timeout for the current
+    request in each transaction (see :mod:`waiverdb.limits`).
+
+    This event is designed to be registered with a session factory::
+
+        >>> from sqlalchemy.event import listen
+        >>> listen(MyScopedSession, 'after_begin', limit_statement_duration)
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that began the
+            transaction.
+        transaction (sqlalchemy.orm.SessionTransaction): The new transaction.
+        connection (sqlalchemy.engine.Connection): The connection used by the
+            transaction (there is one for the primary database and each
+            replica).
+    """
+    set_statement_timeout(connection)
+
+
+def forget_new_waivers(session):
+    """
+    A post-rollback event hook that forgets new waivers recorded by
+    :func:`record_new_waivers`.
+
+    Args:
+        session (sqlalchemy.orm.Session): The session that was rolled back.
+    """
+    session.info.pop('new_waiver_id', None)
+    session.info.pop('new_waiver_subjects', None)
@@ -0,0 +1,140 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Limits on the database work done by a single request.
+
+On PostgreSQL, every transaction started while handling a request sets
+``statement_timeout`` (``STATEMENT_TIMEOUT`` seconds, overridden for some
+endpoints with ``STATEMENT_TIMEOUTS``), so a pathological query cannot hold a
+pooled connection for minutes. Canceled statements fail the request with 503
+Service Unavailable.
+
+Optionally, requests with more filters than ``QUERY_MAX_FILTERS`` and queries
+expected by the PostgreSQL planner to return more rows than
+``QUERY_MAX_ESTIMATED_ROWS`` are rejected with 413 Request Entity Too Large
+before they run.
+"""
+
+import json
+
+from flask import current_app, has_request_context, request
+from werkzeug.exceptions import RequestEntityTooLarge, ServiceUnavailable
+
+from waiverdb.monitor import query_rejected_counter, query_timeout_counter
+
+# SQLSTATE of errors raised when a statement is canceled, for example after
+# statement_timeout expires
+QUERY_CANCELED = '57014'
+
+
+def statement_timeout(endpoint=None):
+    """
+    Returns the statement timeout in seconds for the given endpoint (by
+    default, the endpoint of the current request), or None if statements
+    should not be limited.
+    """
+    if endpoint is None:
+        if not has_request_context():
+            return None
+        endpoint = request.endpoint
+    config = current_app.config
+    timeout = config['STATEMENT_TIMEOUTS'].get(endpoint, config['STATEMENT_TIMEOUT'])
+    return timeout or None
+
+
+def set_statement_timeout(connection, endpoint=None):
+    """
+    Limits the duration of statements in the current transaction of
+    ``connection`` (PostgreSQL only), see :func:`statement_timeout`.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    timeout = statement_timeout(endpoint)
+    if timeout is not None:
+        milliseconds = max(1, int(timeout * 1000))
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {milliseconds}')
+
+
+def query_canceled_error(error):
+    """
+    Returns the 503 error for the request if the DBAPI ``error`` means that
+    a statement was canceled, otherwise None.
+    """
+    if getattr(error, 'pgcode', None) != QUERY_CANCELED:
+        return None
+    query_timeout_counter.inc()
+    return ServiceUnavailable(
+        'The database query took too long. Try again with more specific '
+        'filters or request fewer waivers at once.')
+
+
+def cancel_request(context):
+    """
+    A ``handle_error`` engine event hook which turns statements canceled
+    during a request into 503 responses instead of internal server errors.
+
+    Returning a new exception also keeps :func:`waiverdb.replicas.read_replica`
+    from treating the timeout as a failure of the replica.
+    """
+    if not has_request_context():
+        return None
+    return query_canceled_error(context.original_exception)
+
+
+def check_filter_count(name, count):
+    """
+    Rejects the request if its parameter ``name`` contains more than
+    ``QUERY_MAX_FILTERS`` items.
+    """
+    limit = current_app.config['QUERY_MAX_FILTERS']
+    if limit is not None and count > limit:
+        query_rejected_counter.inc()
+        raise RequestEntityTooLarge({name: f'At most {limit} items can be requested at once'})
+
+
+def explain_rows(connection, statement):
+    """
+    Returns the number of rows the PostgreSQL planner expects ``statement``
+    to return on ``connection``, or None on other databases.
+    """
+    if connection.dialect.name != 'postgresql':
+        return None
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), params).scalar()
+    if isinstance(plan, str):
+        # Not decoded by some drivers
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def estimated_rows(query):
+    """
+    Returns the number of rows the PostgreSQL planner expects ``query`` to
+    return, or None on other databases.
+    """
+    return explain_rows(query.session.connection(), query.statement)
+
+
+def check_estimated_rows(query, hint):
+    """
+    Rejects the request if ``query`` is expected to return more than
+    ``QUERY_MAX_ESTIMATED_ROWS`` rows. The ``hint`` is added to the error
+    message.
+    """
+    if current_app.config['QUERY_MAX_ESTIMATED_ROWS'] is not None:
+        check_row_estimate(estimated_rows(query), hint)
+
+
+def check_row_estimate(rows, hint):
+    """
+    Rejects the request if the estimated number of ``rows`` (see
+    :func:`explain_rows`) is over ``QUERY_MAX_ESTIMATED_ROWS``.
+    """
+    limit = current_app.config['QUERY_MAX_ESTIMATED_ROWS']
+    if limit is not None and rows is not None and rows > limit:
+        query_rejected_counter.inc()
+        raise RequestEntityTooLarge(
+            f'The query would read about {rows} waivers, more than the limit of {limit}. {hint}')
@@ -5,7 +5,8 @@ import click
 from flask.cli import FlaskGroup
 from sqlalchemy.exc import OperationalError
 from waiverdb.app import create_app
-from waiverdb.models import db
+from waiverdb.models import db, CurrentWaiver, WaiverDailyStats
+from waiverdb.partitions import create_partitions
 
 
 @click.group(cls=FlaskGroup, create_app=create_app)
@@ -31,5 +32,40 @@ def wait_for_db():
             break
 
 
+@cli.command(name='rebuild-current-waivers')
+def rebuild_current_waivers():
+    """
+    Rebuild the table of current waivers used to filter out obsolete waivers.
+    """
+    CurrentWaiver.rebuild(db.session.connection())
+    db.session.commit()
+    click.echo('Current waivers rebuilt.')
+
+
+@cli.command(name='rebuild-waiver-stats')
+def rebuild_waiver_stats():
+    """
+    Rebuild the daily waiver statistics from all waivers.
+    """
+    WaiverDailyStats.rebuild(db.session.connection())
+    db.session.commit()
+    click.echo('Waiver statistics rebuilt.')
+
+
+@cli.command(name='create-waiver-partitions')
+@click.option('--months', default=3, show_default=True,
+              help='Number of months after the current one to create partitions for.')
+def create_waiver_partitions(months):
+    """
+    Create missing monthly partitions of the waiver table (PostgreSQL only).
+    """
+    created = create_partitions(db.session.connection(), months_ahead=months)
+    db.session.commit()
+    for name in created:
+        click.echo(f'Created partition {name}.')
+    if not created:
+        click.echo('All partitions already exist.')
+
+
 if __name__ == '__main__':
     cli()  # pylint: disable=E1120
@@ -4,11 +4,10 @@ import logging
 
 from fedora_messaging.api import Message, publish
 from fedora_messaging.exceptions import ConnectionException, PublishReturned
-from flask_restx import marshal
 from sqlalchemy.orm import Session
 
 import waiverdb.monitor as monitor
-from waiverdb.fields import waiver_fields
+from waiverdb.fields import serialize_waiver
 from waiverdb.models import Waiver
 
 _log = logging.getLogger(__name__)
@@ -24,7 +23,7 @@ class FedmsgPublisher:
             try:
                 msg = Message(
                     topic="waiverdb.waiver.new",
-                    body=marshal(row, waiver_fields),
+                    body=serialize_waiver(row),
                 )
                 publish(msg)
                 monitor.messaging_tx_sent_ok_counter.inc()
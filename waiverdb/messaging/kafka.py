@@ -6,12 +6,11 @@ import os
 from typing import Any
 
 from confluent_kafka import KafkaError, KafkaException, Message, Producer
-from flask_restx import marshal
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 import waiverdb.monitor as monitor
-from waiverdb.fields import waiver_fields
+from waiverdb.fields import serialize_waiver
 from waiverdb.models import Waiver
 
 _log = logging.getLogger(__name__)
@@ -75,7 +74,7 @@ class KafkaPublisher:
                 continue
             monitor.messaging_tx_to_send_counter.inc()
             _log.debug("Publishing a Kafka message for %r", row)
-            message_data = marshal(row, waiver_fields)
+            message_data = serialize_waiver(row)
             self._producer.produce(
                 self._config.topic,
                 value=json.dumps(message_data).encode("utf-8"),
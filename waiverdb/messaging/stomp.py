@@ -6,11 +6,10 @@ import time
 from contextlib import contextmanager
 
 import stomp
-from flask_restx import marshal
 from sqlalchemy.orm import Session
 
 import waiverdb.monitor as monitor
-from waiverdb.fields import waiver_fields
+from waiverdb.fields import serialize_waiver
 from waiverdb.models import Waiver
 
 _log = logging.getLogger(__name__)
@@ -89,7 +88,7 @@ class StompPublisher:
                 if not isinstance(row, Waiver):
                     continue
                 _log.debug("Publishing a message for %r", row)
-                msg = json.dumps(marshal(row, waiver_fields))
+                msg = json.dumps(serialize_waiver(row))
                 kwargs = dict(
                     body=msg,
                     headers={},
@@ -0,0 +1,36 @@
+"""Add indexes for finding the latest waivers
+
+Revision ID: 50c50476a7d5
+Revises: b9d5e067252e
+Create Date: 2026-10-17 10:02:47.918232
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '50c50476a7d5'
+down_revision = 'b9d5e067252e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """
+    On PostgreSQL, the indexes are created without blocking writes.
+    """
+    with op.get_context().autocommit_block():
+        op.create_index('ix_waiver_latest_full', 'waiver', [
+            'subject_type', 'subject_identifier', 'testcase', 'scenario', 'username',
+            'product_version', sa.text('id DESC'),
+        ], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_waiver_latest_result', 'waiver', [
+            'subject_type', 'subject_identifier', 'testcase', 'scenario', sa.text('id DESC'),
+        ], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_waiver_latest_result', table_name='waiver',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_waiver_latest_full', table_name='waiver',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,27 @@
+"""Add waivers_version table
+
+Revision ID: 5b8e2d7c4a19
+Revises: c5e7a3f19d62
+Create Date: 2026-10-17 21:05:37.612048
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2d7c4a19'
+down_revision = 'c5e7a3f19d62'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'waivers_version',
+        sa.Column('shard', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('shard'),
+    )
+
+
+def downgrade():
+    op.drop_table('waivers_version')
@@ -0,0 +1,59 @@
+"""Add waiver_daily_stats table
+
+Revision ID: 7f3b9c2e5a41
+Revises: d4e8b1a96c20
+Create Date: 2026-10-17 16:40:12.874305
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7f3b9c2e5a41'
+down_revision = 'd4e8b1a96c20'
+
+from alembic import op
+import sqlalchemy as sa
+# These are the "lightweight" SQL expression versions (not using metadata):
+from sqlalchemy.sql.expression import table, column, select, func, cast
+
+GROUP_COLUMNS = ('subject_type', 'testcase', 'product_version', 'username')
+
+waiver = table(
+    'waiver',
+    column('timestamp', sa.DateTime),
+    *[column(name, sa.Text) for name in GROUP_COLUMNS],
+)
+
+waiver_daily_stats = table(
+    'waiver_daily_stats',
+    column('day', sa.Date),
+    *[column(name, sa.Text) for name in GROUP_COLUMNS],
+    column('count', sa.Integer),
+)
+
+
+def upgrade():
+    op.create_table(
+        'waiver_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('subject_type', sa.Text(), nullable=False),
+        sa.Column('testcase', sa.Text(), nullable=False),
+        sa.Column('product_version', sa.String(length=200), nullable=False),
+        sa.Column('username', sa.String(length=255), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'subject_type', 'testcase', 'product_version', 'username'),
+    )
+
+    # Count existing waivers
+    if op.get_bind().dialect.name == 'postgresql':
+        day = cast(waiver.c.timestamp, sa.Date)
+    else:
+        day = func.date(waiver.c.timestamp, type_=sa.Date)
+    group_columns = [waiver.c[name] for name in GROUP_COLUMNS]
+    op.execute(waiver_daily_stats.insert().from_select(
+        ['day', *GROUP_COLUMNS, 'count'],
+        select(day, *group_columns, func.count()).group_by(day, *group_columns),
+    ))
+
+
+def downgrade():
+    op.drop_table('waiver_daily_stats')
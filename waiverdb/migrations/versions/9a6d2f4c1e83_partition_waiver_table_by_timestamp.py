@@ -0,0 +1,128 @@
+"""Partition waiver table by timestamp
+
+Revision ID: 9a6d2f4c1e83
+Revises: 7f3b9c2e5a41
+Create Date: 2026-10-17 18:12:55.301662
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9a6d2f4c1e83'
+down_revision = '7f3b9c2e5a41'
+
+import datetime
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from waiverdb.partitions import (
+    DEFAULT_PARTITION, LEGACY_PARTITION, create_partitions, next_month)
+
+
+def _indexes(connection):
+    """
+    Returns names and definitions of indexes on the waiver table, except the
+    primary key.
+    """
+    return connection.execute(sa.text(
+        "SELECT indexname, indexdef FROM pg_indexes"
+        " WHERE schemaname = current_schema() AND tablename = 'waiver'"
+        " AND indexname != 'waiver_pkey'"
+    )).all()
+
+
+def upgrade():
+    """
+    Existing waivers stay in place in the legacy partition. Scanning the
+    table happens outside of the transaction which swaps the tables, so
+    inserts are blocked only briefly.
+
+    Waivers without a timestamp cannot be partitioned, so the migration fails
+    if there are any. Their timestamps must be fixed manually first.
+
+    Other databases only get the NOT NULL constraint on the timestamp column.
+    """
+    connection = op.get_bind()
+    missing = connection.execute(sa.text(
+        "SELECT count(*) FROM waiver WHERE timestamp IS NULL")).scalar()
+    if missing:
+        raise RuntimeError(
+            'Found %d waivers without a timestamp; fix their timestamps'
+            ' before running this migration' % missing)
+
+    if connection.dialect.name != 'postgresql':
+        with op.batch_alter_table('waiver') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+        return
+
+    # Leave a whole month for inserts until the table is swapped
+    today = datetime.datetime.now(datetime.UTC).date()
+    cutoff = next_month(next_month(today)).isoformat()
+
+    with op.get_context().autocommit_block():
+        # Validated constraints allow attaching the partition without a scan
+        op.execute("ALTER TABLE waiver ADD CONSTRAINT waiver_timestamp_not_null"
+                   " CHECK (timestamp IS NOT NULL) NOT VALID")
+        op.execute("ALTER TABLE waiver ADD CONSTRAINT waiver_legacy_range"
+                   f" CHECK (timestamp < '{cutoff}') NOT VALID")
+        op.execute("ALTER TABLE waiver VALIDATE CONSTRAINT waiver_timestamp_not_null")
+        op.execute("ALTER TABLE waiver VALIDATE CONSTRAINT waiver_legacy_range")
+        # Unique constraints of partitioned tables must contain the partition key
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS waiver_legacy_pkey"
+                   " ON waiver (id, timestamp)")
+
+    indexes = _indexes(connection)
+    indexes = [(name, definition) for name, definition in indexes if name != 'waiver_legacy_pkey']
+    op.execute("ALTER TABLE waiver ALTER COLUMN timestamp SET NOT NULL")
+    op.execute("ALTER TABLE waiver DROP CONSTRAINT waiver_timestamp_not_null")
+    op.execute("ALTER TABLE waiver DROP CONSTRAINT waiver_pkey")
+    op.execute("ALTER TABLE waiver ADD CONSTRAINT waiver_legacy_pkey"
+               " PRIMARY KEY USING INDEX waiver_legacy_pkey")
+    op.execute(f"ALTER TABLE waiver RENAME TO {LEGACY_PARTITION}")
+    for name, _ in indexes:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+
+    op.execute(f"CREATE TABLE waiver (LIKE {LEGACY_PARTITION}"
+               " INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY RANGE (timestamp)")
+    op.execute("ALTER SEQUENCE waiver_id_seq OWNED BY waiver.id")
+    op.execute(f"ALTER TABLE waiver ATTACH PARTITION {LEGACY_PARTITION}"
+               f" FOR VALUES FROM (MINVALUE) TO ('{cutoff}')")
+
+    # Reuse the existing indexes for the legacy partition
+    op.execute("ALTER TABLE ONLY waiver ADD CONSTRAINT waiver_pkey PRIMARY KEY (id, timestamp)")
+    op.execute("ALTER INDEX waiver_pkey ATTACH PARTITION waiver_legacy_pkey")
+    for name, definition in indexes:
+        op.execute(re.sub(r' ON (\S+\.)?waiver ', r' ON ONLY \1waiver ', definition, count=1))
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {name}_legacy")
+
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF waiver DEFAULT")
+    create_partitions(connection, months_ahead=3)
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        with op.batch_alter_table('waiver') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+        return
+
+    indexes = _indexes(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(name) for name in connection.execute(sa.text(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = current_schema() AND table_name = 'waiver'"
+        " AND is_generated = 'NEVER' ORDER BY ordinal_position"
+    )).scalars())
+
+    op.execute("CREATE TABLE waiver_unpartitioned (LIKE waiver"
+               " INCLUDING DEFAULTS INCLUDING GENERATED)")
+    # The column list consists of quoted identifiers of the existing table
+    op.execute(f"INSERT INTO waiver_unpartitioned ({columns})"
+               f" SELECT {columns} FROM waiver")  # nosec B608
+    op.execute("ALTER SEQUENCE waiver_id_seq OWNED BY waiver_unpartitioned.id")
+    op.execute("DROP TABLE waiver")
+    op.execute("ALTER TABLE waiver_unpartitioned RENAME TO waiver")
+    op.execute("ALTER TABLE waiver ADD CONSTRAINT waiver_pkey PRIMARY KEY (id)")
+    for _, definition in indexes:
+        op.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+    op.execute("ALTER TABLE waiver ALTER COLUMN timestamp DROP NOT NULL")
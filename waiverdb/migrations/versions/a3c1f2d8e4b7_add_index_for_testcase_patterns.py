@@ -0,0 +1,29 @@
+"""Add index for matching test case name patterns
+
+Revision ID: a3c1f2d8e4b7
+Revises: 50c50476a7d5
+Create Date: 2026-10-17 14:21:09.513027
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f2d8e4b7'
+down_revision = '50c50476a7d5'
+
+from alembic import op
+
+
+def upgrade():
+    """
+    On PostgreSQL, the index is created without blocking writes.
+    """
+    with op.get_context().autocommit_block():
+        op.create_index('ix_waiver_testcase_pattern', 'waiver', ['testcase'],
+                        postgresql_ops={'testcase': 'text_pattern_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_waiver_testcase_pattern', table_name='waiver',
+                      postgresql_concurrently=True, if_exists=True)
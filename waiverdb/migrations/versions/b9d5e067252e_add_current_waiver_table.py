@@ -0,0 +1,75 @@
+"""Add current_waiver table
+
+Revision ID: b9d5e067252e
+Revises: 3868a8118458
+Create Date: 2026-10-17 09:12:31.482917
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b9d5e067252e'
+down_revision = '3868a8118458'
+
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+# These are the "lightweight" SQL expression versions (not using metadata):
+from sqlalchemy.sql.expression import table, column, select, func
+
+# Obsolete waiver keys (see waiverdb.models.waivers.OBSOLETE_WAIVER_KEYS)
+KEYS = {
+    'full': ('subject_type', 'subject_identifier', 'testcase', 'scenario', 'username',
+             'product_version'),
+    'result': ('subject_type', 'subject_identifier', 'testcase', 'scenario'),
+}
+
+waiver = table(
+    'waiver',
+    column('id', sa.Integer),
+    *[column(name, sa.Text) for name in KEYS['full']],
+)
+
+current_waiver = table(
+    'current_waiver',
+    column('key_type', sa.String),
+    column('key_hash', sa.String),
+    column('waiver_id', sa.Integer),
+)
+
+
+def key_hash(values):
+    data = json.dumps(list(values), separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    op.create_table(
+        'current_waiver',
+        sa.Column('key_type', sa.String(length=16), nullable=False),
+        sa.Column('key_hash', sa.String(length=64), nullable=False),
+        sa.Column('waiver_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key_type', 'key_hash'),
+    )
+    op.create_index('ix_current_waiver_key_type_waiver_id', 'current_waiver',
+                    ['key_type', 'waiver_id'])
+
+    # Populate the projection with existing waivers
+    connection = op.get_bind()
+    for key_type, columns in KEYS.items():
+        key_columns = [waiver.c[name] for name in columns]
+        groups = connection.execute(
+            select(func.max(waiver.c.id), *key_columns)
+            .group_by(*key_columns)
+            .execution_options(yield_per=1000))
+        for partition in groups.partitions():
+            connection.execute(current_waiver.insert(), [
+                {'key_type': key_type, 'key_hash': key_hash(row[1:]), 'waiver_id': row[0]}
+                for row in partition
+            ])
+
+
+def downgrade():
+    op.drop_index('ix_current_waiver_key_type_waiver_id', table_name='current_waiver')
+    op.drop_table('current_waiver')
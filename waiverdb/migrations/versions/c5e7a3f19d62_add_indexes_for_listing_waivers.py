@@ -0,0 +1,64 @@
+"""Add indexes for listing waivers by timestamp
+
+Revision ID: c5e7a3f19d62
+Revises: 9a6d2f4c1e83
+Create Date: 2026-10-17 19:40:12.518203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c5e7a3f19d62'
+down_revision = '9a6d2f4c1e83'
+
+from alembic import op
+import sqlalchemy as sa
+from waiverdb.partitions import create_index
+
+# Name -> columns
+INDEXES = {
+    'ix_waiver_timestamp_id': ['timestamp DESC', 'id DESC'],
+    'ix_waiver_username_timestamp': ['username', 'timestamp'],
+    'ix_waiver_product_version_timestamp': ['product_version', 'timestamp'],
+    'ix_waiver_proxied_by_timestamp': ['proxied_by', 'timestamp'],
+}
+
+# Name -> rest of the CREATE INDEX statement, on PostgreSQL
+POSTGRESQL_INDEXES = {
+    'ix_waiver_timestamp_id': 'USING btree ("timestamp" DESC, id DESC)',
+    'ix_waiver_username_timestamp': 'USING btree (username, "timestamp")',
+    'ix_waiver_product_version_timestamp': 'USING btree (product_version, "timestamp")',
+    'ix_waiver_proxied_by_timestamp':
+        'USING btree (proxied_by, "timestamp") WHERE proxied_by IS NOT NULL',
+    'ix_waiver_timestamp_brin': 'USING brin ("timestamp")',
+    'ix_waiver_latest_result_covering':
+        'USING btree (subject_type, subject_identifier, testcase, scenario, id DESC)'
+        ' INCLUDE (product_version, waived)',
+}
+
+
+def upgrade():
+    """
+    On PostgreSQL, the indexes are created without blocking writes.
+    """
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'waiver', [sa.text(column) for column in columns])
+        return
+
+    with op.get_context().autocommit_block():
+        for name, definition in POSTGRESQL_INDEXES.items():
+            create_index(op.get_bind(), name, definition)
+
+    op.drop_index('ix_waiver_latest_result', table_name='waiver')
+    op.execute("ALTER INDEX ix_waiver_latest_result_covering RENAME TO ix_waiver_latest_result")
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='waiver')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_waiver_timestamp_brin', table_name='waiver')
+        op.drop_index('ix_waiver_latest_result', table_name='waiver')
+        op.create_index('ix_waiver_latest_result', 'waiver', [
+            'subject_type', 'subject_identifier', 'testcase', 'scenario', sa.text('id DESC')])
@@ -0,0 +1,45 @@
+"""Add column and index for searching waiver comments
+
+Revision ID: d4e8b1a96c20
+Revises: a3c1f2d8e4b7
+Create Date: 2026-10-17 15:03:41.270114
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8b1a96c20'
+down_revision = 'a3c1f2d8e4b7'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+def upgrade():
+    """
+    On PostgreSQL, adds the stored comment_search column. Adding it rewrites
+    the waiver table, which blocks access to it until done; ranking a broad
+    search reads the stored vectors instead of parsing every matching comment
+    again. The index is then created without blocking writes.
+    """
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.add_column('waiver', sa.Column(
+        'comment_search', TSVECTOR,
+        sa.Computed("to_tsvector('english', coalesce(comment, ''))")))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_waiver_comment_search', 'waiver', ['comment_search'],
+                        postgresql_using='gin', postgresql_concurrently=True,
+                        if_not_exists=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_waiver_comment_search', table_name='waiver',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('waiver', 'comment_search')
@@ -6,7 +6,12 @@ from sqlalchemy.dialects.postgresql.psycopg2 import _PGJSON
 from sqlalchemy.sql.elements import ColumnElement, Null
 from sqlalchemy.sql.expression import cast
 from sqlalchemy.sql.sqltypes import Text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
 
 json_serializer = json.encoder.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
@@ -51,4 +56,49 @@ class EqualityComparableJSONType(_PGJSON):
         return process
 
 
-db = SQLAlchemy()
+def upsert(connection, table, rows, index_elements, update):
+    """
+    Inserts ``rows`` into ``table``, updating the existing rows instead if
+    they conflict on ``index_elements``.
+
+    The ``update`` callable receives the ``excluded`` pseudo-table (the rows
+    proposed for insertion) and returns the values to set on conflict.
+    """
+    if connection.dialect.name == 'postgresql':
+        insert = postgresql.insert
+    else:
+        insert = sqlite.insert
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=update(stmt.excluded))
+    return connection.execute(stmt)
+
+
+@compiles(CreateColumn)
+def create_column(element, compiler, **kw):
+    """
+    Leaves out columns with ``info={'postgresql_only': True}`` when creating
+    tables in other databases (the tests use SQLite).
+
+    Such columns must not be mapped by the ORM (see ``exclude_properties``).
+    """
+    if element.element.info.get('postgresql_only') and compiler.dialect.name != 'postgresql':
+        return None
+    return compiler.visit_create_column(element, **kw)
+
+
+class RoutingSession(Session):
+    """
+    Session which sends queries to the read replica chosen for the current
+    request (see :func:`waiverdb.replicas.read_replica`). Flushes always use
+    the primary database.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            bind_key = g.get('replica_bind_key')
+            if bind_key is not None:
+                return self._db.engines[bind_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
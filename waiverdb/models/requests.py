@@ -1,7 +1,7 @@
 # SPDX-License-Identifier: LGPL-2.0-or-later
 import annotated_types
-from typing import Annotated, List, Optional, Tuple, Union
-from datetime import datetime
+from typing import Annotated, List, Literal, Optional, Tuple, Union
+from datetime import datetime, timezone
 
 from pydantic import BaseModel, Field, StringConstraints, RootModel, model_validator
 from werkzeug.exceptions import BadRequest
@@ -83,6 +83,7 @@ class GetWaivers(BaseModel):
     subject_type: Optional[str] = None
     subject_identifier: Optional[str] = None
     testcase: Optional[str] = None
+    testcase_pattern: Optional[str] = None
     product_version: Optional[str] = None
     username: Optional[str] = None
     include_obsolete: bool = False
@@ -90,7 +91,20 @@ class GetWaivers(BaseModel):
     since: Optional[str] = None
     page: int = 1
     limit: int = 10
+    cursor: Optional[str] = None
+    count: Literal['exact', 'estimate', 'none'] = 'exact'
     proxied_by: Optional[str] = None
+    q: Optional[str] = None
+    fields: Optional[str] = None
+
+
+class GetWaiverStats(BaseModel):
+    group_by: Optional[str] = None
+    subject_type: Optional[str] = None
+    testcase: Optional[str] = None
+    product_version: Optional[str] = None
+    username: Optional[str] = None
+    since: Optional[str] = None
 
 
 class GetPermissions(BaseModel):
@@ -102,6 +116,7 @@ class WaiverFilter(BaseModel):
     subject_type: Optional[str] = None
     subject_identifier: Optional[str] = None
     testcase: Optional[str] = None
+    testcase_pattern: Optional[str] = None
     scenario: Optional[str] = None
     product_version: Optional[str] = None
     username: Optional[str] = None
@@ -112,6 +127,31 @@ class WaiverFilter(BaseModel):
 class FilterWaivers(BaseModel):
     filters: Annotated[List[WaiverFilter], annotated_types.Len(min_length=1)]
     include_obsolete: bool = False
+    fields: Optional[List[str]] = None
+
+
+class WaiverKey(BaseModel):
+    subject_type: str
+    subject_identifier: str
+    testcase: str
+    scenario: Optional[str] = None
+    product_version: str
+
+
+class GetWaived(BaseModel):
+    keys: Annotated[List[WaiverKey], annotated_types.Len(min_length=1)]
+
+
+class GetWaiversByIds(BaseModel):
+    ids: Annotated[List[int], annotated_types.Len(min_length=1)]
+    fields: Optional[List[str]] = None
+
+
+class GetWaiverChanges(BaseModel):
+    after_id: int = 0
+    limit: int = 100
+    wait: float = 0
+    fields: Optional[str] = None
 
 
 class GetWaiversBySubjectAndTestcase(BaseModel):
@@ -122,6 +162,7 @@ class GetWaiversBySubjectAndTestcase(BaseModel):
     proxied_by: Optional[str] = None
     since: Optional[str] = None
     include_obsolete: bool = False
+    fields: Optional[List[str]] = None
 
 
 def parse_since(since: str) -> Tuple[Optional[datetime], Optional[datetime]]:
@@ -136,7 +177,10 @@ def parse_since(since: str) -> Tuple[Optional[datetime], Optional[datetime]]:
 
         2017-02-13T23:37:58.193281,2017-02-16T23:37:58.193281
 
-    Returns a tuple (start, end) of datetime.datetime instances.
+    Returns a tuple (start, end) of datetime.datetime instances. Timestamps
+    with a time zone are converted to UTC without the time zone info, like
+    the stored waiver timestamps, so the database compares them directly (and
+    can skip partitions of the waiver table outside the range).
     """
     start = None
     end = None
@@ -146,9 +190,15 @@ def parse_since(since: str) -> Tuple[Optional[datetime], Optional[datetime]]:
         start = since
     try:
         if start:
-            start = datetime.fromisoformat(start)
+            start = _naive_utc(datetime.fromisoformat(start))
         if end:
-            end = datetime.fromisoformat(end)
+            end = _naive_utc(datetime.fromisoformat(end))
     except ValueError as e:
         raise BadRequest({'since': str(e)})
     return start, end
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
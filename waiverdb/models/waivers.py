@@ -1,12 +1,61 @@
 # SPDX-License-Identifier: GPL-2.0+
 
 import datetime
+import hashlib
+import json
+import re
 
 from typing import List
 
-from .base import db
-from sqlalchemy import or_, and_, false
-from .requests import TestSubject, TestResult
+from .base import db, upsert
+from werkzeug.exceptions import BadRequest
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import (
+    ARRAY, Integer, Text, or_, and_, any_, bindparam, case, cast, delete, false, func,
+    literal_column, select, tuple_,
+)
+from .requests import TestSubject, TestResult, WaiverFilter, parse_since
+
+# A waiver is obsolete if there is a more recent waiver with the same values
+# in the columns of a key. Listing waivers uses the "full" key, querying
+# waivers for test results uses the shorter "result" key.
+OBSOLETE_WAIVER_KEYS = {
+    'full': (
+        'subject_type',
+        'subject_identifier',
+        'testcase',
+        'scenario',
+        'username',
+        'product_version',
+    ),
+    'result': (
+        'subject_type',
+        'subject_identifier',
+        'testcase',
+        'scenario',
+    ),
+}
+
+# Columns which can be matched by the filters of waivers/+filtered
+FILTER_COLUMNS = (
+    'subject_type',
+    'subject_identifier',
+    'testcase',
+    'scenario',
+    'product_version',
+    'username',
+    'proxied_by',
+)
+
+# PostgreSQL text search configuration of the comment_search column
+COMMENT_SEARCH_CONFIG = 'english'
+
+
+def comment_search_query(q):
+    """
+    Returns the tsquery expression for the comment search query ``q``.
+    """
+    return func.websearch_to_tsquery(literal_column(f"'{COMMENT_SEARCH_CONFIG}'"), q)
 
 
 def utcnow_naive():
@@ -48,6 +97,63 @@ def subject_type_identifier_to_dict(subject_type, subject_identifier):
                          f'actual value is: {subject_type}')
 
 
+def glob_to_like(pattern):
+    """
+    Translates a glob pattern (see :mod:`fnmatch`) to a LIKE pattern with
+    backslash as the escape character.
+
+    Returns None if the pattern contains a character set, which cannot be
+    expressed with LIKE.
+    """
+    if '[' in pattern:
+        return None
+    return (
+        pattern
+        .replace('\\', '\\\\')
+        .replace('%', '\\%')
+        .replace('_', '\\_')
+        .replace('*', '%')
+        .replace('?', '_')
+    )
+
+
+def glob_to_regex(pattern):
+    """
+    Translates a glob pattern (see :mod:`fnmatch`) to a regular expression
+    with the same meaning in Python and PostgreSQL.
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            parts.append('.*')
+        elif c == '?':
+            parts.append('.')
+        elif c == '[':
+            # Same rules for the end of the character set as in fnmatch
+            end = i
+            if end < len(pattern) and pattern[end] == '!':
+                end += 1
+            if end < len(pattern) and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end == -1:
+                parts.append('\\[')
+                continue
+            chars = pattern[i:end]
+            i = end + 1
+            negate = chars.startswith('!')
+            if negate:
+                chars = chars[1:]
+            chars = re.sub(r'([\\\[\]^])', r'\\\1', chars)
+            parts.append('[^' + chars + ']' if negate else '[' + chars + ']')
+        else:
+            parts.append(re.escape(c))
+    return '(?s)^' + ''.join(parts) + '\\Z'
+
+
 class Waiver(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subject_type = db.Column(db.Text, nullable=False, index=True)
@@ -59,10 +165,44 @@ class Waiver(db.Model):
     waived = db.Column(db.Boolean, nullable=False, default=False)
     scenario = db.Column(db.String(255), nullable=True)
     comment = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=utcnow_naive)
+    # On PostgreSQL, the table is partitioned by timestamp, see waiverdb.partitions
+    timestamp = db.Column(db.DateTime, nullable=False, default=utcnow_naive)
+    # For searching comments, see match_comment()
+    comment_search = db.Column(
+        TSVECTOR,
+        db.Computed(func.to_tsvector(
+            literal_column(f"'{COMMENT_SEARCH_CONFIG}'"),
+            func.coalesce(comment, literal_column("''")),
+        )),
+        info={'postgresql_only': True},
+    )
     __table_args__ = (
         db.Index('ix_waiver_subject_type_identifier', subject_type, subject_identifier),
+        # For finding the most recent waiver for each obsolete waiver key
+        db.Index('ix_waiver_latest_full', subject_type, subject_identifier, testcase, scenario,
+                 username, product_version, id.desc()),
+        # Also covers the columns needed for checking results (+waived)
+        db.Index('ix_waiver_latest_result', subject_type, subject_identifier, testcase, scenario,
+                 id.desc(), postgresql_include=['product_version', 'waived']),
+        # For matching test case name patterns with a fixed prefix
+        db.Index('ix_waiver_testcase_pattern', testcase,
+                 postgresql_ops={'testcase': 'text_pattern_ops'}),
+        # For listing waivers from the most recent, also with filters
+        db.Index('ix_waiver_timestamp_id', timestamp.desc(), id.desc()),
+        db.Index('ix_waiver_username_timestamp', username, timestamp),
+        db.Index('ix_waiver_product_version_timestamp', product_version, timestamp),
+        db.Index('ix_waiver_proxied_by_timestamp', proxied_by, timestamp,
+                 postgresql_where=proxied_by.isnot(None)),
+        # Small index for time ranges over large tables (waivers are mostly
+        # inserted in timestamp order)
+        db.Index('ix_waiver_timestamp_brin', timestamp,
+                 postgresql_using='brin').ddl_if(dialect='postgresql'),
+        db.Index('ix_waiver_comment_search', 'comment_search',
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
     )
+    # The generated comment_search column does not exist on other databases,
+    # so it is only used in explicit queries
+    __mapper_args__ = {'exclude_properties': ['comment_search']}
 
     def __init__(self, subject_type, subject_identifier, testcase, username, product_version,
                  waived=False, comment=None, proxied_by=None, scenario=None):
@@ -83,36 +223,437 @@ class Waiver(db.Model):
                    self.testcase, self.scenario, self.username, self.product_version, self.waived))
 
     @classmethod
-    def by_results(cls, query, results: List[TestResult]):
+    def by_results(cls, query, results: List[TestResult], dialect_name):
         """
         Filter ``query`` by matching with at least one filter in ``results``.
 
         If ``results`` is empty, ``query`` is not filtered.
 
+        The results are converted to filters for :meth:`match_filters`, so
+        the statement does not depend on the number and order of results.
+
         Args:
             query (flask_sqlalchemy.BaseQuery)
             results (list): each item should be dict containing
                 "subject" (dict) and "testcase" (str), both optional
+            dialect_name (str): name of the database dialect
 
         Returns:
             Filtered query.
         """
-        clauses = []
+        filters = []
+        invalid_subjects = False
         for result in results:
             if not result.subject and not result.testcase:
                 continue
-            inner_clauses = []
+            subject = {}
             if result.subject:
                 try:
                     subject_type, subject_identifier = \
                         subject_dict_to_type_identifier(result.subject)
                 except ValueError:
-                    inner_clauses.append(false())
-                else:
-                    inner_clauses.append(cls.subject_type == subject_type)
-                    inner_clauses.append(cls.subject_identifier == subject_identifier)
-            if result.testcase:
-                inner_clauses.append(cls.testcase == result.testcase)
+                    subject_type = None
+                if subject_type is None:
+                    # Matches nothing (subject_type is never NULL)
+                    invalid_subjects = True
+                    continue
+                subject = {'subject_type': subject_type, 'subject_identifier': subject_identifier}
+            filters.append(WaiverFilter(testcase=result.testcase or None, **subject))
+
+        if not filters:
+            return query.filter(false()) if invalid_subjects else query
+        clause = cls.match_filters(
+            filters, dialect_name, columns=('subject_type', 'subject_identifier', 'testcase'))
+        return query if clause is None else query.filter(clause)
+
+    @classmethod
+    def match_testcase_pattern(cls, pattern, dialect_name):
+        """
+        Returns a clause matching waivers with test case names matching the
+        glob ``pattern``, the same way as
+        :func:`waiverdb.authorization.match_testcase` does.
+
+        On PostgreSQL, patterns without character sets are matched with LIKE.
+        Both LIKE and the regular expressions can use the
+        ix_waiver_testcase_pattern index for the fixed prefix of the pattern.
+        Other databases always use a regular expression, because LIKE may not
+        be case sensitive.
+        """
+        like = glob_to_like(pattern)
+        if like is not None and dialect_name == 'postgresql':
+            return cls.testcase.like(like, escape='\\')
+        regex = glob_to_regex(pattern)
+        try:
+            re.compile(regex)
+        except re.error as e:
+            raise BadRequest({'testcase_pattern': f'Invalid pattern: {e}'})
+        return cls.testcase.regexp_match(regex)
+
+    @classmethod
+    def match_comment(cls, q, dialect_name):
+        """
+        Returns a clause matching waivers with comments containing the search
+        query ``q``.
+
+        On PostgreSQL, this is a full-text search in the generated
+        comment_search column (using the ix_waiver_comment_search index) and
+        ``q`` is parsed with
+        ``websearch_to_tsquery()`` (so it supports quoted phrases, "or" and
+        "-" for excluding words). Other databases match comments containing
+        all words of ``q``, ignoring case.
+        """
+        if dialect_name == 'postgresql':
+            return cls.__table__.c.comment_search.bool_op('@@')(comment_search_query(q))
+        return and_(*[cls.comment.icontains(word, autoescape=True) for word in q.split()])
+
+    @classmethod
+    def comment_rank(cls, q, dialect_name):
+        """
+        Returns the relevance of waiver comments for the search query ``q``
+        (see :meth:`match_comment`), or None if ranking is not supported by
+        the database.
+        """
+        if dialect_name != 'postgresql':
+            return None
+        return func.ts_rank(cls.__table__.c.comment_search, comment_search_query(q))
+
+    @classmethod
+    def match_values(cls, columns, rows, dialect_name):
+        """
+        Returns a clause matching waivers with values in ``columns`` equal to
+        any of the tuples in ``rows``.
+
+        On PostgreSQL, the values are passed as one array parameter per
+        column, so the statement is the same for any number of rows and it is
+        planned as a join against the unnested arrays. Each column is also
+        compared with an array of its distinct values, so indexes are used
+        even where the tuple comparison cannot be planned as a join (in OR
+        clauses, see :meth:`match_keys`).
+        """
+        model_columns = [getattr(cls, column) for column in columns]
+        if dialect_name == 'postgresql':
+            arrays = [
+                bindparam(None, [row[i] for row in rows], type_=ARRAY(Text))
+                for i in range(len(columns))
+            ]
+            if len(columns) == 1:
+                return model_columns[0] == any_(arrays[0])
+            values = func.unnest(*arrays).table_valued(*columns).render_derived()
+            return and_(
+                *[
+                    column == any_(bindparam(
+                        None, sorted({row[i] for row in rows}), type_=ARRAY(Text)))
+                    for i, column in enumerate(model_columns)
+                ],
+                tuple_(*model_columns).in_(select(*values.c)),
+            )
+
+        if len(columns) == 1:
+            return model_columns[0].in_([row[0] for row in rows])
+        return tuple_(*model_columns).in_(rows)
+
+    @classmethod
+    def match_ids(cls, ids, dialect_name):
+        """
+        Returns a clause matching waivers with given IDs.
+
+        On PostgreSQL, the IDs are passed as an array parameter, so the
+        statement is the same for any number of IDs.
+        """
+        if dialect_name == 'postgresql':
+            return cls.id == any_(bindparam(None, list(ids), type_=ARRAY(Integer)))
+        return cls.id.in_(ids)
+
+    @classmethod
+    def match_keys(cls, columns, rows, dialect_name):
+        """
+        Like :meth:`match_values` but ``None`` in ``rows`` matches only NULL.
+        """
+        groups = {}
+        for row in rows:
+            null_columns = tuple(column for column, value in zip(columns, row) if value is None)
+            values = tuple(value for value in row if value is not None)
+            groups.setdefault(null_columns, set()).add(values)
+
+        clauses = []
+        # Sorted, so the statement does not depend on the order of rows
+        for null_columns, values in sorted(groups.items()):
+            value_columns = [column for column in columns if column not in null_columns]
+            clauses.append(and_(
+                *[getattr(cls, column).is_(None) for column in null_columns],
+                cls.match_values(value_columns, sorted(values), dialect_name),
+            ))
+        return or_(*clauses)
+
+    @classmethod
+    def match_filters(cls, filters: List[WaiverFilter], dialect_name,
+                      columns=FILTER_COLUMNS, since=True):
+        """
+        Returns a clause matching waivers which match at least one of
+        ``filters``, or ``None`` if some filter matches all waivers.
+
+        Duplicate filters are dropped and filters using the same columns (and
+        time range) are grouped, so each group is matched by a single tuple
+        comparison (see :meth:`match_values`) instead of a separate clause
+        for every filter. The groups are sorted by the shape of their clauses,
+        so the statement only depends on which kinds of filters are used,
+        not on their number or order, and its compiled form can be reused
+        from the SQLAlchemy statement cache.
+
+        Args:
+            filters (list): WaiverFilter items
+            dialect_name (str): name of the database dialect
+            columns (tuple): only criteria for these columns are used
+                (including ``testcase_pattern`` if it contains "testcase")
+            since (bool): whether to use the "since" criteria
+
+        Returns:
+            SQL clause or None.
+        """
+        groups = {}
+        for filter_ in filters:
+            used_columns = tuple(column for column in columns if getattr(filter_, column))
+            since_range = parse_since(filter_.since) if since and filter_.since else None
+            pattern = filter_.testcase_pattern if 'testcase' in columns else None
+            if not used_columns and not since_range and not pattern:
+                return None
+            values = tuple(getattr(filter_, column) for column in used_columns)
+            groups.setdefault((used_columns, since_range, pattern), set()).add(values)
+
+        clauses = []
+        for (used_columns, since_range, pattern), rows in sorted(
+                groups.items(), key=lambda item: _filter_group_shape(*item[0])):
+            inner_clauses = []
+            if used_columns:
+                inner_clauses.append(cls.match_values(used_columns, sorted(rows), dialect_name))
+            if pattern:
+                inner_clauses.append(cls.match_testcase_pattern(pattern, dialect_name))
+            if since_range:
+                since_start, since_end = since_range
+                if since_start:
+                    inner_clauses.append(cls.timestamp >= since_start)
+                if since_end:
+                    inner_clauses.append(cls.timestamp <= since_end)
             clauses.append(and_(*inner_clauses))
+        return or_(*clauses)
+
+
+def _filter_group_shape(used_columns, since_range, pattern):
+    """
+    Returns a sort key for the filter groups in :meth:`Waiver.match_filters`
+    which is the same for groups matched by identical SQL.
+    """
+    since_start, since_end = since_range or (None, None)
+    return (
+        used_columns,
+        since_start is not None,
+        since_end is not None,
+        pattern is not None,
+        pattern is not None and glob_to_like(pattern) is None,
+    )
+
+
+def waiver_key_hash(values):
+    """
+    Returns a hash identifying a group of waivers with given key column values.
+    """
+    data = json.dumps(list(values), separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class CurrentWaiver(db.Model):
+    """
+    Projection of the most recent waiver ID for each obsolete waiver key.
+
+    The table is kept up to date in the same transaction as waivers are
+    inserted (see :func:`waiverdb.events.update_current_waivers`), so
+    filtering out obsolete waivers is a join instead of an aggregate over all
+    waivers.
+    """
+    key_type = db.Column(db.String(16), primary_key=True)
+    key_hash = db.Column(db.String(64), primary_key=True)
+    waiver_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index('ix_current_waiver_key_type_waiver_id', key_type, waiver_id),
+    )
+
+    @classmethod
+    def update(cls, connection, waivers):
+        """
+        Marks given newly inserted waivers as the current ones for their keys.
+        """
+        rows = {}
+        for waiver in waivers:
+            for key_type, columns in OBSOLETE_WAIVER_KEYS.items():
+                key_hash = waiver_key_hash(getattr(waiver, column) for column in columns)
+                current = rows.get((key_type, key_hash))
+                if current is None or current['waiver_id'] < waiver.id:
+                    rows[(key_type, key_hash)] = {
+                        'key_type': key_type,
+                        'key_hash': key_hash,
+                        'waiver_id': waiver.id,
+                    }
+        if not rows:
+            return
+
+        table = cls.__table__
+        upsert(
+            connection, table, list(rows.values()),
+            index_elements=[table.c.key_type, table.c.key_hash],
+            # Never replace a newer waiver committed concurrently
+            update=lambda excluded: {
+                'waiver_id': case(
+                    (excluded.waiver_id > table.c.waiver_id, excluded.waiver_id),
+                    else_=table.c.waiver_id,
+                ),
+            },
+        )
+
+    @classmethod
+    def rebuild(cls, connection, batch_size=1000):
+        """
+        Recreates the whole projection from the waiver table.
+        """
+        table = cls.__table__
+        waiver = Waiver.__table__
+        connection.execute(delete(table))
+        for key_type, columns in OBSOLETE_WAIVER_KEYS.items():
+            key_columns = [waiver.c[column] for column in columns]
+            groups = connection.execute(
+                select(func.max(waiver.c.id), *key_columns)
+                .group_by(*key_columns)
+                .execution_options(yield_per=batch_size))
+            for partition in groups.partitions():
+                connection.execute(table.insert(), [
+                    {
+                        'key_type': key_type,
+                        'key_hash': waiver_key_hash(row[1:]),
+                        'waiver_id': row[0],
+                    }
+                    for row in partition
+                ])
+
+
+class WaiverDailyStats(db.Model):
+    """
+    Number of waivers created per day for each combination of subject type,
+    test case, product version and username.
+
+    Rows are incremented in the same transaction as waivers are inserted (see
+    :func:`waiverdb.events.update_waiver_stats`), so statistics are computed
+    from this much smaller table instead of aggregating all waivers.
+    """
+    __tablename__ = 'waiver_daily_stats'
+    day = db.Column(db.Date, primary_key=True)
+    subject_type = db.Column(db.Text, primary_key=True)
+    testcase = db.Column(db.Text, primary_key=True)
+    product_version = db.Column(db.String(200), primary_key=True)
+    username = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
 
-        return query.filter(or_(*clauses))
+    # Columns which can be used for grouping in addition to time buckets
+    group_columns = ('subject_type', 'testcase', 'product_version', 'username')
+    time_buckets = ('day', 'week', 'month')
+
+    @classmethod
+    def update(cls, connection, waivers):
+        """
+        Counts given newly inserted waivers.
+        """
+        counts = {}
+        for waiver in waivers:
+            key = (waiver.timestamp.date(), *(getattr(waiver, c) for c in cls.group_columns))
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+
+        table = cls.__table__
+        upsert(
+            connection, table,
+            [
+                {'day': key[0], **dict(zip(cls.group_columns, key[1:])), 'count': count}
+                for key, count in counts.items()
+            ],
+            index_elements=[table.c.day, *(table.c[c] for c in cls.group_columns)],
+            update=lambda excluded: {'count': table.c.count + excluded.count},
+        )
+
+    @classmethod
+    def rebuild(cls, connection):
+        """
+        Recreates all statistics from the waiver table.
+        """
+        table = cls.__table__
+        waiver = Waiver.__table__
+        day = cls.waiver_day(waiver.c.timestamp, connection.dialect.name)
+        group_columns = [waiver.c[c] for c in cls.group_columns]
+        connection.execute(delete(table))
+        connection.execute(table.insert().from_select(
+            ['day', *cls.group_columns, 'count'],
+            select(day, *group_columns, func.count()).group_by(day, *group_columns),
+        ))
+
+    @staticmethod
+    def waiver_day(timestamp, dialect_name):
+        """
+        Returns the SQL expression for the date of a waiver timestamp.
+        """
+        if dialect_name == 'postgresql':
+            return cast(timestamp, db.Date)
+        return func.date(timestamp, type_=db.Date)
+
+    @classmethod
+    def time_bucket(cls, name, dialect_name):
+        """
+        Returns the SQL expression for the first day of the time bucket
+        ("day", "week" starting on Monday or "month") of the rows.
+        """
+        if name == 'day':
+            return cls.day
+        if dialect_name == 'postgresql':
+            return cast(func.date_trunc(name, cls.day), db.Date)
+        if name == 'week':
+            return func.date(cls.day, 'weekday 0', '-6 days', type_=db.Date)
+        return func.date(cls.day, 'start of month', type_=db.Date)
+
+
+class WaiversVersion(db.Model):
+    """
+    Counters incremented by every transaction creating waivers (see
+    :func:`waiverdb.events.update_waivers_version`).
+
+    Together with the most recent waiver ID, they make up the version of the
+    waivers, which changes on every such commit, even if a waiver is committed
+    after one with a greater ID. Transactions increment one of several rows
+    (shards), so they rarely wait for each other.
+    """
+    __tablename__ = 'waivers_version'
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    shards = 16
+
+    @classmethod
+    def increment(cls, connection, shard):
+        """
+        Increments the counter of given shard.
+        """
+        table = cls.__table__
+        upsert(
+            connection, table, [{'shard': shard, 'count': 1}],
+            index_elements=[table.c.shard],
+            update=lambda excluded: {'count': table.c.count + excluded.count},
+        )
+
+    @classmethod
+    def version_statement(cls):
+        """
+        Returns the statement selecting the version of the waivers.
+
+        Both the most recent waiver ID and the counters only grow, so their
+        sum changes whenever either does.
+        """
+        return select(
+            func.coalesce(func.max(Waiver.id), 0)
+            + select(func.coalesce(func.sum(cls.count), 0)).scalar_subquery()
+        )
@@ -64,7 +64,46 @@ db_transaction_rollback_counter = Counter(
     registry=registry)
 
 # Service-specific metrics
-# XXX: TODO
+filtered_waivers_cache_hit_counter = Counter(
+    'filtered_waivers_cache_hit',
+    'Number of waivers/+filtered responses served from the cache',
+    registry=registry)
+filtered_waivers_cache_miss_counter = Counter(
+    'filtered_waivers_cache_miss',
+    'Number of waivers/+filtered responses not found in the cache',
+    registry=registry)
+subject_waivers_cache_hit_counter = Counter(
+    'subject_waivers_cache_hit',
+    'Number of waivers/+subject responses served from the cache',
+    registry=registry)
+subject_waivers_cache_miss_counter = Counter(
+    'subject_waivers_cache_miss',
+    'Number of waivers/+subject responses not found in the cache',
+    registry=registry)
+query_timeout_counter = Counter(
+    'query_timeout',
+    'Number of requests failed because a database statement timed out',
+    registry=registry)
+query_rejected_counter = Counter(
+    'query_rejected',
+    'Number of requests rejected because of too many filters or estimated rows',
+    registry=registry)
+sql_compiled_cache_counter = Counter(
+    'sql_compiled_cache',
+    'Number of executed SQL statements by the result of the compiled statement cache lookup',
+    ['result'],
+    registry=registry)
+response_compression_ratio_histogram = Histogram(
+    'response_compression_ratio',
+    'Ratio of uncompressed to compressed response size',
+    ['encoding'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+    registry=registry)
+response_compression_seconds_histogram = Histogram(
+    'response_compression_seconds',
+    'Time spent compressing a response',
+    ['encoding'],
+    registry=registry)
 
 
 def db_hook_event_listeners(target=None):
@@ -86,6 +125,12 @@ def db_hook_event_listeners(target=None):
     def receive_rollback(conn):
         db_transaction_rollback_counter.inc()
 
+    @event.listens_for(target, 'after_cursor_execute')
+    def receive_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Plain SQL strings are not compiled
+        if context.compiled is not None:
+            sql_compiled_cache_counter.labels(context.cache_hit.name.lower()).inc()
+
 
 class MonitorAPI(MethodView):
     def get(self):
@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Range partitioning of the waiver table by timestamp on PostgreSQL.
+
+The migration 9a6d2f4c1e83 converts the waiver table into a partitioned table.
+Existing waivers are kept in place in the ``waiver_legacy`` partition and new
+waivers are stored in monthly partitions named ``waiver_pYYYYMM``, which must
+be created ahead of time with :func:`create_partitions` (``waiverdb
+create-waiver-partitions``). Waivers without a matching monthly partition end
+up in the ``waiver_default`` partition.
+
+Queries with a time range (``since``) only scan the matching partitions.
+"""
+
+import datetime
+import re
+
+from sqlalchemy import text
+
+DEFAULT_PARTITION = 'waiver_default'
+LEGACY_PARTITION = 'waiver_legacy'
+
+_BOUND_RE = re.compile(r"FOR VALUES FROM \((MINVALUE|'[^']*')\) TO \((MAXVALUE|'[^']*')\)")
+
+
+def partition_name(month):
+    """
+    Returns the name of the partition for the month starting at ``month``.
+    """
+    return f'waiver_p{month:%Y%m}'
+
+
+def next_month(month):
+    """
+    Returns the first day of the month after ``month``.
+    """
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def is_partitioned(connection):
+    """
+    Returns True if the waiver table is partitioned.
+    """
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table"
+        " WHERE partrelid = to_regclass('waiver'))"
+    )).scalar()
+
+
+def partition_names(connection):
+    """
+    Returns names of all partitions of the waiver table.
+    """
+    return connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = to_regclass('waiver') ORDER BY c.relname"
+    )).scalars().all()
+
+
+def create_index(connection, name, definition):
+    """
+    Creates an index on the waiver table without blocking writes to it
+    (PostgreSQL only). ``definition`` is the rest of the CREATE INDEX
+    statement after the table name.
+
+    CREATE INDEX CONCURRENTLY cannot run in a transaction block and does not
+    support partitioned tables. For these, the index is built on each
+    partition separately and attached to the index of the parent table.
+    """
+    if not is_partitioned(connection):
+        connection.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON waiver {definition}"))
+        return
+
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY waiver {definition}"))
+    for partition in partition_names(connection):
+        partition_index = f'{partition}_{name}'[:63]
+        connection.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index}"
+            f" ON {partition} {definition}"))
+        connection.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+
+
+def partition_ranges(connection):
+    """
+    Returns the ranges of timestamps (start, end) of the partitions of the
+    waiver table, except the default partition, with ``None`` for unbounded
+    ends.
+    """
+    bounds = connection.execute(text(
+        "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = to_regclass('waiver')"
+    )).scalars()
+    ranges = []
+    for bound in bounds:
+        match = _BOUND_RE.match(bound)
+        if match is None:
+            # The default partition
+            continue
+        ranges.append(tuple(
+            None if value in ('MINVALUE', 'MAXVALUE')
+            else datetime.datetime.fromisoformat(value.strip("'"))
+            for value in match.groups()
+        ))
+    return ranges
+
+
+def create_partitions(connection, months_ahead=3, today=None):
+    """
+    Creates the missing monthly partitions of the waiver table from the
+    current month to ``months_ahead`` months after it.
+
+    Months already covered by a partition (for example, the legacy one) are
+    skipped. Creating a partition fails if the default partition already
+    contains waivers for its month.
+
+    Returns names of the created partitions.
+    """
+    if not is_partitioned(connection):
+        raise RuntimeError('The waiver table is not partitioned')
+
+    ranges = partition_ranges(connection)
+    month = (today or datetime.datetime.now(datetime.UTC).date()).replace(day=1)
+    created = []
+    for _ in range(months_ahead + 1):
+        start = datetime.datetime.combine(month, datetime.time())
+        end = datetime.datetime.combine(next_month(month), datetime.time())
+        overlaps = any(
+            (range_start is None or range_start < end)
+            and (range_end is None or start < range_end)
+            for range_start, range_end in ranges
+        )
+        if not overlaps:
+            name = partition_name(month)
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF waiver"
+                f" FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created.append(name)
+        month = next_month(month)
+    return created
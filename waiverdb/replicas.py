@@ -0,0 +1,122 @@
+# SPDX-License-Identifier: GPL-2.0+
+"""
+Routing of read-only requests to read replicas of the database.
+
+Replicas are configured with ``REPLICA_DATABASE_URIS`` and registered as
+Flask-SQLAlchemy binds named ``replica_<N>``. While a resource method
+decorated with :func:`read_replica` runs, the session sends queries to one of
+the replicas (see :class:`waiverdb.models.base.RoutingSession`). Flushes always
+go to the primary database.
+"""
+
+import contextlib
+import functools
+import logging
+import random
+import time
+
+from flask import after_this_request, current_app, g, request
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from waiverdb.models import db
+
+log = logging.getLogger(__name__)
+
+REPLICA_BIND_KEY_PREFIX = 'replica_'
+# Clients with this cookie recently created a waiver and read from the primary
+PRIMARY_COOKIE_NAME = 'waiverdb_read_primary'
+
+# Bind key -> time (in seconds, see time.monotonic()) until the replica is
+# skipped after a connection error
+_unhealthy_replicas = {}
+
+
+def replica_binds(uris):
+    """
+    Returns Flask-SQLAlchemy binds for given replica URIs.
+    """
+    return {f'{REPLICA_BIND_KEY_PREFIX}{i}': uri for i, uri in enumerate(uris)}
+
+
+def _choose_replica():
+    if request.cookies.get(PRIMARY_COOKIE_NAME):
+        return None
+
+    now = time.monotonic()
+    bind_keys = [
+        bind_key
+        for bind_key in current_app.config.get('SQLALCHEMY_BINDS') or {}
+        if bind_key.startswith(REPLICA_BIND_KEY_PREFIX)
+        and _unhealthy_replicas.get(bind_key, 0) <= now
+    ]
+    if not bind_keys:
+        return None
+    return random.choice(bind_keys)  # nosec
+
+
+def read_replica(func):
+    """
+    Runs the queries of a read-only resource method on a replica, if any is
+    configured and healthy.
+
+    If the replica fails with a connection error, it is skipped for
+    ``REPLICA_RETRY_INTERVAL`` seconds and the method is run again on the
+    primary database.
+    """
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        bind_key = _choose_replica()
+        if bind_key is None:
+            return func(*args, **kwargs)
+
+        g.replica_bind_key = bind_key
+        try:
+            return func(*args, **kwargs)
+        except (InterfaceError, OperationalError):
+            log.exception('Replica %s failed, retrying on the primary database', bind_key)
+            _unhealthy_replicas[bind_key] = (
+                time.monotonic() + current_app.config['REPLICA_RETRY_INTERVAL'])
+            db.session.rollback()
+        finally:
+            g.pop('replica_bind_key', None)
+        return func(*args, **kwargs)
+    return wrapped
+
+
+def on_replica():
+    """
+    Returns True if queries are currently sent to a replica.
+    """
+    return 'replica_bind_key' in g
+
+
+@contextlib.contextmanager
+def primary_database():
+    """
+    Sends queries in the block to the primary database, also in a method
+    decorated with :func:`read_replica`.
+    """
+    bind_key = g.pop('replica_bind_key', None)
+    try:
+        yield
+    finally:
+        if bind_key is not None:
+            g.replica_bind_key = bind_key
+
+
+def pin_to_primary():
+    """
+    Makes the current client read from the primary database for
+    ``READ_YOUR_WRITES_SECONDS``, so it sees its changes even if replicas lag
+    behind.
+    """
+    seconds = current_app.config['READ_YOUR_WRITES_SECONDS']
+    if not current_app.config['REPLICA_DATABASE_URIS'] or not seconds:
+        return
+
+    @after_this_request
+    def set_cookie(response):
+        response.set_cookie(
+            PRIMARY_COOKIE_NAME, '1', max_age=seconds, httponly=True,
+            secure=request.is_secure, samesite='Lax')
+        return response
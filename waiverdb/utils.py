@@ -1,44 +1,179 @@
 # SPDX-License-Identifier: GPL-2.0+
 
+import base64
+import binascii
 import functools
+import hashlib
+import json
+import math
+from datetime import datetime
 
-from flask import request, url_for, jsonify, current_app, Flask
-from flask_restx import marshal
+from flask import request, url_for, jsonify, current_app, Flask, Response
 from flask_pydantic.exceptions import ValidationError
-from waiverdb.fields import waiver_fields
+from sqlalchemy.sql.expression import and_, or_
+from waiverdb.fields import serialize_waivers, waiver_fields
+from waiverdb.limits import check_estimated_rows
+from waiverdb.models import Waiver, WaiversVersion, db
 from werkzeug.exceptions import BadRequest, NotFound, HTTPException
+from werkzeug.http import quote_etag
 
 VALIDATION_KEYS = frozenset({
     "input", "loc", "msg", "type", "url"
 })
 
+# Maximum number of waivers on a page of cursor (keyset) pagination
+MAX_PER_PAGE = 100
 
-def json_collection(query, page=1, limit=10):
+
+def query_fingerprint(query):
+    """
+    Returns a string identifying the SQL and parameters of ``query``.
+    """
+    compiled = query.statement.compile(dialect=query.session.get_bind().dialect)
+    params = sorted((key, repr(value)) for key, value in compiled.params.items())
+    data = json.dumps([str(compiled), params])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def count_query(query, count='exact'):
+    """
+    Returns number of rows matching ``query``.
+
+    With ``count='estimate'`` the result can come from a short-lived cache
+    shared by requests with an identical query. With ``count='none'`` no
+    query is executed and ``None`` is returned.
+
+    Counting is refused if it is expected to read more rows than
+    ``QUERY_MAX_ESTIMATED_ROWS`` (see :func:`waiverdb.limits.check_estimated_rows`).
+    """
+    if count == 'none':
+        return None
+
+    query = query.order_by(None)
+    hint = 'Use count=none, cursor pagination or more specific filters.'
+    if count == 'estimate':
+        cache = current_app.count_cache
+        key = query_fingerprint(query)
+        total = cache.get(key)
+        if total is None:
+            check_estimated_rows(query, hint)
+            total = query.count()
+            cache.set(key, total)
+        return total
+
+    check_estimated_rows(query, hint)
+    return query.count()
+
+
+def json_collection(query, page=1, limit=10, count='exact', fields=waiver_fields):
     """
     Helper function for Flask request handlers which want to return
     a collection of resources as JSON.
+
+    The ``count`` argument is passed to :func:`count_query` to determine the
+    ``last`` page link, which is null if the count is skipped. Items are
+    marshalled with given ``fields``.
     """
-    try:
-        p = query.paginate(page=page, per_page=limit)
-    except NotFound:
-        return {'data': [], 'prev': None, 'next': None, 'first': None, 'last': None}
-    pages = {'data': marshal(p.items, waiver_fields)}
+    empty = {'data': [], 'prev': None, 'next': None, 'first': None, 'last': None}
+    if page < 1 or limit < 1:
+        return empty
+
+    # Fetch one extra row to find out whether there is a next page
+    items = query.limit(limit + 1).offset((page - 1) * limit).all()
+    if not items and page != 1:
+        return empty
+    has_next = len(items) > limit
+    items = items[:limit]
+
+    pages = {'data': serialize_waivers(items, fields)}
     query_pairs = request.args.copy()
     if query_pairs:
         # remove the page number
         query_pairs.pop('page', default=None)
-    if p.has_prev:
-        pages['prev'] = url_for(request.endpoint, page=p.prev_num, _external=True,
+    if page > 1:
+        pages['prev'] = url_for(request.endpoint, page=page - 1, _external=True,
                                 **query_pairs)
     else:
         pages['prev'] = None
-    if p.has_next:
-        pages['next'] = url_for(request.endpoint, page=p.next_num, _external=True,
+    if has_next:
+        pages['next'] = url_for(request.endpoint, page=page + 1, _external=True,
                                 **query_pairs)
     else:
         pages['next'] = None
     pages['first'] = url_for(request.endpoint, page=1, _external=True, **query_pairs)
-    pages['last'] = url_for(request.endpoint, page=p.pages, _external=True, **query_pairs)
+
+    if has_next:
+        total = count_query(query, count)
+    else:
+        # This is the last page, no need to ask the database
+        total = (page - 1) * limit + len(items)
+    if total is None:
+        pages['last'] = None
+    else:
+        last_page = math.ceil(total / limit)
+        pages['last'] = url_for(request.endpoint, page=last_page, _external=True,
+                                **query_pairs)
+    return pages
+
+
+def encode_cursor(waiver):
+    """
+    Returns an opaque pagination cursor pointing right after the given waiver.
+    """
+    key = json.dumps([waiver.timestamp.isoformat(), waiver.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of :func:`encode_cursor`.
+
+    Returns a tuple (timestamp, id) of the last waiver on the previous page.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, waiver_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(waiver_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise BadRequest({'cursor': 'Invalid pagination cursor'})
+
+
+def json_cursor_collection(query, cursor='', limit=10, fields=waiver_fields):
+    """
+    Like :func:`json_collection` but uses keyset pagination on (timestamp, id).
+
+    Pages are selected with a WHERE clause instead of OFFSET and the total
+    count is never computed, so every page costs the same regardless of how
+    deep into the collection it is. An empty ``cursor`` starts from the
+    newest waiver.
+    """
+    query_pairs = request.args.copy()
+    query_pairs.pop('page', default=None)
+    query_pairs.pop('cursor', default=None)
+    pages = {
+        'data': [],
+        'first': url_for(request.endpoint, cursor='', _external=True, **query_pairs),
+        'next': None,
+    }
+    if limit < 1:
+        return pages
+
+    query = query.order_by(None).order_by(Waiver.timestamp.desc(), Waiver.id.desc())
+    if cursor:
+        timestamp, waiver_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Waiver.timestamp < timestamp,
+            and_(Waiver.timestamp == timestamp, Waiver.id < waiver_id),
+        ))
+
+    limit = min(limit, MAX_PER_PAGE)
+    # Fetch one extra row to find out whether there is a next page
+    items = query.limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        pages['next'] = url_for(request.endpoint, cursor=encode_cursor(items[-1]),
+                                _external=True, **query_pairs)
+    pages['data'] = serialize_waivers(items, fields)
     return pages
 
 
@@ -102,6 +237,75 @@ def jsonp(func):
     return wrapped
 
 
+# See waivers_version()
+WAIVERS_VERSION = WaiversVersion.version_statement()
+
+
+def waivers_version():
+    """
+    Returns a token which changes whenever a waiver is created.
+
+    Waivers are never modified or deleted, but they can be committed after a
+    waiver with a greater ID, so the most recent waiver ID is combined with
+    counters incremented by each transaction creating waivers (see
+    :class:`waiverdb.models.WaiversVersion`). This only reads the end of the
+    primary key index and a few counter rows.
+
+    This runs before every cacheable response, so the statement is built only
+    once.
+    """
+    return db.session.execute(WAIVERS_VERSION).scalar()
+
+
+def compute_etag(version, method, full_path, body, accept, accept_encoding):
+    """
+    Returns the ETag of a response to the request with given method, path
+    (including the query string), body and headers, for the given value of
+    the ``version`` function passed to :func:`etag`.
+    """
+    data = json.dumps([version, method, full_path, body, accept, accept_encoding])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def etag(version=None):
+    """
+    Adds a strong ETag to successful responses and answers requests with a
+    matching If-None-Match header with 304 Not Modified, without calling the
+    wrapped function.
+
+    The ETag is computed from the request (method, path, query string, body
+    and headers selecting the representation) and the value returned by the
+    optional ``version`` function, which must change whenever the response
+    could change.
+
+    This must be applied on top of :func:`jsonp`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            tag = compute_etag(
+                version() if version else None,
+                request.method,
+                request.full_path,
+                request.get_data(as_text=True),
+                request.headers.get('Accept'),
+                request.headers.get('Accept-Encoding'),
+            )
+            if request.if_none_match.contains(tag):
+                response = Response(status=304)
+                response.set_etag(tag)
+                return response
+
+            rv = func(*args, **kwargs)
+            if isinstance(rv, Response):
+                if rv.status_code == 200:
+                    rv.set_etag(tag)
+                return rv
+            return rv, 200, {'ETag': quote_etag(tag)}
+        return wrapped
+    return decorator
+
+
 def auth_methods(app: Flask) -> list[str]:
     methods = app.config.get('AUTH_METHODS')
     if methods: